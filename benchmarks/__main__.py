@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+from benchmarks.harness import BenchmarkResult, compare, load_results, save_results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Run load tests against every router and micro-benchmarks of the building blocks.",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=1000, help="Requests per load scenario"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="Requests in flight at a time"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=10_000, help="Calls per micro-benchmark"
+    )
+    parser.add_argument(
+        "--search-rows",
+        type=int,
+        default=1_000_000,
+        help="Comments in the database of the search benchmarks",
+    )
+    parser.add_argument(
+        "--search-iterations",
+        type=int,
+        default=20,
+        help="Searches per search benchmark",
+    )
+    parser.add_argument(
+        "--only", help="Only run benchmarks whose name contains this string"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("benchmarks/results.json"),
+        help="Where to save the results",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=Path("benchmarks/baseline.json"),
+        help="Results to compare against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fail if a benchmark is this much worse than the baseline",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results as the new baseline",
+    )
+
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace) -> List[BenchmarkResult]:
+    # The app reads its settings on first use, so these have to be set before it is imported.
+    workdir = tempfile.mkdtemp(prefix="playground-benchmark-")
+    os.environ.setdefault("DATABASE_URL", os.path.join(workdir, "benchmark.db"))
+    os.environ.setdefault("AUDIT_BACKEND", "jsonl")
+    os.environ.setdefault("AUDIT_PATH", os.path.join(workdir, "audit.jsonl"))
+    # All load comes from a single client, which the rate limiter would turn away. `admission/*` benchmarks the limits on their own.
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from benchmarks.scenarios import (
+        run_admission_benchmarks,
+        run_auth_benchmarks,
+        run_micro_benchmarks,
+        run_middleware_benchmarks,
+        run_router_benchmarks,
+        run_search_benchmarks,
+    )
+    from playground.main import app
+
+    results = run_micro_benchmarks(args.iterations, args.only)
+    results += run_auth_benchmarks(args.iterations, args.only)
+    results += run_search_benchmarks(
+        args.search_rows, args.search_iterations, args.only
+    )
+    results += await run_middleware_benchmarks(
+        args.requests, args.concurrency, args.only
+    )
+    results += await run_admission_benchmarks(
+        args.requests, args.concurrency, args.only
+    )
+    results += await run_router_benchmarks(
+        app, args.requests, args.concurrency, args.only
+    )
+
+    return results
+
+
+def main() -> int:
+    args = parse_args()
+    results = asyncio.run(run(args))
+
+    print(
+        f"{'benchmark':<40} {'ops/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mem/op':>10} {'errors':>6}"
+    )
+
+    for result in results:
+        print(
+            f"{result.name:<40} {result.operations_per_second:>10.1f} {result.p50:>8.3f} {result.p95:>8.3f} {result.p99:>8.3f} "
+            f"{result.memory_per_operation or 0:>10.0f} {result.errors:>6}"
+        )
+
+    save_results(results, args.output)
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        return 0
+
+    if not args.baseline.exists():
+        return 0
+
+    regressions = compare(results, load_results(args.baseline), args.threshold)
+
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.name} {regression.metric}: {regression.baseline:.3f} -> {regression.current:.3f} ({regression.change:+.0%})",
+            file=sys.stderr,
+        )
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
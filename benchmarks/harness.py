@@ -0,0 +1,262 @@
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel
+from starlette.types import ASGIApp
+
+
+class BenchmarkResult(BaseModel):
+    """
+    The outcome of a single benchmark. Latencies are in milliseconds, memory in bytes.
+
+    For load benchmarks an operation is a request, for micro-benchmarks it is a single call.
+    """
+
+    name: str
+    operations: int
+    operations_per_second: float
+    p50: float
+    p95: float
+    p99: float
+    errors: int = 0
+    memory_per_operation: Optional[float] = None
+
+
+class Regression(BaseModel):
+    name: str
+    metric: str
+    baseline: float
+    current: float
+    change: float
+
+
+def percentile(sorted_values: List[float], quantile: float) -> float:
+    """
+    Get the nearest-rank percentile of values that are already sorted.
+    """
+    if not sorted_values:
+        return 0.0
+
+    index = min(
+        len(sorted_values) - 1, max(0, round(quantile * len(sorted_values)) - 1)
+    )
+
+    return sorted_values[index]
+
+
+def create_result(
+    name: str,
+    durations: List[int],
+    elapsed: float,
+    errors: int = 0,
+    memory_per_operation: Optional[float] = None,
+) -> BenchmarkResult:
+    """
+    Summarize a list of durations, in nanoseconds, that took `elapsed` seconds of wall clock time in total.
+    """
+    durations_ms = sorted(duration / 1e6 for duration in durations)
+
+    return BenchmarkResult(
+        name=name,
+        operations=len(durations),
+        operations_per_second=len(durations) / elapsed if elapsed else 0.0,
+        p50=percentile(durations_ms, 0.5),
+        p95=percentile(durations_ms, 0.95),
+        p99=percentile(durations_ms, 0.99),
+        errors=errors,
+        memory_per_operation=memory_per_operation,
+    )
+
+
+def measure_memory(operation: Callable[[], Any], iterations: int) -> float:
+    """
+    Run `operation` with tracemalloc enabled and get the average peak memory it allocated per run.
+
+    Tracing slows everything down a lot, so this runs separately from the timed iterations.
+    """
+    tracemalloc.start()
+    peaks = []
+
+    try:
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return statistics.mean(peaks) if peaks else 0.0
+
+
+async def measure_memory_async(operation: Callable[[], Any], iterations: int) -> float:
+    """
+    The async version of `measure_memory`. `operation` returns an awaitable.
+    """
+    tracemalloc.start()
+    peaks = []
+
+    try:
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            await operation()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return statistics.mean(peaks) if peaks else 0.0
+
+
+async def run_load(
+    name: str,
+    app: ASGIApp,
+    method: str,
+    url: str,
+    requests: int = 1000,
+    concurrency: int = 10,
+    memory_iterations: int = 20,
+    **kwargs,
+) -> BenchmarkResult:
+    """
+    Send `requests` requests to `app` in-process, with `concurrency` requests in flight at a time.
+
+    The requests go through httpx's ASGI transport, so they run the whole middleware stack but skip the network and the server.
+    Any response with a 5xx status, or a request that raises, counts as an error.
+
+    :param kwargs: Passed on to `httpx.AsyncClient.request`, e.g. `params`, `json` or `headers`.
+    """
+    durations: List[int] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+
+        async def send():
+            nonlocal errors
+            started = time.perf_counter_ns()
+
+            try:
+                response = await client.request(method, url, **kwargs)
+
+                if response.status_code >= 500:
+                    errors += 1
+            except Exception:
+                errors += 1
+
+            durations.append(time.perf_counter_ns() - started)
+
+        async def worker():
+            for _ in remaining:
+                await send()
+
+        # Warm up caches and pools, so the first requests do not skew the percentiles.
+        for _ in range(min(10, requests)):
+            await client.request(method, url, **kwargs)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        memory = await measure_memory_async(
+            lambda: client.request(method, url, **kwargs), memory_iterations
+        )
+
+    return create_result(name, durations, elapsed, errors, memory)
+
+
+def run_micro(
+    name: str,
+    operation: Callable[[], Any],
+    iterations: int = 10_000,
+    memory_iterations: int = 100,
+) -> BenchmarkResult:
+    """
+    Call `operation` `iterations` times and time every call.
+    """
+    for _ in range(min(100, iterations)):
+        operation()
+
+    durations = []
+    started = time.perf_counter()
+
+    for _ in range(iterations):
+        call_started = time.perf_counter_ns()
+        operation()
+        durations.append(time.perf_counter_ns() - call_started)
+
+    elapsed = time.perf_counter() - started
+    memory = measure_memory(operation, memory_iterations)
+
+    return create_result(name, durations, elapsed, memory_per_operation=memory)
+
+
+def save_results(results: List[BenchmarkResult], path: Path):
+    path.write_text(
+        json.dumps([result.dict() for result in results], indent=2) + "\n",
+        encoding="utf-8",
+    )
+
+
+def load_results(path: Path) -> Dict[str, BenchmarkResult]:
+    return {
+        result["name"]: BenchmarkResult(**result)
+        for result in json.loads(path.read_text(encoding="utf-8"))
+    }
+
+
+def compare(
+    results: List[BenchmarkResult],
+    baseline: Dict[str, BenchmarkResult],
+    threshold: float = 0.2,
+) -> List[Regression]:
+    """
+    Find the benchmarks that got worse than `threshold` compared to the baseline, e.g. 0.2 for 20%.
+
+    Throughput regresses when it goes down, p99 latency when it goes up. Benchmarks that are not in the baseline are skipped.
+    """
+    regressions = []
+
+    for result in results:
+        previous = baseline.get(result.name)
+
+        if previous is None:
+            continue
+
+        if previous.operations_per_second:
+            change = 1 - result.operations_per_second / previous.operations_per_second
+
+            if change > threshold:
+                regressions.append(
+                    Regression(
+                        name=result.name,
+                        metric="operations_per_second",
+                        baseline=previous.operations_per_second,
+                        current=result.operations_per_second,
+                        change=change,
+                    )
+                )
+
+        if previous.p99:
+            change = result.p99 / previous.p99 - 1
+
+            if change > threshold:
+                regressions.append(
+                    Regression(
+                        name=result.name,
+                        metric="p99",
+                        baseline=previous.p99,
+                        current=result.p99,
+                        change=change,
+                    )
+                )
+
+    return regressions
@@ -0,0 +1,555 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Type
+
+import httpx
+import msgpack
+import respx
+import rsa
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from jose import jwk, jwt
+from msgpack_asgi import MessagePackMiddleware
+from sqlalchemy import create_engine, insert
+from sqlmodel import Session, SQLModel, select
+from starlette.responses import Response
+from starlette.types import ASGIApp
+
+from benchmarks.harness import BenchmarkResult, create_result, run_load, run_micro
+from playground.middleware.admission import AdmissionMiddleware
+from playground.middleware.compression import CompressionMiddleware
+from playground.middleware.metrics import MetricsMiddleware, ResponseSizeMiddleware
+from playground.providers.admission import ConcurrencyLimiter, RateLimiter
+from playground.providers.datasets import get_example_dataset
+from playground.providers.negotiation import NegotiatedResponse
+from playground.providers.token_verifier import TokenVerifier
+from playground.routers.paginator import (
+    PaginatedResult,
+    get_example_list,
+    with_paginator,
+)
+from playground.routers.time_range import (
+    TimeRangedModel,
+    with_keyset_paginator,
+    with_search,
+    with_timerange,
+)
+
+
+@dataclass
+class LoadScenario:
+    """
+    A single endpoint to put under load. `kwargs` are passed on to `httpx.AsyncClient.request`.
+    """
+
+    name: str
+    method: str
+    url: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+LOAD_SCENARIOS = [
+    LoadScenario("pagination/unpaginated", "GET", "/pagination/unpaginated"),
+    LoadScenario(
+        "pagination/paginated", "GET", "/pagination/paginated", {"params": {"page": 3}}
+    ),
+    LoadScenario(
+        "pagination/generated", "GET", "/pagination/generated", {"params": {"page": 3}}
+    ),
+    LoadScenario(
+        "pagination/dataset",
+        "GET",
+        "/pagination/dataset",
+        {"params": {"page": 500, "page_size": 1000, "sort": "value"}},
+    ),
+    LoadScenario("timeranged/list", "GET", "/timeranged/"),
+    LoadScenario(
+        "timeranged/filtered",
+        "GET",
+        "/timeranged/",
+        {"params": {"time_from": str(datetime(2020, 1, 1)), "page_size": 10}},
+    ),
+    LoadScenario("timeranged/keyset", "GET", "/timeranged/keyset"),
+    LoadScenario("timeranged/paginated", "GET", "/timeranged/paginated"),
+    LoadScenario(
+        "timeranged/histogram",
+        "GET",
+        "/timeranged/histogram",
+        {"params": {"bucket": "minute"}},
+    ),
+    LoadScenario("auditing/manual", "GET", "/auditing/manual"),
+    LoadScenario("auditing/automatic", "GET", "/auditing/automatic"),
+    LoadScenario("health/ping", "GET", "/health/ping"),
+    LoadScenario("health/health", "GET", "/health/health"),
+    LoadScenario("http-audited/success", "GET", "/http-audited/success"),
+    LoadScenario(
+        "auth-passthrough/async",
+        "GET",
+        "/auth-passthrough/async",
+        {"headers": {"Authorization": "Bearer benchmark"}},
+    ),
+    LoadScenario(
+        "auth-passthrough/sync",
+        "GET",
+        "/auth-passthrough/sync",
+        {"headers": {"Authorization": "Bearer benchmark"}},
+    ),
+    # Writes go last, so they do not change what the reads above return.
+    LoadScenario(
+        "timeranged/bulk",
+        "POST",
+        "/timeranged/bulk",
+        {"json": [{"comment": f"Bulk comment {i}"} for i in range(10)]},
+    ),
+]
+
+
+def stub_upstreams() -> respx.MockRouter:
+    """
+    Answer all outbound HTTP requests locally, so the HTTP routers can be benchmarked without the network.
+    """
+    router = respx.mock(assert_all_called=False)
+    router.get("https://google.com").mock(return_value=httpx.Response(200, text="OK"))
+    router.get("https://ifconfig.me/ip").mock(
+        return_value=httpx.Response(200, text="127.0.0.1")
+    )
+
+    return router
+
+
+async def seed_comments(app: ASGIApp, amount: int = 200):
+    """
+    Fill the `TimeRangedModel` table through the bulk endpoint, so the timeranged endpoints have something to page through.
+
+    `TimeRangedModel` only allows ids up to 256, so the reads must not see many more rows than that.
+    """
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+        response = await client.post(
+            "/timeranged/bulk",
+            json=[{"comment": f"Benchmark comment {i}"} for i in range(amount)],
+        )
+        response.raise_for_status()
+
+
+async def run_router_benchmarks(
+    app: FastAPI,
+    requests: int,
+    concurrency: int,
+    only: Optional[str] = None,
+) -> List[BenchmarkResult]:
+    """
+    Start `app`, seed the database and put every `LoadScenario` under load. Upstream requests are stubbed.
+
+    :param only: Only run scenarios whose name contains this string.
+    """
+    results = []
+
+    await app.router.startup()
+
+    try:
+        await seed_comments(app)
+
+        with stub_upstreams():
+            for scenario in LOAD_SCENARIOS:
+                if only and only not in scenario.name:
+                    continue
+
+                results.append(
+                    await run_load(
+                        f"load/{scenario.name}",
+                        app,
+                        scenario.method,
+                        scenario.url,
+                        requests=requests,
+                        concurrency=concurrency,
+                        **scenario.kwargs,
+                    )
+                )
+    finally:
+        await app.router.shutdown()
+
+    return results
+
+
+def create_middleware_app(
+    middleware: List[str], response_class: Type[Response] = NegotiatedResponse
+) -> FastAPI:
+    """
+    Create a bare app with the named middleware, innermost first, and a copy of `/pagination/unpaginated` without the response cache.
+    """
+    app = FastAPI(default_response_class=response_class)
+    available = {
+        "size": (ResponseSizeMiddleware, {}),
+        "compression": (CompressionMiddleware, {"minimum_size": 1000}),
+        "msgpack": (MessagePackMiddleware, {}),
+        "metrics": (MetricsMiddleware, {}),
+    }
+
+    for name in middleware:
+        middleware_class, options = available[name]
+        app.add_middleware(middleware_class, **options)
+
+    @app.get("/", response_model=List[int])
+    async def get_unpaginated():
+        return get_example_list()
+
+    return app
+
+
+MIDDLEWARE_STACKS = {
+    "none": [],
+    "metrics": ["metrics"],
+    "compression": ["compression"],
+    "full": ["size", "compression", "metrics"],
+}
+
+# The 1000 numbers of `/pagination/unpaginated` as msgpack: encoded to JSON and converted by `MessagePackMiddleware`, or encoded once.
+NEGOTIATION_APPS = {
+    "middleware/msgpack": (["msgpack"], ORJSONResponse, "application/x-msgpack"),
+    "negotiated/msgpack": ([], NegotiatedResponse, "application/x-msgpack"),
+    "negotiated/json": ([], NegotiatedResponse, "application/json"),
+}
+
+
+async def run_middleware_benchmarks(
+    requests: int, concurrency: int, only: Optional[str] = None
+) -> List[BenchmarkResult]:
+    """
+    Measure what every middleware costs, by putting the same endpoint under load with different middleware stacks.
+
+    It also compares encoding msgpack responses with `MessagePackMiddleware` to encoding them with `NegotiatedResponse`.
+    """
+    apps = {
+        f"middleware/{name}": (
+            create_middleware_app(middleware),
+            {"Accept-Encoding": "gzip"},
+        )
+        for name, middleware in MIDDLEWARE_STACKS.items()
+    }
+
+    for name, (middleware, response_class, accept) in NEGOTIATION_APPS.items():
+        apps[f"negotiation/{name}"] = (
+            create_middleware_app(middleware, response_class),
+            {"Accept": accept},
+        )
+
+    results = []
+
+    for name, (app, headers) in apps.items():
+        if only and only not in name:
+            continue
+
+        results.append(
+            await run_load(
+                name,
+                app,
+                "GET",
+                "/",
+                requests=requests,
+                concurrency=concurrency,
+                headers=headers,
+            )
+        )
+
+    return results
+
+
+def create_admission_app(protected: bool) -> FastAPI:
+    """
+    Create a bare app with an endpoint that keeps the event loop busy for a moment, like encoding a large page does. With `protected`,
+    it has an `AdmissionMiddleware` that allows every client 50 requests per second and runs 4 requests at a time.
+    """
+    app = FastAPI()
+
+    if protected:
+        app.add_middleware(
+            AdmissionMiddleware,
+            rate_limiter=RateLimiter(50, 50, max_clients=1000),
+            concurrency_limiter=ConcurrencyLimiter(4, queue_size=16, queue_timeout=0.1),
+            costs={},
+        )
+
+    @app.get("/")
+    async def get_busy():
+        sum(range(50_000))
+        return "OK"
+
+    return app
+
+
+async def run_admission_benchmarks(
+    requests: int, concurrency: int, only: Optional[str] = None
+) -> List[BenchmarkResult]:
+    """
+    Measure the latency of a well-behaved client while a noisy client floods the app, with and without the `AdmissionMiddleware`.
+
+    The noisy client keeps `concurrency * 5` requests in flight. The well-behaved one sends `requests / 20` requests, 20 per second, well
+    within its rate limit. Its latency counts from when each request was due, and its errors are the requests that did not get a 200.
+    """
+    results = []
+
+    for variant in ("unprotected", "protected"):
+        name = f"admission/{variant}/well-behaved"
+
+        if only and only not in name:
+            continue
+
+        app = create_admission_app(variant == "protected")
+        stopped = asyncio.Event()
+
+        def create_client(ip: str) -> httpx.AsyncClient:
+            transport = httpx.ASGITransport(app=app, client=(ip, 1234))
+            return httpx.AsyncClient(transport=transport, base_url="http://benchmark")
+
+        async with create_client("10.0.0.1") as noisy, create_client(
+            "10.0.0.2"
+        ) as polite:
+
+            async def flood():
+                while not stopped.is_set():
+                    await noisy.get("/")
+                    # A rejection may not suspend at all, without the network in between.
+                    await asyncio.sleep(0)
+
+            flooders = [asyncio.create_task(flood()) for _ in range(concurrency * 5)]
+            durations: List[int] = []
+            errors = 0
+            started = time.perf_counter()
+
+            try:
+                for i in range(max(requests // 20, 1)):
+                    # Latency counts from when the request was due, so time spent waiting for the busy event loop counts as well.
+                    due = started + i * 0.05
+                    await asyncio.sleep(max(due - time.perf_counter(), 0))
+                    response = await polite.get("/")
+                    durations.append(int((time.perf_counter() - due) * 1e9))
+                    errors += response.status_code != 200
+            finally:
+                stopped.set()
+                await asyncio.gather(*flooders)
+
+            results.append(
+                create_result(name, durations, time.perf_counter() - started, errors)
+            )
+
+    return results
+
+
+def run_micro_benchmarks(
+    iterations: int, only: Optional[str] = None
+) -> List[BenchmarkResult]:
+    """
+    Benchmark the pagination and filter dependencies and the response encoding on their own, without any HTTP in between.
+
+    It also compares serving a page of a `ColumnarDataset` to validating a page of a plain list, both with 1000 rows.
+    """
+    numbers = list(range(100_000))
+    unpaginated = get_example_list()
+    dataset = get_example_dataset()
+    rows = list(range(dataset.total))
+    time_from = datetime(2020, 1, 1)
+    time_to = datetime(2021, 1, 1)
+
+    def paginate_list():
+        with_paginator(page=50, page_size=100)(numbers)
+
+    def paginate_generator():
+        with_paginator(page=50, page_size=100)(number for number in numbers)
+
+    def build_timerange_query():
+        query = with_timerange(time_from, time_to)(
+            TimeRangedModel.date_created, select(TimeRangedModel)
+        )
+        str(query.compile())
+
+    def encode_msgpack_through_middleware():
+        # What `MessagePackMiddleware` does with an `ORJSONResponse`: encode JSON, parse it again and encode that as msgpack.
+        msgpack.packb(json.loads(ORJSONResponse(unpaginated).body))
+
+    def encode_msgpack_negotiated():
+        response = NegotiatedResponse(unpaginated)
+        response.negotiate("application/x-msgpack")
+
+    def encode_dataset_page():
+        response = NegotiatedResponse(dataset.page(500, 1000, "value"))
+        response.negotiate("application/json")
+
+    def encode_validated_page():
+        # What `/pagination/paginated` does with a list: slice it, validate the page and encode it.
+        page = with_paginator(page=500, page_size=1000)(rows)
+        response = NegotiatedResponse(PaginatedResult[int](**page.dict()).dict())
+        response.negotiate("application/json")
+
+    operations = {
+        "micro/with_paginator/list": paginate_list,
+        "micro/with_paginator/generator": paginate_generator,
+        "micro/with_timerange/query": build_timerange_query,
+        "micro/encode/middleware/msgpack": encode_msgpack_through_middleware,
+        "micro/encode/negotiated/msgpack": encode_msgpack_negotiated,
+        "micro/page/columnar": encode_dataset_page,
+        "micro/page/validated": encode_validated_page,
+    }
+
+    return [
+        run_micro(name, operation, iterations)
+        for name, operation in operations.items()
+        if not only or only in name
+    ]
+
+
+# Comments for the search benchmarks are made of these words. `needle` only shows up in one comment in every 10.000.
+SEARCH_WORDS = [f"word{i:04d}" for i in range(5000)]
+
+
+def create_search_database(path: str, rows: int):
+    """
+    Create a `TimeRangedModel` table of `rows` comments of 10 random words at `path`, with its search index.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    generator = random.Random(0)
+
+    with engine.begin() as connection:
+        for start in range(0, rows, 100_000):
+            connection.execute(
+                insert(TimeRangedModel.__table__),
+                [
+                    {
+                        "comment": " ".join(generator.choices(SEARCH_WORDS, k=10))
+                        + (" needle" if i % 10_000 == 0 else ""),
+                        "date_created": datetime(2020, 1, 1),
+                    }
+                    for i in range(start, min(start + 100_000, rows))
+                ],
+            )
+
+    return engine
+
+
+def run_search_benchmarks(
+    rows: int, iterations: int, only: Optional[str] = None
+) -> List[BenchmarkResult]:
+    """
+    Compare the full-text search of `/timeranged/search` to a `LIKE '%term%'` scan, on a table of `rows` comments.
+
+    Both fetch a page of 100 comments, for a term in about 0.2% of the comments and for a term in 0.01%. The search has to rank every match
+    with bm25 before it can return the best ones, while the scan stops at the first 100 matches it finds. The rarer the term, the more of
+    the table the scan reads.
+    """
+    terms = {"common": "word0042", "rare": "needle"}
+    operations = {
+        f"search/{kind}/{name}": term
+        for name, term in terms.items()
+        for kind in ("fts", "like")
+    }
+
+    if only:
+        operations = {name: term for name, term in operations.items() if only in name}
+
+    if not operations:
+        return []
+
+    path = os.path.join(tempfile.mkdtemp(prefix="playground-search-"), "search.db")
+    engine = create_search_database(path, rows)
+    apply_timerange = with_timerange(None, None)
+
+    def search(term: str):
+        search = with_search(term, 12)
+        paginator = with_keyset_paginator(None, 100)
+        query = select(TimeRangedModel, search.rank, search.snippet)
+        query = search.apply(query)
+        query = apply_timerange(TimeRangedModel.date_created, query)
+        query = paginator.apply((search.rank, TimeRangedModel.id), query)
+
+        with Session(engine) as session:
+            session.execute(query).all()
+
+    def scan(term: str):
+        query = (
+            select(TimeRangedModel)
+            .where(TimeRangedModel.comment.like(f"%{term}%"))
+            .order_by(TimeRangedModel.id)
+            .limit(101)
+        )
+
+        with Session(engine) as session:
+            session.exec(query).all()
+
+    results = []
+
+    try:
+        for name, term in operations.items():
+            operation = search if name.startswith("search/fts") else scan
+            results.append(
+                run_micro(
+                    name,
+                    lambda: operation(term),
+                    iterations,
+                    memory_iterations=min(iterations, 5),
+                )
+            )
+    finally:
+        engine.dispose()
+
+    return results
+
+
+def create_signing_keys() -> Dict[str, Any]:
+    """
+    Create a key per algorithm of the auth benchmarks: the private key to sign tokens with, and the public JWK to verify them with.
+    """
+    secret = {"kty": "oct", "k": "YmVuY2htYXJrLXRva2VuLXZlcmlmaWVyLWtleQ"}
+    _, private = rsa.newkeys(2048)
+    rsa_key = jwk.construct(private.save_pkcs1(), "RS256")
+
+    return {
+        "HS256": (secret, secret),
+        "RS256": (rsa_key.to_dict(), rsa_key.public_key().to_dict()),
+    }
+
+
+def run_auth_benchmarks(
+    iterations: int, only: Optional[str] = None
+) -> List[BenchmarkResult]:
+    """
+    Compare verifying a bearer token on every request to answering it from the cache of verified claims, for an HMAC and an RSA key.
+
+    The cold benchmarks verify the signature and claims every time, like the first request of a token. The warm ones only hash the token
+    and look it up.
+    """
+    operations = [
+        (f"auth/{algorithm.lower()}/{cache}", algorithm, cache)
+        for algorithm in ("HS256", "RS256")
+        for cache in ("cold", "warm")
+        if not only or only in f"auth/{algorithm.lower()}/{cache}"
+    ]
+
+    if not operations:
+        return []
+
+    keys = create_signing_keys()
+    results = []
+
+    for name, algorithm, cache in operations:
+        private, public = keys[algorithm]
+        verifier = TokenVerifier(
+            {"keys": [{**public, "kid": "benchmark", "alg": algorithm}]},
+            [algorithm],
+            cache_size=10_000 if cache == "warm" else 0,
+        )
+        token = jwt.encode(
+            {"sub": "benchmark", "exp": int(time.time()) + 3600},
+            private,
+            algorithm=algorithm,
+            headers={"kid": "benchmark"},
+        )
+
+        results.append(run_micro(name, lambda: verifier.verify(token), iterations))
+
+    return results
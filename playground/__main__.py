@@ -0,0 +1,54 @@
+import argparse
+
+from uvicorn import Config
+
+from playground.providers.settings import get_settings
+from playground.supervisor import Supervisor
+
+
+def parse_args() -> argparse.Namespace:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(
+        prog="python -m playground",
+        description="Serve the app with several worker processes that share a socket, caches, counters and metrics.",
+    )
+    parser.add_argument(
+        "--app", default="playground.main:app", help="The ASGI app to serve"
+    )
+    parser.add_argument("--host", default=settings.host, help="Address to bind to")
+    parser.add_argument(
+        "--port", type=int, default=settings.port, help="Port to bind to"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.workers,
+        help="Worker processes to run. Defaults to the amount of cores",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=settings.worker_graceful_timeout,
+        help="Seconds a stopped worker gets to finish its requests",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    settings = get_settings()
+    config = Config(args.app, host=args.host, port=args.port, workers=args.workers)
+
+    Supervisor(
+        config,
+        workers=args.workers,
+        startup_timeout=settings.worker_startup_timeout,
+        graceful_timeout=args.graceful_timeout,
+        store_path=settings.shared_store_path,
+        store_max_size=settings.shared_store_max_size,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
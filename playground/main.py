@@ -1,12 +1,37 @@
-import time
-
 from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
-from msgpack_asgi import MessagePackMiddleware
-from starlette.middleware.gzip import GZipMiddleware
-from starlette.requests import Request
-from starlette.responses import RedirectResponse
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.responses import RedirectResponse, PlainTextResponse
 
+from playground.middleware.admission import AdmissionMiddleware
+from playground.middleware.compression import CompressionMiddleware
+from playground.middleware.metrics import MetricsMiddleware, ResponseSizeMiddleware
+from playground.providers.admission import get_concurrency_limiter, get_rate_limiter
+from playground.providers.audit_sink import get_audit_sink
+from playground.providers.datasets import get_example_dataset
+from playground.providers.database_lifespan import start_database, stop_database
+from playground.providers.executors import (
+    ExecutorSaturatedError,
+    executor_saturated_exception_handler,
+    get_executors,
+)
+from playground.providers.health_checks import get_health_checks
+from playground.providers.http_clients import get_http_clients
+from playground.providers.metrics import (
+    WorkerMetricsPublisher,
+    get_metrics,
+    instrument_database,
+)
+from playground.providers.negotiation import (
+    NegotiatedResponse,
+    http_exception_handler,
+    request_validation_exception_handler,
+)
+from playground.providers.resilience import (
+    CircuitOpenError,
+    circuit_open_exception_handler,
+)
+from playground.providers.settings import get_settings
 from playground.routers.auditing import auditing_router
 from playground.routers.health import health_router
 
@@ -14,24 +39,189 @@ from playground.routers.health import health_router
 from playground.routers.http_audited import http_audited_router
 from playground.routers.http_authorized import auth_passthrough_router
 from playground.routers.paginator import pagination_router
-from playground.routers.time_range import time_range_router
+from playground.routers.time_range import (
+    get_comment_relay,
+    get_rollup_compactor,
+    time_range_router,
+)
+
+# Responses are encoded straight to JSON, msgpack or CBOR, depending on the `Accept` header. Errors as well.
+app = FastAPI(
+    default_response_class=NegotiatedResponse,
+    exception_handlers={
+        StarletteHTTPException: http_exception_handler,
+        RequestValidationError: request_validation_exception_handler,
+        CircuitOpenError: circuit_open_exception_handler,
+        ExecutorSaturatedError: executor_saturated_exception_handler,
+    },
+)
+
+# The last middleware added is the outermost one. Metrics wrap everything, so they count rejected requests too. Admission comes right
+# after, so rejected requests cost as little as possible. The response size probe sits right above the endpoints.
+app.add_middleware(ResponseSizeMiddleware)
+settings = get_settings()
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    levels=settings.compression_levels,
+    offload_size=settings.compression_offload_size,
+    cache_max_size=settings.compression_cache_max_size,
+    routes=settings.compression_routes,
+)
+app.add_middleware(
+    AdmissionMiddleware,
+    rate_limiter=get_rate_limiter() if settings.rate_limit_enabled else None,
+    concurrency_limiter=get_concurrency_limiter(),
+    costs=settings.rate_limit_costs,
+)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+async def start_database_engines():
+    """
+    Create the database engines and tables, and open the pooled connections before we take any requests.
+    """
+    await start_database()
+
+
+@app.on_event("shutdown")
+async def stop_database_engines():
+    """
+    Close all pooled database connections.
+    """
+    await stop_database()
+
+
+@app.on_event("startup")
+async def start_http_clients():
+    """
+    Open the shared HTTP client pools before we take any requests.
+    """
+    await get_http_clients().start()
+
+
+@app.on_event("shutdown")
+async def stop_http_clients():
+    """
+    Close the shared HTTP client pools and their connections.
+    """
+    await get_http_clients().stop()
+
+
+@app.on_event("startup")
+async def start_audit_sink():
+    """
+    Start writing queued audit records in the background.
+    """
+    get_audit_sink().start()
+
+
+@app.on_event("shutdown")
+async def stop_audit_sink():
+    """
+    Stop the audit sink and flush the records that are still queued.
+    """
+    get_audit_sink().stop()
+
+
+@app.on_event("startup")
+async def start_rate_limiter():
+    """
+    Drop the token buckets of clients that have been quiet for a while, in the background.
+    """
+    get_rate_limiter().start()
+
+
+@app.on_event("shutdown")
+async def stop_rate_limiter():
+    await get_rate_limiter().stop()
+
+
+@app.on_event("startup")
+async def start_metrics():
+    """
+    Start timing database statements, so the metrics can tell database time apart from the rest.
+    """
+    instrument_database()
+
+
+def render_metrics() -> str:
+    return get_metrics().render() + get_executors().render()
+
+
+metrics_publisher = WorkerMetricsPublisher(
+    render_metrics, settings.metrics_publish_interval
+)
+
+
+@app.on_event("startup")
+async def start_metrics_publisher():
+    """
+    Publish the metrics of this worker to the shared store in the background, if there is one.
+    """
+    metrics_publisher.start()
+
+
+@app.on_event("shutdown")
+async def stop_metrics_publisher():
+    await metrics_publisher.stop()
+
+
+@app.on_event("startup")
+async def start_rollup_compactor():
+    """
+    Start folding new comments into the histogram rollups in the background.
+    """
+    get_rollup_compactor().start()
+
+
+@app.on_event("shutdown")
+async def stop_rollup_compactor():
+    await get_rollup_compactor().stop()
+
+
+@app.on_event("startup")
+async def start_comment_relay():
+    """
+    Relay the new comments of other workers to the live subscribers of this one, if there is a shared store.
+    """
+    get_comment_relay().start()
+
+
+@app.on_event("shutdown")
+async def stop_comment_relay():
+    await get_comment_relay().stop()
+
+
+@app.on_event("startup")
+async def build_datasets():
+    """
+    Build the in-memory datasets on a worker thread, so the first request does not pay for it.
+    """
+    await get_executors().run("cpu", get_example_dataset, reject=False)
+
+
+@app.on_event("startup")
+async def start_health_checks():
+    """
+    Run the health checks once, and keep running them in the background. Registered last, so every checked service has started.
+    """
+    await get_health_checks().start()
 
-app = FastAPI(default_response_class=ORJSONResponse)
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
-app.add_middleware(MessagePackMiddleware)
+@app.on_event("shutdown")
+async def stop_health_checks():
+    await get_health_checks().stop()
 
 
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_prometheus_metrics():
     """
-    Measure request execution time and add it to the response as a header.
+    Expose the request and executor metrics in the Prometheus text format. Behind `python -m playground`, those of every worker.
     """
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+    return await metrics_publisher.collect()
 
 
 @app.get("/", include_in_schema=False)
@@ -0,0 +1,163 @@
+import math
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from playground.providers.admission import (
+    AdmissionRejected,
+    ConcurrencyLimiter,
+    RateLimiter,
+)
+from playground.providers.executors import ExecutorSaturatedError
+from playground.providers.negotiation import NegotiatedResponse
+from playground.providers.token_verifier import (
+    TokenVerificationError,
+    get_token_verifier,
+)
+
+
+class AdmissionMiddleware:
+    """
+    Decide if a request may run before the app sees it: first the rate limit of its client, then the concurrency limit of the app.
+
+    Clients over their rate limit get a 429, requests that find the app too busy a 503. Both have a `Retry-After` header. Rejections cost
+    no more than a few dictionary lookups, so a noisy client cannot slow down the others by sending more requests.
+
+    The client is the subject of its bearer token once that token was verified, so clients behind one IP are limited apart. Unverified
+    subjects could be made up, so without a `TokenVerifier`, and for new or invalid tokens, the client is its IP. New tokens are verified
+    on the `cpu` executor, and only after their IP admitted the request. Behind a proxy, run uvicorn with `--proxy-headers` so that is the
+    IP of the actual client.
+
+    Event streams give up their concurrency slot once they start, so idle subscribers do not take capacity from other requests. Limits are
+    per worker process, see `rate_limit_capacity`.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        rate_limiter: Optional[RateLimiter],
+        concurrency_limiter: ConcurrencyLimiter,
+        costs: Dict[str, float],
+    ):
+        self.app = app
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.costs = {path.rstrip("/") or "/": cost for path, cost in costs.items()}
+
+    def get_cost(self, path: str) -> float:
+        """
+        Get the cost of the longest path prefix in `costs`, e.g. `/health` for `/health/ping`.
+        """
+        path = path.rstrip("/")
+
+        while path:
+            if (cost := self.costs.get(path)) is not None:
+                return cost
+
+            path = path.rpartition("/")[0]
+
+        return self.costs.get("/", 1)
+
+    @staticmethod
+    def get_token(scope: Scope) -> Optional[str]:
+        scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+
+        return token.strip() if scheme.lower() == "bearer" and token else None
+
+    @staticmethod
+    def get_ip(scope: Scope) -> str:
+        client = scope.get("client")
+
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def take(self, scope: Scope, cost: float):
+        """
+        Take the cost of a request from the bucket of its client.
+
+        The client is the subject of a token that was verified before. Any other request is charged to its IP. A token that was not
+        verified yet is only checked once its IP admitted the request, so new tokens cost no more signature checks than the IP may make
+        requests. Its subject is the client of the next requests.
+
+        :raises AdmissionRejected: When the client is over its rate limit.
+        """
+        verifier = get_token_verifier()
+        token = self.get_token(scope) if verifier is not None else None
+        claims = None
+
+        if token is not None:
+            try:
+                claims = verifier.cached(token)
+            except TokenVerificationError:
+                # Rejected before, there is nothing left to check.
+                token = None
+
+        if claims is not None and (subject := claims.get("sub")) is not None:
+            self.rate_limiter.take(f"sub:{subject}", cost)
+            return
+
+        self.rate_limiter.take(self.get_ip(scope), cost)
+
+        if token is not None and claims is None:
+            try:
+                await verifier.averify(token)
+            except (TokenVerificationError, ExecutorSaturatedError):
+                # The outcome is remembered, and routes that need a valid token turn the request away.
+                pass
+
+    @staticmethod
+    async def reject(
+        scope: Scope, receive: Receive, send: Send, status: int, e: AdmissionRejected
+    ):
+        response = NegotiatedResponse(
+            {"detail": e.reason},
+            status_code=status,
+            headers={"Retry-After": str(max(math.ceil(e.retry_after), 1))},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cost = self.get_cost(scope["path"])
+
+        if cost == 0:
+            await self.app(scope, receive, send)
+            return
+
+        if self.rate_limiter is not None:
+            try:
+                await self.take(scope, cost)
+            except AdmissionRejected as e:
+                await self.reject(scope, receive, send, 429, e)
+                return
+
+        try:
+            await self.concurrency_limiter.acquire()
+        except AdmissionRejected as e:
+            await self.reject(scope, receive, send, 503, e)
+            return
+
+        released = False
+
+        def release():
+            nonlocal released
+
+            if not released:
+                released = True
+                self.concurrency_limiter.release()
+
+        async def send_with_release(message: Message):
+            if message["type"] == "http.response.start" and Headers(
+                raw=message.get("headers", [])
+            ).get("content-type", "").startswith("text/event-stream"):
+                release()
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_release)
+        finally:
+            release()
@@ -0,0 +1,441 @@
+import hashlib
+import importlib.util
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from playground.providers.executors import get_executors
+from playground.providers.negotiation import parse_accept
+from playground.providers.settings import CompressionRouteSettings
+
+# Content types that are already compressed. Compressing them again costs CPU and saves nothing.
+INCOMPRESSIBLE_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/gzip",
+    "application/zip",
+    "application/zstd",
+)
+
+
+class Compressor:
+    """
+    Compresses a single response body, possibly in chunks.
+    """
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        """
+        Compress a chunk. With `flush`, the output contains everything needed to decode the chunk, so it can be sent right away.
+        """
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        """
+        Compress whatever is left and end the stream.
+        """
+        raise NotImplementedError
+
+    def compress_all(self, data: bytes) -> bytes:
+        return self.compress(data, flush=False) + self.finish()
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int):
+        # 31 tells zlib to add gzip headers and a checksum.
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        compressed = self.compressor.compress(data)
+
+        if flush:
+            compressed += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        return compressed
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, level: int):
+        import brotli
+
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        compressed = self.compressor.process(data)
+
+        if flush:
+            compressed += self.compressor.flush()
+
+        return compressed
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int):
+        import zstandard
+
+        self.flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        compressed = self.compressor.compress(data)
+
+        if flush:
+            compressed += self.compressor.flush(self.flush_block)
+
+        return compressed
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+def create_compressors() -> Dict[str, Callable[[int], Compressor]]:
+    """
+    Map every supported `Content-Encoding` to its compressor, best first. zstd and brotli are only supported if the optional
+    `zstandard` and `brotli` packages are installed.
+    """
+    compressors: Dict[str, Callable[[int], Compressor]] = {}
+
+    if importlib.util.find_spec("zstandard") is not None:
+        compressors["zstd"] = ZstdCompressor
+
+    if importlib.util.find_spec("brotli") is not None:
+        compressors["br"] = BrotliCompressor
+
+    compressors["gzip"] = GzipCompressor
+
+    return compressors
+
+
+COMPRESSORS = create_compressors()
+
+
+def select_encoding(
+    accept_encoding: str, encodings: Sequence[str] = tuple(COMPRESSORS)
+) -> Optional[str]:
+    """
+    Get the encoding the client prefers most from `encodings`. Ties go to the encoding that comes first in `encodings`.
+    :return: The encoding, or `None` if the client accepts none of them.
+    """
+    qualities = dict(reversed(parse_accept(accept_encoding)))
+    selected = None
+    selected_quality = 0.0
+
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+
+        if quality > selected_quality:
+            selected, selected_quality = encoding, quality
+
+    return selected
+
+
+class CompressedBodyCache:
+    """
+    An LRU cache of compressed bodies, bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict[Hashable, Tuple[Any, bytes]] = OrderedDict()
+        self.size = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, bytes]]:
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            self.entries.move_to_end(key)
+
+        return entry
+
+    def store(self, key: Hashable, extra: Any, body: bytes):
+        if len(body) > self.max_size:
+            return
+
+        if (previous := self.entries.pop(key, None)) is not None:
+            self.size -= len(previous[1])
+
+        self.entries[key] = (extra, body)
+        self.size += len(body)
+
+        while self.size > self.max_size:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Check if an `If-None-Match` header matches `etag`. Like for any `GET`, weak and strong ETags compare equal.
+    """
+    if if_none_match.strip() == "*":
+        return True
+
+    opaque = etag.removeprefix("W/")
+
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the best encoding the client accepts: zstd, brotli or gzip.
+
+    - Streaming responses are compressed and flushed chunk by chunk, instead of being buffered.
+    - Bodies or chunks of `offload_size` bytes or more are compressed on the `cpu` executor, so the event loop keeps serving other requests.
+    - Responses with a strong `ETag` are compressed once per encoding, level and ETag.
+    - Paths in `routes` can have their own levels and minimum size. Responses of `immutable` paths are cached fully compressed and served
+      without calling the app at all. Conditional requests for them get a `304` when their ETag matches, or else go to the app.
+
+    Responses that already have a `Content-Encoding` are passed through untouched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1000,
+        levels: Optional[Dict[str, int]] = None,
+        offload_size: int = 256 * 1024,
+        cache_max_size: int = 16 * 1024 * 1024,
+        routes: Optional[Dict[str, CompressionRouteSettings]] = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"zstd": 3, "br": 4, "gzip": 6, **(levels or {})}
+        self.offload_size = offload_size
+        self.routes = routes or {}
+        self.cache = CompressedBodyCache(cache_max_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = select_encoding(headers.get("accept-encoding", ""))
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        route = self.routes.get(scope["path"])
+        level = self.levels[encoding]
+        minimum_size = self.minimum_size
+        static_key = None
+
+        if route is not None:
+            level = route.levels.get(encoding, level)
+            minimum_size = (
+                minimum_size if route.minimum_size is None else route.minimum_size
+            )
+
+            if route.immutable and scope["method"] == "GET":
+                static_key = (
+                    "static",
+                    scope["path"],
+                    scope["query_string"],
+                    headers.get("accept", ""),
+                    encoding,
+                    level,
+                )
+
+                if_none_match = headers.get("if-none-match")
+                cached = self.cache.get(static_key)
+
+                if cached is not None and if_none_match is not None:
+                    (_, raw_headers), _ = cached
+                    etag = Headers(raw=raw_headers).get("etag")
+
+                    if etag is not None and etag_matches(if_none_match, etag):
+                        await send(
+                            {
+                                "type": "http.response.start",
+                                "status": 304,
+                                "headers": [
+                                    (name, value)
+                                    for name, value in raw_headers
+                                    if name in (b"etag", b"vary", b"cache-control")
+                                ],
+                            }
+                        )
+                        await send({"type": "http.response.body", "body": b""})
+                        return
+
+                    # Let the app decide what the client gets for any other condition.
+                    cached = None
+
+                if cached is not None:
+                    (status, raw_headers), body = cached
+                    await send(
+                        {
+                            "type": "http.response.start",
+                            "status": status,
+                            "headers": raw_headers,
+                        }
+                    )
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+        responder = CompressionResponder(
+            self, encoding, level, minimum_size, static_key
+        )
+        await responder(scope, receive, send)
+
+    async def run_compressor(self, operation: Callable[[bytes], bytes], data: bytes):
+        if len(data) >= self.offload_size:
+            # Never rejected: the response has already started.
+            return await get_executors().run("cpu", operation, data, reject=False)
+
+        return operation(data)
+
+
+class CompressionResponder:
+    """
+    Compresses the response of a single request. See `CompressionMiddleware`.
+    """
+
+    def __init__(
+        self,
+        middleware: CompressionMiddleware,
+        encoding: str,
+        level: int,
+        minimum_size: int,
+        static_key: Optional[Hashable],
+    ):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.static_key = static_key
+
+        self.send: Send = unattached_send
+        self.start_message: Message = {}
+        self.compressor: Optional[Compressor] = None
+        self.started = False
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.middleware.app(scope, receive, self.send_with_compression)
+
+    def should_compress(self, headers: Headers, body: bytes, more_body: bool) -> bool:
+        if "content-encoding" in headers:
+            return False
+
+        if self.start_message["status"] < 200 or self.start_message["status"] in (
+            204,
+            304,
+        ):
+            return False
+
+        if headers.get("content-type", "").startswith(INCOMPRESSIBLE_TYPES):
+            return False
+
+        return more_body or len(body) >= self.minimum_size
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # The headers depend on whether we compress, which depends on the first body chunk.
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+            self.start_message["headers"] = list(self.start_message.get("headers", []))
+            headers = MutableHeaders(raw=self.start_message["headers"])
+
+            if not self.should_compress(headers, body, more_body):
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+
+            if more_body:
+                del headers["Content-Length"]
+                self.compressor = COMPRESSORS[self.encoding](self.level)
+                message["body"] = await self.middleware.run_compressor(
+                    self.compressor.compress, body
+                )
+            else:
+                if (
+                    self.static_key is not None
+                    and self.start_message["status"] == 200
+                    and "etag" not in headers
+                ):
+                    # Immutable responses never change, so their body can stand in for a version, and clients can revalidate them.
+                    headers[
+                        "ETag"
+                    ] = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+                message["body"] = await self.compress_body(headers, body)
+                headers["Content-Length"] = str(len(message["body"]))
+
+                if self.static_key is not None and self.start_message["status"] == 200:
+                    self.middleware.cache.store(
+                        self.static_key,
+                        (self.start_message["status"], list(headers.raw)),
+                        message["body"],
+                    )
+
+            await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        if self.passthrough or self.compressor is None:
+            await self.send(message)
+            return
+
+        compressed = await self.middleware.run_compressor(
+            self.compressor.compress, body
+        )
+
+        if not more_body:
+            compressed += self.compressor.finish()
+
+        message["body"] = compressed
+        await self.send(message)
+
+    async def compress_body(self, headers: Headers, body: bytes) -> bytes:
+        """
+        Compress a complete body. Bodies with a strong `ETag` are only compressed the first time they are seen.
+        """
+        etag = headers.get("etag")
+        key = None
+
+        if etag is not None and not etag.startswith("W/"):
+            key = ("etag", etag, self.encoding, self.level)
+
+            if (cached := self.middleware.cache.get(key)) is not None:
+                return cached[1]
+
+        compressor = COMPRESSORS[self.encoding](self.level)
+        compressed = await self.middleware.run_compressor(compressor.compress_all, body)
+
+        if key is not None:
+            self.middleware.cache.store(key, None, compressed)
+
+        return compressed
+
+
+async def unattached_send(message: Message) -> None:
+    raise RuntimeError("send awaitable not set")  # pragma: no cover
@@ -0,0 +1,93 @@
+import time
+from typing import Any, Callable, Dict
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from playground.providers.metrics import current_timings, get_metrics
+
+
+class MetricsMiddleware:
+    """
+    Time every HTTP request and record it in the `MetricsRegistry`, per route.
+
+    This is a plain ASGI middleware. Unlike `@app.middleware("http")`, it does not wrap the request and response in extra tasks and streams,
+    so it costs a couple of `perf_counter_ns` calls per request. It should be the outermost middleware, so it sees the bytes that are actually sent.
+
+    It also sets the `X-Process-Time` header: the time until the response started, in seconds.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.route_paths: Dict[Callable[..., Any], str] = {}
+
+    def get_route(self, scope: Scope) -> str:
+        """
+        Get the path template of the route that handled the request, e.g. `/timeranged/keyset`. Raw paths would give every id its own metric.
+        """
+        endpoint = scope.get("endpoint")
+
+        if endpoint is None:
+            return "unmatched"
+
+        if endpoint not in self.route_paths:
+            for route in scope["app"].routes:
+                self.route_paths.setdefault(
+                    getattr(route, "endpoint", None), route.path
+                )
+
+        return self.route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = get_metrics()
+        timings = metrics.start()
+        token = current_timings.set(timings)
+        status = 500
+
+        async def send_with_metrics(message: Message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                process_time = (time.perf_counter_ns() - timings.started) / 1e9
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-process-time", str(process_time).encode()),
+                ]
+            elif message["type"] == "http.response.body":
+                timings.sent_size += len(message.get("body", b""))
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_timings.reset(token)
+            metrics.finish(scope["method"], self.get_route(scope), status, timings)
+
+
+class ResponseSizeMiddleware:
+    """
+    Count the response bytes as the endpoint produced them. It should be the innermost middleware, so it sees the bodies before they are compressed.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        timings = current_timings.get()
+
+        if scope["type"] != "http" or timings is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_size(message: Message):
+            if message["type"] == "http.response.body":
+                timings.body_size += len(message.get("body", b""))
+
+            await send(message)
+
+        await self.app(scope, receive, send_with_size)
@@ -0,0 +1,252 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Deque, Hashable, List, Optional
+
+from pydantic import BaseModel
+
+from playground.providers.settings import get_settings
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted. The client may try again after `retry_after` seconds.
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimitStatistics(BaseModel):
+    clients: int
+    allowed: int
+    limited: int
+    evicted: int
+
+
+class RateLimiter:
+    """
+    A token bucket per client. Every bucket holds up to `capacity` tokens and gains `refill_rate` tokens per second. A request takes the
+    tokens its route costs, or is limited when the bucket holds fewer.
+
+    Buckets are refilled when they are used, so taking tokens is O(1) no matter how many clients there are. Buckets are kept in the order
+    they were last used. A bucket that was not used for `capacity / refill_rate` seconds is full again, just like a client without one, so
+    `sweep` drops those from the front. At most `max_clients` buckets are kept, the least recently used ones go first.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_rate: float,
+        max_clients: int,
+        sweep_interval: float = 10.0,
+    ):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_clients = max_clients
+        self.sweep_interval = sweep_interval
+        # Per client: the tokens in the bucket, and when they were counted.
+        self.buckets: OrderedDict[Hashable, List[float]] = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def take(self, key: Hashable, cost: float, now: Optional[float] = None):
+        """
+        Take `cost` tokens from the bucket of `key`. A cost above the capacity takes a full bucket.
+        :raises AdmissionRejected: When the bucket holds too few tokens. `retry_after` is when it will hold enough.
+        """
+        now = time.monotonic() if now is None else now
+        cost = min(cost, self.capacity)
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            bucket = self.buckets[key] = [self.capacity, now]
+
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(
+                self.capacity, bucket[0] + (now - bucket[1]) * self.refill_rate
+            )
+            bucket[1] = now
+
+        if bucket[0] < cost:
+            self.limited += 1
+            raise AdmissionRejected(
+                "Too many requests",
+                (cost - bucket[0]) / self.refill_rate,
+            )
+
+        bucket[0] -= cost
+        self.allowed += 1
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Drop the buckets that are full again.
+        :return: The amount of dropped buckets.
+        """
+        now = time.monotonic() if now is None else now
+        full_before = now - self.capacity / self.refill_rate
+        swept = 0
+
+        while self.buckets:
+            key, (_, updated) = next(iter(self.buckets.items()))
+
+            if updated > full_before:
+                break
+
+            del self.buckets[key]
+            swept += 1
+
+        return swept
+
+    def clear(self):
+        self.buckets.clear()
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+            self.task = None
+
+    def statistics(self) -> RateLimitStatistics:
+        return RateLimitStatistics(
+            clients=len(self.buckets),
+            allowed=self.allowed,
+            limited=self.limited,
+            evicted=self.evicted,
+        )
+
+
+class ConcurrencyStatistics(BaseModel):
+    active: int
+    queued: int
+    limit: int
+    admitted: int
+    rejected: int
+
+
+class ConcurrencyLimiter:
+    """
+    Lets at most `limit` requests run at a time. Others wait in a FIFO queue of at most `queue_size`, for up to `queue_timeout` seconds.
+
+    Requests that find the queue full are rejected right away, and those that wait too long are rejected then. Under overload, admitted
+    requests keep their latency and the rest learn quickly that they should back off, instead of all of them getting slow together.
+    """
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """
+        Wait for a slot. Call `release` when done with it.
+        :raises AdmissionRejected: When the queue is full, or no slot freed up within `queue_timeout` seconds.
+        """
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self.waiters) >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected("Server is busy", self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AdmissionRejected("Server is busy", self.queue_timeout)
+        except BaseException:
+            # The slot may have been handed over right before the wait was cancelled.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+        self.admitted += 1
+
+    def release(self):
+        """
+        Hand the slot over to the longest waiting request, or free it.
+        """
+        while self.waiters:
+            waiter = self.waiters.popleft()
+
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.active -= 1
+
+    def statistics(self) -> ConcurrencyStatistics:
+        return ConcurrencyStatistics(
+            active=self.active,
+            queued=len(self.waiters),
+            limit=self.limit,
+            admitted=self.admitted,
+            rejected=self.rejected,
+        )
+
+
+@lru_cache(None)
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the application wide `RateLimiter`. Every worker process has its own.
+    """
+    settings = get_settings()
+
+    return RateLimiter(
+        settings.rate_limit_capacity,
+        settings.rate_limit_refill_rate,
+        settings.rate_limit_max_clients,
+        settings.rate_limit_sweep_interval,
+    )
+
+
+@lru_cache(None)
+def get_concurrency_limiter() -> ConcurrencyLimiter:
+    """
+    Get the application wide `ConcurrencyLimiter`. Every worker process has its own.
+    """
+    settings = get_settings()
+
+    return ConcurrencyLimiter(
+        settings.admission_max_concurrency,
+        settings.admission_queue_size,
+        settings.admission_queue_timeout,
+    )
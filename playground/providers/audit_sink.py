@@ -0,0 +1,330 @@
+import json
+import logging
+import random
+import sqlite3
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from playground.providers.executors import get_executors
+from playground.providers.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Where the file based backends write to, unless `audit_path` is set.
+DEFAULT_AUDIT_PATHS = {"jsonl": "./audit.jsonl", "sqlite": "./audit.db"}
+
+
+class AuditRecord(BaseModel):
+    """
+    A single audit message. `message` is the human readable line, `details` holds the structured data it was made from.
+    """
+
+    audit_name: str
+    message: str
+    created: datetime = Field(default_factory=datetime.now)
+    details: Dict[str, Any] = Field(default_factory=dict)
+
+
+class AuditSinkStatistics(BaseModel):
+    enqueued: int
+    dropped: int
+    flushed: int
+    failed: int
+    queued: int
+
+
+class AuditBackend:
+    """
+    Writes batches of audit records somewhere. Backends are only ever called from a single thread at a time.
+    """
+
+    def write(self, records: List[AuditRecord]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class StdoutBackend(AuditBackend):
+    """
+    Print the audit lines to stdout, one line per record.
+    """
+
+    def write(self, records: List[AuditRecord]):
+        sys.stdout.write("".join(f"{record.message}\n" for record in records))
+        sys.stdout.flush()
+
+
+class JsonLinesBackend(AuditBackend):
+    """
+    Append the records to a JSON-lines file, one JSON object per line.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, records: List[AuditRecord]):
+        self.file.write("".join(f"{record.json()}\n" for record in records))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteBackend(AuditBackend):
+    """
+    Insert the records into the `audit_record` table of a SQLite database. Every batch is a single transaction.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS audit_record (id INTEGER PRIMARY KEY, audit_name TEXT, message TEXT, created TIMESTAMP, details TEXT)"
+        )
+
+    def write(self, records: List[AuditRecord]):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO audit_record (audit_name, message, created, details) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        record.audit_name,
+                        record.message,
+                        record.created.isoformat(),
+                        json.dumps(record.details, default=str),
+                    )
+                    for record in records
+                ],
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class AuditSink:
+    """
+    Collects audit records in a bounded in-memory queue and writes them to a backend in batches on a background thread.
+
+    Adding a record is an O(1) append, so auditing does not do any I/O on the request path.
+    When the queue is full, the `backpressure` policy decides what happens:
+
+    - `block`: wait until the background thread made room. On the event loop, use `aenqueue`, which waits on a worker thread instead.
+    - `drop_oldest`: discard the oldest queued record to make room for the new one.
+    - `sample`: once the queue is half full, only keep `sample_rate` of the new records. Drop them when it is full.
+    """
+
+    def __init__(
+        self,
+        backend: AuditBackend,
+        queue_size: int = 10_000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        backpressure: str = "drop_oldest",
+        sample_rate: float = 0.1,
+    ):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.sample_rate = sample_rate
+
+        self.queue: Deque[AuditRecord] = deque()
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.worker: Optional[threading.Thread] = None
+        self.stopping = False
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def enqueue(self, record: AuditRecord) -> bool:
+        """
+        Add a record to the queue. With `block` backpressure, this waits while the queue is full, so do not call it on the event loop.
+        :return: If the record was accepted. Records can be dropped due to backpressure.
+        """
+        return self.put(record, wait=True)
+
+    async def aenqueue(self, record: AuditRecord) -> bool:
+        """
+        The async version of `enqueue`. Adding a record is still an O(1) append, only when `block` has to wait for room is that done on a
+        worker thread, so the event loop keeps serving other requests.
+        """
+        accepted = self.put(record, wait=False)
+
+        if accepted is None:
+            return await get_executors().run(
+                "default", self.enqueue, record, reject=False
+            )
+
+        return accepted
+
+    def put(self, record: AuditRecord, wait: bool) -> Optional[bool]:
+        """
+        Add a record to the queue.
+        :param wait: Wait for room when `block` finds the queue full. Without it, nothing is added.
+        :return: If the record was accepted, or `None` when it was not added because that would have to wait.
+        """
+        with self.condition:
+            if self.backpressure == "sample" and (
+                len(self.queue) >= self.queue_size
+                or (
+                    len(self.queue) >= self.queue_size // 2
+                    and random.random() >= self.sample_rate
+                )
+            ):
+                self.dropped += 1
+                return False
+
+            if self.backpressure == "block":
+                while len(self.queue) >= self.queue_size and self.worker is not None:
+                    if not wait:
+                        return None
+
+                    self.condition.wait()
+
+            if len(self.queue) >= self.queue_size:
+                # Either `drop_oldest`, or `block` without a background thread that could make room.
+                self.queue.popleft()
+                self.dropped += 1
+
+            self.queue.append(record)
+            self.enqueued += 1
+
+            if len(self.queue) >= self.batch_size:
+                self.condition.notify_all()
+
+        return True
+
+    def drain(self, limit: Optional[int] = None) -> int:
+        """
+        Write up to `limit` queued records to the backend, in batches. Writes everything that is queued if no limit is given. Batches the
+        backend fails to write are counted as `failed`.
+        :return: The amount of records written.
+        """
+        written = taken = 0
+
+        with self.write_lock:
+            while limit is None or taken < limit:
+                with self.condition:
+                    size = min(len(self.queue), self.batch_size)
+                    batch = [self.queue.popleft() for _ in range(size)]
+                    # Blocked producers can continue now.
+                    self.condition.notify_all()
+
+                if not batch:
+                    break
+
+                taken += len(batch)
+
+                try:
+                    self.backend.write(batch)
+                except Exception:
+                    # The batch is lost, but the sink keeps going, so producers that wait for room are not stuck forever.
+                    self.failed += len(batch)
+                    logger.exception(
+                        "Failed to write %d audit records, they are dropped", len(batch)
+                    )
+                    continue
+
+                self.flushed += len(batch)
+                written += len(batch)
+
+        return written
+
+    def flush(self) -> int:
+        """
+        Write everything that is currently queued, on the calling thread.
+        """
+        return self.drain()
+
+    def run(self):
+        """
+        The background loop. Writes a batch when one is full, or whatever is queued every `flush_interval` seconds.
+        """
+        while True:
+            with self.condition:
+                if not self.stopping and len(self.queue) < self.batch_size:
+                    self.condition.wait(self.flush_interval)
+
+                if self.stopping:
+                    return
+
+            self.drain(self.batch_size)
+
+    def start(self):
+        """
+        Start the background thread that drains the queue.
+        """
+        if self.worker is not None:
+            return
+
+        self.stopping = False
+        self.worker = threading.Thread(target=self.run, name="audit-sink", daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        """
+        Stop the background thread and flush all remaining records.
+        """
+        if self.worker is not None:
+            with self.condition:
+                self.stopping = True
+                self.condition.notify_all()
+
+            self.worker.join()
+            self.worker = None
+
+        self.flush()
+
+    def statistics(self) -> AuditSinkStatistics:
+        return AuditSinkStatistics(
+            enqueued=self.enqueued,
+            dropped=self.dropped,
+            flushed=self.flushed,
+            failed=self.failed,
+            queued=len(self.queue),
+        )
+
+
+def create_audit_backend(backend: str, path: Optional[str] = None) -> AuditBackend:
+    """
+    Create an `AuditBackend` by name. Known backends are `stdout`, `jsonl` and `sqlite`.
+    :param path: Where the file based backends write to. Every backend has its own default, see `DEFAULT_AUDIT_PATHS`.
+    """
+    path = path or DEFAULT_AUDIT_PATHS.get(backend)
+
+    if backend == "jsonl":
+        return JsonLinesBackend(path)
+
+    if backend == "sqlite":
+        return SqliteBackend(path)
+
+    return StdoutBackend()
+
+
+@lru_cache(None)
+def get_audit_sink() -> AuditSink:
+    """
+    Get the application wide `AuditSink`.
+
+    @lru_cache ensures that there is only a single sink, and thus a single queue and background thread.
+    """
+    settings = get_settings()
+
+    return AuditSink(
+        create_audit_backend(settings.audit_backend, settings.audit_path),
+        queue_size=settings.audit_queue_size,
+        batch_size=settings.audit_batch_size,
+        flush_interval=settings.audit_flush_interval,
+        backpressure=settings.audit_backpressure,
+        sample_rate=settings.audit_sample_rate,
+    )
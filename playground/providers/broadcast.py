@@ -0,0 +1,269 @@
+import asyncio
+import uuid
+from collections import deque
+from typing import Any, Deque, Generic, List, Optional, Set, TypeVar
+
+from pydantic import BaseModel
+
+from playground.providers.shared_store import SharedStoreError, get_shared_store
+
+T = TypeVar("T")
+
+# Other workers relay at most this many messages per poll. When they fall further behind, their subscribers are closed instead.
+MAX_RELAYED_MESSAGES = 1000
+
+
+class SubscriptionClosed(Exception):
+    """
+    Raised when reading from a `Subscription` that was closed, e.g. because it fell too far behind.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Subscription(Generic[T]):
+    """
+    The buffer of a single subscriber of a `BroadcastBus`. It holds at most `buffer_size` messages.
+
+    A subscriber that lets its buffer fill up is too slow to keep up. It is closed instead of buffering without bounds or slowing down
+    everyone else, and can resume from the last message it got.
+    """
+
+    def __init__(self, bus: "BroadcastBus[T]", buffer_size: int):
+        self.bus = bus
+        self.buffer_size = buffer_size
+        self.messages: Deque[T] = deque()
+        self.available = asyncio.Event()
+        self.closed: Optional[str] = None
+
+    def push(self, message: T) -> bool:
+        if self.closed is not None:
+            return False
+
+        if len(self.messages) >= self.buffer_size:
+            self.close("Too slow to keep up")
+            return False
+
+        self.messages.append(message)
+        self.available.set()
+
+        return True
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[T]:
+        """
+        Wait for the next message.
+        :return: The message, or `None` if there was none within `timeout` seconds.
+        :raises SubscriptionClosed: When the subscription was closed and its buffer is empty.
+        """
+        if not self.messages and self.closed is None:
+            try:
+                await asyncio.wait_for(self.available.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+        if not self.messages:
+            raise SubscriptionClosed(self.closed or "Closed")
+
+        message = self.messages.popleft()
+
+        if not self.messages:
+            self.available.clear()
+
+        return message
+
+    def close(self, reason: str = "Closed"):
+        """
+        Stop receiving messages. Messages that are already buffered can still be read.
+        """
+        if self.closed is None:
+            self.closed = reason
+            self.available.set()
+            self.bus.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription[T]":
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+class BroadcastStatistics(BaseModel):
+    subscribers: int
+    published: int
+    delivered: int
+    # Subscribers that were closed because their buffer was full.
+    disconnected: int
+    # Messages of other workers that were relayed through the shared store.
+    relayed: int
+
+
+class BroadcastBus(Generic[T]):
+    """
+    Fans out messages to every subscriber.
+
+    Publishing only appends to the buffers of the subscribers, without awaiting any of them. Idle subscribers wait on an event, so they
+    cost no work until a message arrives.
+
+    `publish` only reaches the subscribers in this process. `share` also stores the message in the shared store, from where the
+    `BroadcastRelay` of every other worker publishes it to theirs. Shared messages have to be encodable with msgpack.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.subscriptions: Set[Subscription[T]] = set()
+        self.published = 0
+        self.delivered = 0
+        self.disconnected = 0
+        self.relayed = 0
+        # Tells the messages this bus shared apart from those of other workers.
+        self.origin = uuid.uuid4().hex
+        # The last message of the shared store that this worker relayed. `None` until it first looked.
+        self.sequence: Optional[int] = None
+
+    def subscribe(self, buffer_size: int) -> Subscription[T]:
+        subscription = Subscription(self, buffer_size)
+        self.subscriptions.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription[T]):
+        self.subscriptions.discard(subscription)
+
+    def publish(self, message: T) -> int:
+        """
+        :return: The amount of subscribers that got the message.
+        """
+        self.published += 1
+        delivered = 0
+
+        for subscription in list(self.subscriptions):
+            if subscription.push(message):
+                delivered += 1
+            else:
+                self.disconnected += 1
+
+        self.delivered += delivered
+
+        return delivered
+
+    def close_all(self, reason: str):
+        for subscription in list(self.subscriptions):
+            subscription.close(reason)
+
+    @property
+    def sequence_key(self) -> str:
+        return f"broadcast:{self.name}:messages"
+
+    def message_key(self, sequence: int) -> str:
+        return f"broadcast:{self.name}:message:{sequence}"
+
+    async def share(self, message: T):
+        """
+        Publish a message to the subscribers of this process, and through the shared store to those of every other worker.
+        """
+        self.publish(message)
+        store = get_shared_store()
+
+        if store is None:
+            return
+
+        try:
+            sequence = await store.incr(self.sequence_key)
+            await store.set(self.message_key(sequence), [self.origin, message], ttl=60)
+        except SharedStoreError:
+            # Subscribers of other workers miss the message, and can resume from their last one once they notice.
+            pass
+
+    async def relay(self) -> int:
+        """
+        Publish the messages that other workers shared since the last relay to the subscribers of this process.
+
+        Subscribers are closed when messages were lost, e.g. because they expired or the store was restarted, so they know to resume.
+        :return: The amount of relayed messages.
+        """
+        store = get_shared_store()
+
+        if store is None:
+            return 0
+
+        sequence = await store.get(self.sequence_key) or 0
+        previous, self.sequence = self.sequence, sequence
+
+        # Without subscribers there is no one to relay to, only the sequence is followed.
+        if previous is None or sequence == previous or not self.subscriptions:
+            return 0
+
+        if sequence < previous or sequence - previous > MAX_RELAYED_MESSAGES:
+            self.close_all("Missed messages")
+            return 0
+
+        messages: List[Any] = await store.get_many(
+            [self.message_key(n) for n in range(previous + 1, sequence + 1)]
+        )
+        relayed = 0
+
+        for message in messages:
+            if message is None:
+                self.close_all("Missed messages")
+                break
+
+            origin, message = message
+
+            if origin != self.origin:
+                self.publish(message)
+                relayed += 1
+
+        self.relayed += relayed
+
+        return relayed
+
+    def statistics(self) -> BroadcastStatistics:
+        return BroadcastStatistics(
+            subscribers=len(self.subscriptions),
+            published=self.published,
+            delivered=self.delivered,
+            disconnected=self.disconnected,
+            relayed=self.relayed,
+        )
+
+
+class BroadcastRelay:
+    """
+    Relays the messages that other workers shared on a `BroadcastBus` every `interval` seconds, on a background task.
+
+    Every poll is a single read of the shared store, messages are only fetched when this worker has subscribers.
+    """
+
+    def __init__(self, bus: BroadcastBus, interval: float):
+        self.bus = bus
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await self.bus.relay()
+                self.last_error = None
+            except SharedStoreError as e:
+                # Try again next time. Messages that expire in the meantime close the subscribers, who resume.
+                self.last_error = str(e)
+
+    def start(self):
+        if get_shared_store() is not None:
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+            self.task = None
@@ -1,39 +1,82 @@
 from functools import lru_cache
 
+from sqlalchemy import event
 from sqlalchemy.engine import Engine
-from sqlmodel import create_engine, SQLModel, Session
+from sqlalchemy.pool import QueuePool
+from sqlmodel import create_engine, Session
 
-from playground.providers.settings import get_settings
+from playground.providers.executors import offload
+from playground.providers.settings import get_settings, DatabaseProfile, Settings
+
+
+def get_database_url(settings: Settings, driver: str = "sqlite") -> str:
+    """
+    Build the URL of the configured database. Sync and async engines only differ in their `driver`.
+    """
+    return f"{driver}:///{settings.database_url}"
+
+
+def apply_pragmas(engine: Engine, profile: DatabaseProfile, read_only: bool = False):
+    """
+    Apply the pragmas of the `DatabaseProfile` to every connection that the engine opens. For async engines, pass `engine.sync_engine`.
+
+    The journal mode is stored in the database file itself, so it is only set by writers.
+    """
+    pragmas = {
+        "synchronous": profile.synchronous,
+        "mmap_size": profile.mmap_size,
+        "cache_size": profile.cache_size,
+        "busy_timeout": profile.busy_timeout,
+    }
+
+    if read_only:
+        pragmas["query_only"] = "ON"
+    else:
+        pragmas = {"journal_mode": profile.journal_mode, **pragmas}
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+        cursor.close()
 
 
 @lru_cache(None)
-def get_database_engine(settings=get_settings()) -> Engine:
+def get_database_engine() -> Engine:
     """
-    Create a database engine and initialize all models.
+    Create a database engine. It uses the same database and `DatabaseProfile` as the async engines.
 
     @lru_cache caches the result of this function so that there is only a single engine in the application.
+    Tables are created by `playground.providers.database_lifespan.start_database`, not here.
     """
-    sqlite_url = f"sqlite:///{settings.database_url}"
+    settings = get_settings()
+    profile = settings.database_profile
 
     connect_args = {"check_same_thread": False}
     engine = create_engine(
-        sqlite_url,
+        get_database_url(settings),
         echo=settings.database_echo,
         echo_pool=settings.database_echo,
         connect_args=connect_args,
+        poolclass=QueuePool,
+        pool_size=profile.pool_size,
+        max_overflow=0,
     )
-
-    # Don't do this for actual projects. It runs DDL.
-    SQLModel.metadata.create_all(engine)
+    apply_pragmas(engine, profile)
 
     return engine
 
 
+@offload("database")
 def get_session() -> Session:
     """
     Yield a session that can be used as a FastAPI dependency.
 
-    The session gets closed automatically when we are done with it.
+    The session gets closed automatically when we are done with it. Both happen on the `database` executor, so slow work elsewhere cannot keep
+    the session, and the readiness check that depends on it, from starting.
     """
     engine = get_database_engine()
 
@@ -1,40 +1,95 @@
 from async_lru import alru_cache
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 from sqlalchemy.orm import sessionmaker
-from sqlmodel import SQLModel
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from playground.providers.database import apply_pragmas, get_database_url
 from playground.providers.settings import get_settings
 
 
 @alru_cache(maxsize=1)
 async def get_engine() -> AsyncEngine:
     """
-    Create the database engine and initialize all models.
+    Create the database engine.
 
     @alru_cache ensures that there can only every be a single async engine.
+    Tables are created by `playground.providers.database_lifespan.start_database`, not here.
     :return:
     """
     settings = get_settings()
+    profile = settings.database_profile
     engine = create_async_engine(
-        f"sqlite+aiosqlite:///{settings.database_url}",
+        get_database_url(settings, "sqlite+aiosqlite"),
         echo=settings.database_echo,
         future=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=profile.pool_size,
+        max_overflow=0,
     )
+    apply_pragmas(engine.sync_engine, profile)
 
-    async with engine.begin() as conn:
-        # Do not do this with actual databases. This runs the DDL
-        await conn.run_sync(SQLModel.metadata.create_all)
+    return engine
+
+
+@alru_cache(maxsize=1)
+async def get_read_engine() -> AsyncEngine:
+    """
+    Create a read-only engine with its own connection pool. In WAL mode, readers never wait for the writer.
+
+    The writer opens a connection first, as that creates the database file.
+    """
+    async with (await get_engine()).connect():
+        pass
+
+    settings = get_settings()
+    profile = settings.database_profile
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///file:{settings.database_url}?mode=ro&uri=true",
+        echo=settings.database_echo,
+        future=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=profile.read_pool_size,
+        max_overflow=0,
+    )
+    apply_pragmas(engine.sync_engine, profile, read_only=True)
 
     return engine
 
 
+@alru_cache(maxsize=1)
+async def get_session_factory() -> sessionmaker:
+    """
+    Create the factory for sessions on the writer engine. It is created once, alongside the engine.
+    """
+    return sessionmaker(await get_engine(), class_=AsyncSession, expire_on_commit=False)
+
+
+@alru_cache(maxsize=1)
+async def get_read_session_factory() -> sessionmaker:
+    """
+    Create the factory for sessions on the read-only engine.
+    """
+    return sessionmaker(
+        await get_read_engine(), class_=AsyncSession, expire_on_commit=False
+    )
+
+
 async def get_session() -> AsyncSession:
     """
     Create a temporary session that we can use to query the database.
     """
-    engine = await get_engine()
-    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async_session = await get_session_factory()
+
+    async with async_session() as session:
+        yield session
+
+
+async def get_read_session() -> AsyncSession:
+    """
+    Create a temporary, read-only session. Use it for endpoints that only query, so they never block on the writer.
+    """
+    async_session = await get_read_session_factory()
 
     async with async_session() as session:
         yield session
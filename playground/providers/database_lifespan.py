@@ -0,0 +1,120 @@
+import time
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel
+from starlette.concurrency import run_in_threadpool
+
+from playground.providers.database import get_database_engine
+from playground.providers.database_async import get_engine, get_read_engine
+from playground.providers.settings import get_settings
+
+
+class DatabaseStartupTimings(BaseModel):
+    """
+    How long each step of the database startup took, in seconds. Steps that were skipped are empty.
+    """
+
+    ddl: Optional[float] = None
+    warm_writer: Optional[float] = None
+    warm_reader: Optional[float] = None
+    warm_sync: Optional[float] = None
+    total: float = 0.0
+
+
+startup_timings = DatabaseStartupTimings()
+
+
+async def warm_async_pool(engine: AsyncEngine, size: int):
+    """
+    Open `size` connections and return them to the pool, so requests find them ready.
+
+    Connections are opened one after the other. SQLAlchemy holds a thread lock while the first connection of a pool initializes,
+    which would deadlock the event loop if a second connection is opened concurrently.
+    """
+    connections = []
+
+    for _ in range(size):
+        connection = await engine.connect()
+        await connection.execute(text("SELECT 1"))
+        connections.append(connection)
+
+    for connection in connections:
+        await connection.close()
+
+
+def warm_sync_pool(engine: Engine, size: int):
+    """
+    The blocking version of `warm_async_pool`.
+    """
+    connections = []
+
+    for _ in range(size):
+        connection = engine.connect()
+        connection.execute(text("SELECT 1"))
+        connections.append(connection)
+
+    for connection in connections:
+        connection.close()
+
+
+async def start_database() -> DatabaseStartupTimings:
+    """
+    Create all engines, run the DDL and fill the connection pools. It should run once, before the app takes requests.
+
+    This moves the cost of the first connections and the DDL out of the first request after a deploy.
+    Set `database_skip_ddl` if the tables are managed elsewhere, e.g. by migrations.
+    """
+    global startup_timings
+
+    settings = get_settings()
+    profile = settings.database_profile
+    timings = DatabaseStartupTimings()
+    started = time.perf_counter()
+
+    engine = await get_engine()
+
+    if not settings.database_skip_ddl:
+        step = time.perf_counter()
+
+        async with engine.begin() as conn:
+            # Do not do this with actual databases. This runs the DDL
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+        timings.ddl = time.perf_counter() - step
+
+    if settings.database_warm_pools:
+        step = time.perf_counter()
+        await warm_async_pool(engine, profile.pool_size)
+        timings.warm_writer = time.perf_counter() - step
+
+        step = time.perf_counter()
+        await warm_async_pool(await get_read_engine(), profile.read_pool_size)
+        timings.warm_reader = time.perf_counter() - step
+
+        step = time.perf_counter()
+        await run_in_threadpool(
+            warm_sync_pool, get_database_engine(), profile.pool_size
+        )
+        timings.warm_sync = time.perf_counter() - step
+
+    timings.total = time.perf_counter() - started
+    startup_timings = timings
+
+    return timings
+
+
+async def stop_database():
+    """
+    Close all pooled connections of all engines.
+    """
+    await (await get_engine()).dispose()
+    await (await get_read_engine()).dispose()
+    get_database_engine().dispose()
+
+
+def get_startup_timings() -> DatabaseStartupTimings:
+    return startup_timings
@@ -0,0 +1,157 @@
+import array
+import math
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+from pydantic import BaseModel
+
+from playground.providers.settings import get_settings
+
+
+class DatasetPage(BaseModel):
+    """
+    A page of a `ColumnarDataset`. The data is columnar: every column maps to the values of the rows on this page.
+    """
+
+    page: int
+    page_size: int
+    page_count: int
+    total: int
+    has_next: bool
+    sort: Optional[str]
+    descending: bool
+
+    data: Dict[str, List[float]]
+
+
+class ColumnView:
+    """
+    A zero-copy view on a slice of a column.
+
+    A bare `memoryview` would be encoded as raw bytes by msgpack. Wrapped, every encoder asks for `tolist` instead, which reads the values
+    straight from the column's buffer.
+    """
+
+    __slots__ = ("view",)
+
+    def __init__(self, view: memoryview):
+        self.view = view
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def tolist(self) -> list:
+        return self.view.tolist()
+
+
+class ColumnarDataset:
+    """
+    An immutable, in-memory dataset that stores every column as a typed `array.array`, e.g. 8 bytes per row for an `int64` column,
+    instead of a Python object per value.
+
+    Pages are `memoryview` slices of the columns, so serving one copies nothing until the encoder reads them.
+    Columns in `sort_columns` get a sort index: a copy of all columns ordered by that column, built once. Sorted pages, ascending or
+    descending, are then slices as well, at the cost of storing the dataset once more per index.
+    """
+
+    def __init__(
+        self, columns: Dict[str, array.array], sort_columns: Sequence[str] = ()
+    ):
+        lengths = {len(column) for column in columns.values()}
+
+        if len(lengths) > 1:
+            raise ValueError("All columns must have the same length")
+
+        self.columns = columns
+        self.total = lengths.pop() if lengths else 0
+        self.sorted_columns: Dict[str, Dict[str, array.array]] = {
+            sort: self.create_sort_index(sort) for sort in sort_columns
+        }
+
+    def create_sort_index(self, sort: str) -> Dict[str, array.array]:
+        order = sorted(range(self.total), key=self.columns[sort].__getitem__)
+
+        return {
+            name: array.array(column.typecode, map(column.__getitem__, order))
+            for name, column in self.columns.items()
+        }
+
+    def slice(
+        self, start: int, end: int, sort: Optional[str] = None, descending: bool = False
+    ) -> Dict[str, ColumnView]:
+        """
+        Get rows `start` up to `end` of every column, as zero-copy views.
+        :raises KeyError: When there is no sort index for `sort`.
+        """
+        columns = self.columns if sort is None else self.sorted_columns[sort]
+        start, end = min(start, self.total), min(end, self.total)
+
+        if start >= end:
+            return {
+                name: ColumnView(memoryview(column)[0:0])
+                for name, column in columns.items()
+            }
+
+        if descending:
+            # A negative step walks the same buffer backwards, which is still a view. -1 as a stop would mean the last row, so use None.
+            stop = self.total - end - 1
+
+            return {
+                name: ColumnView(
+                    memoryview(column)[
+                        self.total - start - 1 : stop if stop >= 0 else None : -1
+                    ]
+                )
+                for name, column in columns.items()
+            }
+
+        return {
+            name: ColumnView(memoryview(column)[start:end])
+            for name, column in columns.items()
+        }
+
+    def page(
+        self,
+        page: int,
+        page_size: int,
+        sort: Optional[str] = None,
+        descending: bool = False,
+    ) -> dict:
+        """
+        Get a page as a plain dict shaped like `DatasetPage`, with the column views as its data. Encode it with `NegotiatedResponse`,
+        which writes the views out directly. Validating it as a `DatasetPage` would turn every value into a Python object first.
+        """
+        start = page * page_size
+
+        return {
+            "page": page,
+            "page_size": page_size,
+            "page_count": math.ceil(self.total / page_size),
+            "total": self.total,
+            "has_next": start + page_size < self.total,
+            "sort": sort,
+            "descending": descending,
+            "data": self.slice(start, start + page_size, sort, descending),
+        }
+
+
+def create_example_columns(size: int) -> Dict[str, array.array]:
+    """
+    Generate `size` rows of example data: an id, a pseudo-random value and a bucket.
+    """
+    return {
+        "id": array.array("q", range(size)),
+        "value": array.array("d", ((i * 7919) % 1_000_003 / 1000 for i in range(size))),
+        "bucket": array.array("l", (i % 16 for i in range(size))),
+    }
+
+
+@lru_cache(None)
+def get_example_dataset() -> ColumnarDataset:
+    """
+    Get the example dataset of `pagination_dataset_size` rows, with a sort index on `value`. It is built once, on first use.
+    """
+    return ColumnarDataset(
+        create_example_columns(get_settings().pagination_dataset_size),
+        sort_columns=("value",),
+    )
@@ -0,0 +1,261 @@
+import inspect
+import time
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+import anyio
+import anyio.to_thread
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from playground.providers.metrics import LatencyHistogram, format_labels
+from playground.providers.negotiation import NegotiatedResponse
+from playground.providers.settings import get_settings, ExecutorSettings
+
+T = TypeVar("T")
+
+
+class ExecutorSaturatedError(Exception):
+    """
+    Raised instead of queueing more work on an executor whose queue is full.
+    """
+
+    def __init__(self, executor: str):
+        super().__init__(f"Executor {executor} is saturated. Retry later.")
+        self.executor = executor
+
+
+class ExecutorStatistics(BaseModel):
+    name: str
+    max_workers: int
+    max_queue: int
+    active: int
+    queued: int
+    completed: int
+    rejected: int
+    # Time between submitting a call and a worker thread starting it, in seconds.
+    queue_wait_p50: float
+    queue_wait_p99: float
+
+
+class Executor:
+    """
+    Runs blocking calls on worker threads, at most `max_workers` at a time.
+
+    Calls beyond that wait in a queue. Once `max_queue` calls are waiting, new calls are rejected with an `ExecutorSaturatedError`,
+    instead of piling up until the client times out.
+    """
+
+    def __init__(self, name: str, executor_settings: ExecutorSettings):
+        self.name = name
+        self.settings = executor_settings
+        # anyio can only create a limiter inside an event loop, so it is created on first use.
+        self.limiter: Optional[anyio.CapacityLimiter] = None
+        self.queue_wait = LatencyHistogram()
+        self.completed = 0
+        self.rejected = 0
+
+    def get_limiter(self) -> anyio.CapacityLimiter:
+        if self.limiter is None:
+            self.limiter = anyio.CapacityLimiter(self.settings.max_workers)
+
+        return self.limiter
+
+    async def run(self, func: Callable[..., T], *args: Any, reject: bool = True) -> T:
+        """
+        Call `func` with `args` on a worker thread and wait for its result.
+        :param reject: Reject the call if the queue is full. Disable it for work that must happen regardless, such as cleanup.
+        :raises ExecutorSaturatedError: When the queue is full.
+        """
+        limiter = self.get_limiter()
+
+        if (
+            reject
+            and limiter.available_tokens < 1
+            and limiter.statistics().tasks_waiting >= self.settings.max_queue
+        ):
+            self.rejected += 1
+            raise ExecutorSaturatedError(self.name)
+
+        submitted = time.perf_counter_ns()
+        started = submitted
+
+        def call() -> T:
+            nonlocal started
+            started = time.perf_counter_ns()
+
+            return func(*args)
+
+        try:
+            return await anyio.to_thread.run_sync(call, limiter=limiter)
+        finally:
+            self.queue_wait.record((started - submitted) // 1000)
+            self.completed += 1
+
+    def statistics(self) -> ExecutorStatistics:
+        active = queued = 0
+
+        if self.limiter is not None:
+            statistics = self.limiter.statistics()
+            active, queued = statistics.borrowed_tokens, statistics.tasks_waiting
+
+        return ExecutorStatistics(
+            name=self.name,
+            max_workers=self.settings.max_workers,
+            max_queue=self.settings.max_queue,
+            active=active,
+            queued=queued,
+            completed=self.completed,
+            rejected=self.rejected,
+            queue_wait_p50=self.queue_wait.quantile(0.5) / 1e6,
+            queue_wait_p99=self.queue_wait.quantile(0.99) / 1e6,
+        )
+
+
+class ExecutorRegistry:
+    """
+    Holds the named executors of the application, e.g. `blocking_http`, `database` and `cpu`. They are created on first use.
+    """
+
+    def __init__(self, executors: Dict[str, ExecutorSettings]):
+        self.settings = executors
+        self.executors: Dict[str, Executor] = {}
+
+    def get(self, name: str) -> Executor:
+        if name not in self.executors:
+            self.executors[name] = Executor(
+                name, self.settings.get(name, self.settings["default"])
+            )
+
+        return self.executors[name]
+
+    async def run(
+        self, name: str, func: Callable[..., T], *args: Any, reject: bool = True
+    ) -> T:
+        """
+        Run `func` on the executor called `name`. See `Executor.run`.
+        """
+        return await self.get(name).run(func, *args, reject=reject)
+
+    def statistics(self) -> List[ExecutorStatistics]:
+        return [executor.statistics() for executor in self.executors.values()]
+
+    def render(self) -> str:
+        """
+        Render the queue depth and throughput of every executor in the Prometheus text format.
+        """
+        series = (
+            (
+                "playground_executor_active",
+                "Calls running on a worker thread.",
+                "active",
+            ),
+            (
+                "playground_executor_queued",
+                "Calls waiting for a worker thread.",
+                "queued",
+            ),
+            (
+                "playground_executor_completed_total",
+                "Calls that finished.",
+                "completed",
+            ),
+            (
+                "playground_executor_rejected_total",
+                "Calls rejected because the queue was full.",
+                "rejected",
+            ),
+            (
+                "playground_executor_queue_wait_p99_seconds",
+                "99th percentile of the time calls waited in the queue.",
+                "queue_wait_p99",
+            ),
+        )
+        statistics = self.statistics()
+        lines: List[str] = []
+
+        for name, description, field in series:
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+
+            for executor in statistics:
+                labels = format_labels([("executor", executor.name)])
+                lines.append(f"{name}{{{labels}}} {getattr(executor, field)}")
+
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(None)
+def get_executors() -> ExecutorRegistry:
+    """
+    Get the application wide `ExecutorRegistry`.
+    """
+    return ExecutorRegistry(get_settings().executors)
+
+
+def offload(executor: str):
+    """
+    Run a blocking endpoint or dependency on the named executor, instead of on Starlette's shared thread pool.
+
+    FastAPI runs every sync endpoint and dependency on a single pool of 40 threads, so one slow kind of work can starve all others.
+    Decorated functions become async functions that FastAPI awaits, with the same signature. Generator dependencies become async generators,
+    whose setup and cleanup both run on the executor.
+
+        @router.get("/sync")
+        @offload("blocking_http")
+        def get_sync(client: ScopedClient = Depends(with_http_client)):
+            ...
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+            context_manager = contextmanager(func)
+
+            @wraps(func)
+            async def offloaded_generator(*args, **kwargs):
+                executors = get_executors()
+                manager = context_manager(*args, **kwargs)
+                value = await executors.run(executor, manager.__enter__)
+
+                try:
+                    yield value
+                except Exception as e:
+                    if not await executors.run(
+                        executor,
+                        manager.__exit__,
+                        type(e),
+                        e,
+                        e.__traceback__,
+                        reject=False,
+                    ):
+                        raise
+                else:
+                    await executors.run(
+                        executor, manager.__exit__, None, None, None, reject=False
+                    )
+
+            return offloaded_generator
+
+        @wraps(func)
+        async def offloaded(*args, **kwargs):
+            return await get_executors().run(executor, lambda: func(*args, **kwargs))
+
+        return offloaded
+
+    return decorator
+
+
+async def executor_saturated_exception_handler(
+    request: Request, exc: ExecutorSaturatedError
+) -> Response:
+    """
+    Answer with a 503 when an executor cannot take more work, so the client backs off instead of waiting.
+    """
+    return NegotiatedResponse(
+        {"detail": str(exc)},
+        status_code=HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
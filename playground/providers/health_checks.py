@@ -0,0 +1,250 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import text
+
+from playground.providers.audit_sink import get_audit_sink
+from playground.providers.database_async import get_read_engine
+from playground.providers.executors import get_executors
+from playground.providers.http_clients import get_http_clients
+from playground.providers.settings import get_settings
+
+
+class HealthCheckFailed(Exception):
+    """
+    Raised by a check to report that its dependency is unhealthy.
+    """
+
+
+class HealthCheckResult(BaseModel):
+    name: str
+    healthy: bool
+    # Non-critical checks are reported, but do not make the application unhealthy.
+    critical: bool
+    # The result is too old to trust, e.g. because the check hangs. Stale results count as unhealthy.
+    stale: bool
+    # How long the last check took, in seconds.
+    latency: float
+    checked_at: Optional[datetime]
+    detail: Optional[str]
+
+
+class HealthReport(BaseModel):
+    healthy: bool
+    checks: List[HealthCheckResult]
+
+
+@dataclass
+class HealthCheck:
+    """
+    A registered check. `check` raises to report a failure, and may return a short detail.
+    """
+
+    name: str
+    check: Callable[[], Awaitable[Optional[str]]]
+    critical: bool = True
+    healthy: bool = False
+    latency: float = 0.0
+    checked: float = 0.0
+    checked_at: Optional[datetime] = None
+    detail: Optional[str] = "Not checked yet"
+
+
+class HealthCheckRegistry:
+    """
+    Runs all registered checks every `interval` seconds on a background task and keeps their last result.
+
+    Probes only read those results, so answering one costs no database session, connection or upstream call. A check that takes longer than
+    `timeout` fails, and a result older than `stale_after` seconds counts as unhealthy, so a stuck loop cannot keep reporting success.
+    """
+
+    def __init__(self, interval: float, timeout: float, stale_after: float):
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.checks: Dict[str, HealthCheck] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def register(
+        self,
+        name: str,
+        check: Callable[[], Awaitable[Optional[str]]],
+        critical: bool = True,
+    ):
+        self.checks[name] = HealthCheck(name, check, critical)
+
+    async def run_check(self, health_check: HealthCheck):
+        started = time.perf_counter()
+
+        try:
+            health_check.detail = await asyncio.wait_for(
+                health_check.check(), self.timeout
+            )
+            health_check.healthy = True
+        except asyncio.TimeoutError:
+            health_check.healthy = False
+            health_check.detail = f"Timed out after {self.timeout}s"
+        except Exception as e:
+            health_check.healthy = False
+            health_check.detail = str(e) or type(e).__name__
+
+        health_check.latency = time.perf_counter() - started
+        health_check.checked = time.monotonic()
+        health_check.checked_at = datetime.now()
+
+    async def run_all(self):
+        await asyncio.gather(
+            *(self.run_check(health_check) for health_check in self.checks.values())
+        )
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_all()
+
+    async def start(self):
+        """
+        Run all checks once, so the first probe gets a real answer, and keep running them in the background.
+        """
+        await self.run_all()
+        self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+            self.task = None
+
+    def is_stale(self, health_check: HealthCheck) -> bool:
+        return (
+            health_check.checked_at is None
+            or time.monotonic() - health_check.checked > self.stale_after
+        )
+
+    def is_healthy(self) -> bool:
+        """
+        Check if all critical checks passed recently. Only reads the cached results.
+        """
+        return all(
+            health_check.healthy and not self.is_stale(health_check)
+            for health_check in self.checks.values()
+            if health_check.critical
+        )
+
+    def report(self) -> HealthReport:
+        return HealthReport(
+            healthy=self.is_healthy(),
+            checks=[
+                HealthCheckResult(
+                    name=health_check.name,
+                    healthy=health_check.healthy,
+                    critical=health_check.critical,
+                    stale=self.is_stale(health_check),
+                    latency=health_check.latency,
+                    checked_at=health_check.checked_at,
+                    detail=health_check.detail,
+                )
+                for health_check in self.checks.values()
+            ],
+        )
+
+
+async def check_database() -> Optional[str]:
+    async with (await get_read_engine()).connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+    return None
+
+
+async def check_audit_sink() -> Optional[str]:
+    queued = get_audit_sink().statistics().queued
+    queue_size = get_settings().audit_queue_size
+
+    if queued >= queue_size * 0.9:
+        raise HealthCheckFailed(f"Audit queue is almost full: {queued}/{queue_size}")
+
+    return f"{queued}/{queue_size} queued"
+
+
+async def check_executors() -> Optional[str]:
+    saturated = [
+        statistics.name
+        for statistics in get_executors().statistics()
+        if statistics.queued >= statistics.max_queue
+    ]
+
+    if saturated:
+        raise HealthCheckFailed(f"Saturated executors: {', '.join(saturated)}")
+
+    return None
+
+
+async def check_circuit_breakers() -> Optional[str]:
+    open_circuits = [
+        statistics.upstream
+        for statistics in get_http_clients().resilience_statistics()
+        if statistics.state == "open"
+    ]
+
+    if open_circuits:
+        raise HealthCheckFailed(f"Open circuits: {', '.join(open_circuits)}")
+
+    return None
+
+
+def create_upstream_check(
+    upstream: str, url: str
+) -> Callable[[], Awaitable[Optional[str]]]:
+    """
+    Create a check that an upstream answers a `HEAD` request to `url` without a server error.
+    """
+
+    async def check_upstream() -> Optional[str]:
+        response = await get_http_clients().async_client(upstream).request("HEAD", url)
+
+        if response.status_code >= 500:
+            raise HealthCheckFailed(f"{url} returned {response.status_code}")
+
+        return f"{url} returned {response.status_code}"
+
+    return check_upstream
+
+
+@lru_cache(None)
+def get_health_checks() -> HealthCheckRegistry:
+    """
+    Get the application wide `HealthCheckRegistry`, with the database, audit sink, executor and upstream checks registered.
+
+    Only the database is critical. The others show up in the detailed report, but a slow upstream or a full queue should not take the
+    application out of the load balancer.
+    """
+    settings = get_settings()
+    registry = HealthCheckRegistry(
+        settings.health_check_interval,
+        settings.health_check_timeout,
+        settings.health_check_stale_after,
+    )
+
+    registry.register("database", check_database)
+    registry.register("audit_sink", check_audit_sink, critical=False)
+    registry.register("executors", check_executors, critical=False)
+    registry.register("circuit_breakers", check_circuit_breakers, critical=False)
+
+    for upstream, url in settings.health_check_upstreams.items():
+        registry.register(
+            f"upstream:{upstream}",
+            create_upstream_check(upstream, url),
+            critical=False,
+        )
+
+    return registry
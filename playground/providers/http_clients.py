@@ -0,0 +1,421 @@
+import importlib.util
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from functools import lru_cache
+from typing import Dict, Optional, List, Callable, Awaitable, Any
+
+import httpx
+from pydantic import BaseModel
+
+from playground.providers.metrics import record_upstream_time
+from playground.providers.resilience import (
+    UpstreamResilience,
+    RetryBudget,
+    ResilienceStatistics,
+)
+from playground.providers.settings import get_settings, UpstreamSettings
+
+# The trace events that httpcore emits once a request holds a connection. Anything before them is time spent waiting on the pool.
+CONNECTION_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "connection.connect_unix_socket.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+def cookieless_jar() -> CookieJar:
+    """
+    Get a cookie jar that never stores the cookies of responses. The clients are shared by all users, so a cookie that an upstream sets
+    for one of them must not be sent along with the requests of the others. Cookies passed to a single request are still sent.
+    """
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+class PoolStatistics(BaseModel):
+    """
+    A snapshot of the connection pool of a single upstream.
+    """
+
+    upstream: str
+    kind: str
+    connections: int
+    active: int
+    idle: int
+    waiting: int
+    requests: int
+    wait_time_total: float
+    wait_time_max: float
+
+
+class PoolWaitTimer:
+    """
+    Keeps track of how long requests wait for a connection from the pool. It uses httpcore's `trace` extension.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def start(self) -> Callable[[str, Any], None]:
+        """
+        Start timing a single request.
+        :return: A trace callback that records the wait time when the request gets a connection.
+        """
+        started = time.perf_counter()
+        acquired = False
+
+        def trace(event_name: str, info: Any):
+            nonlocal acquired
+
+            if not acquired and event_name in CONNECTION_ACQUIRED_EVENTS:
+                acquired = True
+                self.record(time.perf_counter() - started)
+
+        self.requests += 1
+
+        return trace
+
+    def astart(self) -> Callable[[str, Any], Awaitable[None]]:
+        """
+        The async version of `start`. httpcore awaits the trace callback of async connection pools.
+        """
+        trace = self.start()
+
+        async def atrace(event_name: str, info: Any):
+            trace(event_name, info)
+
+        return atrace
+
+    def record(self, wait_time: float):
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+
+class ScopedClient:
+    """
+    A lightweight view on a shared `httpx.Client` with headers and response hooks that only apply to this view.
+
+    It is created once per request, so things like the forwarded `Authorization` header never leak between users.
+
+    This client is blocking. It can be used in both regular and async functions. However, it should not be used in async functions due to said blocking.
+    """
+
+    def __init__(
+        self,
+        client: httpx.Client,
+        timer: PoolWaitTimer,
+        resilience: UpstreamResilience,
+        headers: Optional[Dict[str, str]] = None,
+        response_hooks: Optional[List[Callable[[httpx.Response], Any]]] = None,
+    ):
+        self.client = client
+        self.timer = timer
+        self.resilience = resilience
+        self.headers = httpx.Headers(client.headers)
+        self.headers.update(headers or {})
+        self.response_hooks = response_hooks or []
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter_ns()
+
+        try:
+            return self.send_request(method, url, **kwargs)
+        finally:
+            record_upstream_time(time.perf_counter_ns() - started)
+
+    def send_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        headers = httpx.Headers(self.headers)
+        headers.update(kwargs.pop("headers", None) or {})
+
+        request = self.client.build_request(
+            method,
+            url,
+            headers=headers,
+            extensions={"trace": self.timer.start()},
+            **kwargs,
+        )
+        response = self.resilience.send_sync(self.client, request)
+
+        # Redirects are followed here, so the hooks see every response just like httpx event hooks would.
+        for _ in range(self.client.max_redirects + 1):
+            for hook in self.response_hooks:
+                hook(response)
+
+            if not self.client.follow_redirects or response.next_request is None:
+                break
+
+            response = self.resilience.send_sync(self.client, response.next_request)
+
+        return response
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("DELETE", url, **kwargs)
+
+
+class AsyncScopedClient:
+    """
+    A lightweight view on a shared `httpx.AsyncClient`. See `ScopedClient` for details.
+
+    This client is non-blocking. It can only be used in async functions.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        timer: PoolWaitTimer,
+        resilience: UpstreamResilience,
+        headers: Optional[Dict[str, str]] = None,
+        response_hooks: Optional[
+            List[Callable[[httpx.Response], Awaitable[Any]]]
+        ] = None,
+    ):
+        self.client = client
+        self.timer = timer
+        self.resilience = resilience
+        self.headers = httpx.Headers(client.headers)
+        self.headers.update(headers or {})
+        self.response_hooks = response_hooks or []
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter_ns()
+
+        try:
+            return await self.send_request(method, url, **kwargs)
+        finally:
+            record_upstream_time(time.perf_counter_ns() - started)
+
+    async def send_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        headers = httpx.Headers(self.headers)
+        headers.update(kwargs.pop("headers", None) or {})
+
+        request = self.client.build_request(
+            method,
+            url,
+            headers=headers,
+            extensions={"trace": self.timer.astart()},
+            **kwargs,
+        )
+        response = await self.resilience.send(self.client, request)
+
+        # Redirects are followed here, so the hooks see every response just like httpx event hooks would.
+        for _ in range(self.client.max_redirects + 1):
+            for hook in self.response_hooks:
+                await hook(response)
+
+            if not self.client.follow_redirects or response.next_request is None:
+                break
+
+            response = await self.resilience.send(self.client, response.next_request)
+
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+
+class HttpClientRegistry:
+    """
+    Keeps a single, pooled `httpx.Client` and `httpx.AsyncClient` per upstream for the lifetime of the application.
+
+    Re-using the clients re-uses their connections. That saves a TCP and TLS handshake on every outbound request.
+    Clients are created on first use, or up front by `start`. `stop` closes all of them.
+    """
+
+    def __init__(
+        self, upstreams: Dict[str, UpstreamSettings], retry_budget: RetryBudget
+    ):
+        self.upstreams = upstreams
+        self.retry_budget = retry_budget
+        self.clients: Dict[str, httpx.Client] = {}
+        self.async_clients: Dict[str, httpx.AsyncClient] = {}
+        self.timers: Dict[str, PoolWaitTimer] = {}
+        self.resilience: Dict[str, UpstreamResilience] = {}
+
+    def get_upstream_settings(self, upstream: str) -> UpstreamSettings:
+        upstream_settings = self.upstreams.get(upstream) or self.upstreams.get(
+            "default", UpstreamSettings()
+        )
+
+        if upstream_settings.http2 and importlib.util.find_spec("h2") is None:
+            raise RuntimeError(
+                f"Upstream {upstream} uses HTTP/2, which requires the `h2` package. Install `httpx[http2]`."
+            )
+
+        return upstream_settings
+
+    def get_client_kwargs(self, upstream: str) -> Dict[str, Any]:
+        upstream_settings = self.get_upstream_settings(upstream)
+
+        return dict(
+            limits=httpx.Limits(
+                max_connections=upstream_settings.max_connections,
+                max_keepalive_connections=upstream_settings.max_keepalive_connections,
+                keepalive_expiry=upstream_settings.keepalive_expiry,
+            ),
+            http2=upstream_settings.http2,
+            follow_redirects=upstream_settings.follow_redirects,
+            timeout=httpx.Timeout(
+                upstream_settings.timeout, connect=upstream_settings.connect_timeout
+            ),
+            cookies=cookieless_jar(),
+        )
+
+    def get_resilience(self, upstream: str) -> UpstreamResilience:
+        """
+        Get the circuit breaker, retries and coalescing of `upstream`. The sync and async clients of an upstream share them.
+        """
+        if upstream not in self.resilience:
+            self.resilience[upstream] = UpstreamResilience(
+                upstream, self.get_upstream_settings(upstream), self.retry_budget
+            )
+
+        return self.resilience[upstream]
+
+    def client(
+        self,
+        upstream: str = "default",
+        headers: Optional[Dict[str, str]] = None,
+        response_hooks: Optional[List[Callable[[httpx.Response], Any]]] = None,
+    ) -> ScopedClient:
+        """
+        Get a blocking client for `upstream`, with `headers` and `response_hooks` applied to this client only.
+        """
+        if upstream not in self.clients:
+            self.clients[upstream] = httpx.Client(**self.get_client_kwargs(upstream))
+
+        timer = self.timers.setdefault(f"{upstream}:sync", PoolWaitTimer())
+
+        return ScopedClient(
+            self.clients[upstream],
+            timer,
+            self.get_resilience(upstream),
+            headers,
+            response_hooks,
+        )
+
+    def async_client(
+        self,
+        upstream: str = "default",
+        headers: Optional[Dict[str, str]] = None,
+        response_hooks: Optional[
+            List[Callable[[httpx.Response], Awaitable[Any]]]
+        ] = None,
+    ) -> AsyncScopedClient:
+        """
+        Get a non-blocking client for `upstream`, with `headers` and `response_hooks` applied to this client only.
+        """
+        if upstream not in self.async_clients:
+            self.async_clients[upstream] = httpx.AsyncClient(
+                **self.get_client_kwargs(upstream)
+            )
+
+        timer = self.timers.setdefault(f"{upstream}:async", PoolWaitTimer())
+
+        return AsyncScopedClient(
+            self.async_clients[upstream],
+            timer,
+            self.get_resilience(upstream),
+            headers,
+            response_hooks,
+        )
+
+    async def start(self):
+        """
+        Create the clients for all configured upstreams, so the first request does not pay for it.
+        """
+        for upstream in self.upstreams:
+            self.client(upstream)
+            self.async_client(upstream)
+
+    async def stop(self):
+        """
+        Close all clients and their connections, and forget the state of the circuit breakers and caches. Clients will be re-created if
+        they are used again.
+        """
+        for client in self.clients.values():
+            client.close()
+
+        for async_client in self.async_clients.values():
+            await async_client.aclose()
+
+        self.clients.clear()
+        self.async_clients.clear()
+        self.resilience.clear()
+
+    def statistics(self) -> List[PoolStatistics]:
+        """
+        Get a snapshot of every connection pool. Connection counts are read from httpcore and are only available for the default transport.
+        """
+        pools = [("sync", name, client) for name, client in self.clients.items()]
+        pools += [
+            ("async", name, client) for name, client in self.async_clients.items()
+        ]
+
+        statistics = []
+
+        for kind, upstream, client in pools:
+            pool = getattr(client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for connection in connections if connection.is_idle())
+            waiting = sum(
+                1
+                for status in getattr(pool, "_requests", [])
+                if status.connection is None
+            )
+            timer = self.timers.get(f"{upstream}:{kind}", PoolWaitTimer())
+
+            statistics.append(
+                PoolStatistics(
+                    upstream=upstream,
+                    kind=kind,
+                    connections=len(connections),
+                    active=len(connections) - idle,
+                    idle=idle,
+                    waiting=waiting,
+                    requests=timer.requests,
+                    wait_time_total=timer.wait_time_total,
+                    wait_time_max=timer.wait_time_max,
+                )
+            )
+
+        return statistics
+
+    def resilience_statistics(self) -> List[ResilienceStatistics]:
+        return [resilience.statistics() for resilience in self.resilience.values()]
+
+
+@lru_cache(None)
+def get_http_clients() -> HttpClientRegistry:
+    """
+    Get the application wide `HttpClientRegistry`.
+
+    @lru_cache ensures that there is only a single registry, and thus a single set of connection pools.
+    """
+    settings = get_settings()
+
+    return HttpClientRegistry(
+        settings.http_upstreams,
+        RetryBudget(
+            settings.http_retry_budget_ratio, settings.http_retry_budget_minimum
+        ),
+    )
@@ -0,0 +1,366 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from playground.providers.shared_store import SharedStoreError, get_shared_store
+
+# The quantiles that are exported for every latency histogram.
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    An HDR-style histogram of durations in microseconds.
+
+    Values are counted in buckets of `2 ** significant_bits` linear steps per power of two, so every value is stored with a relative error below
+    `1 / 2 ** significant_bits`, no matter how large it is. Recording is a couple of integer operations and a dict increment.
+    """
+
+    def __init__(self, significant_bits: int = 5):
+        self.significant_bits = significant_bits
+        self.sub_buckets = 1 << significant_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+
+    def bucket_index(self, value: int) -> int:
+        if value < 2 * self.sub_buckets:
+            return value
+
+        exponent = value.bit_length() - self.significant_bits - 1
+
+        return exponent * self.sub_buckets + (value >> exponent)
+
+    def bucket_upper_bound(self, index: int) -> int:
+        if index < 2 * self.sub_buckets:
+            return index
+
+        exponent = index // self.sub_buckets - 1
+        mantissa = index - exponent * self.sub_buckets
+
+        return ((mantissa + 1) << exponent) - 1
+
+    def record(self, value: int):
+        """
+        Record a single duration, in microseconds.
+        """
+        index = self.bucket_index(value)
+
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, quantile: float) -> int:
+        """
+        Get the value that `quantile` of all recorded values are at or below, in microseconds.
+        """
+        if not self.count:
+            return 0
+
+        rank = max(1, round(quantile * self.count))
+        seen = 0
+
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+
+            if seen >= rank:
+                return self.bucket_upper_bound(index)
+
+        return self.bucket_upper_bound(max(self.counts))
+
+
+@dataclass
+class RequestTimings:
+    """
+    What a single request spent its time and bytes on. Durations are in nanoseconds.
+    """
+
+    started: int = field(default_factory=time.perf_counter_ns)
+    database: int = 0
+    upstream: int = 0
+    body_size: int = 0
+    sent_size: int = 0
+
+
+@dataclass
+class RouteMetrics:
+    """
+    The aggregated `RequestTimings` of all requests to a single route.
+    """
+
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    responses: Dict[str, int] = field(default_factory=dict)
+    database: int = 0
+    upstream: int = 0
+    body_size: int = 0
+    sent_size: int = 0
+
+
+# The timings of the request that is currently handled. The context is copied into threadpools, greenlets and tasks, so everything the request
+# does can add to it.
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "current_timings", default=None
+)
+
+
+def record_database_time(duration: int):
+    if (timings := current_timings.get()) is not None:
+        timings.database += duration
+
+
+def record_upstream_time(duration: int):
+    if (timings := current_timings.get()) is not None:
+        timings.upstream += duration
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter_ns()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_database_time(time.perf_counter_ns() - context.metrics_started)
+
+
+def instrument_database():
+    """
+    Time every statement of every engine, and add it to the database time of the current request. Calling this more than once is a no-op.
+    """
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+
+class MetricsRegistry:
+    """
+    Collects the timings of all requests, per route, and renders them in the Prometheus text format.
+
+    It is only ever updated from the event loop, when a request finishes, so it needs no locking.
+    """
+
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.in_flight = 0
+
+    def start(self) -> RequestTimings:
+        self.in_flight += 1
+
+        return RequestTimings()
+
+    def finish(self, method: str, route: str, status: int, timings: RequestTimings):
+        self.in_flight -= 1
+
+        metrics = self.routes.get((method, route))
+
+        if metrics is None:
+            metrics = self.routes[(method, route)] = RouteMetrics()
+
+        metrics.latency.record((time.perf_counter_ns() - timings.started) // 1000)
+        metrics.responses[str(status)] = metrics.responses.get(str(status), 0) + 1
+        metrics.database += timings.database
+        metrics.upstream += timings.upstream
+        metrics.body_size += timings.body_size
+        metrics.sent_size += timings.sent_size
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        lines: List[str] = [
+            "# HELP playground_requests_in_flight Requests that are currently being handled.",
+            "# TYPE playground_requests_in_flight gauge",
+            f"playground_requests_in_flight {self.in_flight}",
+            "# HELP playground_request_duration_seconds Time until the response was fully sent.",
+            "# TYPE playground_request_duration_seconds summary",
+        ]
+        routes = sorted(self.routes.items())
+
+        for (method, route), metrics in routes:
+            labels = format_labels([("method", method), ("route", route)])
+
+            for quantile in QUANTILES:
+                value = metrics.latency.quantile(quantile) / 1e6
+                lines.append(
+                    f'playground_request_duration_seconds{{{labels},quantile="{quantile}"}} {value}'
+                )
+
+            lines.append(
+                f"playground_request_duration_seconds_sum{{{labels}}} {metrics.latency.total / 1e6}"
+            )
+            lines.append(
+                f"playground_request_duration_seconds_count{{{labels}}} {metrics.latency.count}"
+            )
+
+        lines += [
+            "# HELP playground_responses_total Responses sent, by status code.",
+            "# TYPE playground_responses_total counter",
+        ]
+
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.responses.items()):
+                labels = format_labels(
+                    [("method", method), ("route", route), ("status", status)]
+                )
+                lines.append(f"playground_responses_total{{{labels}}} {count}")
+
+        counters = (
+            (
+                "playground_request_database_seconds_total",
+                "Time spent executing database statements.",
+                lambda metrics: metrics.database / 1e9,
+            ),
+            (
+                "playground_request_upstream_seconds_total",
+                "Time spent waiting on upstream HTTP requests.",
+                lambda metrics: metrics.upstream / 1e9,
+            ),
+            (
+                "playground_response_body_bytes_total",
+                "Response body bytes as produced by the endpoint, before compression.",
+                lambda metrics: metrics.body_size,
+            ),
+            (
+                "playground_response_sent_bytes_total",
+                "Response body bytes as sent to the client, after compression.",
+                lambda metrics: metrics.sent_size,
+            ),
+        )
+
+        for name, description, value in counters:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+
+            for (method, route), metrics in routes:
+                labels = format_labels([("method", method), ("route", route)])
+                lines.append(f"{name}{{{labels}}} {value(metrics)}")
+
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(None)
+def get_metrics() -> MetricsRegistry:
+    """
+    Get the application wide `MetricsRegistry`.
+    """
+    return MetricsRegistry()
+
+
+def add_worker_label(line: str, worker: str) -> str:
+    name_end = line.find(" ")
+    labels_start = line.find("{", 0, name_end)
+
+    if labels_start == -1:
+        return f'{line[:name_end]}{{worker="{worker}"}}{line[name_end:]}'
+
+    separator = "" if line[labels_start + 1] == "}" else ","
+
+    return f'{line[:labels_start + 1]}worker="{worker}"{separator}{line[labels_start + 1:]}'
+
+
+def merge_worker_metrics(renders: Dict[str, str]) -> str:
+    """
+    Merge the metrics that several workers rendered into a single exposition, with a `worker` label on every sample.
+
+    The `HELP` and `TYPE` lines of every metric are written once, followed by the samples of all workers.
+    """
+    headers: Dict[str, List[str]] = {}
+    samples: Dict[str, List[str]] = {}
+
+    for worker, rendered in sorted(renders.items()):
+        name = ""
+
+        for line in rendered.splitlines():
+            if line.startswith("# "):
+                name = line.split(" ", 3)[2]
+                family = headers.setdefault(name, [])
+
+                if line not in family:
+                    family.append(line)
+            elif line:
+                samples.setdefault(name, []).append(add_worker_label(line, worker))
+
+    lines: List[str] = []
+
+    for name in dict.fromkeys([*headers, *samples]):
+        lines += headers.get(name, []) + samples.get(name, [])
+
+    return "\n".join(lines) + "\n"
+
+
+class WorkerMetricsPublisher:
+    """
+    Publishes the metrics of this worker to the shared store every `interval` seconds, so any worker can answer a scrape for all of them.
+
+    Published metrics expire after three intervals, so workers that stopped drop out of the scrapes. Without a shared store, this process
+    only reports its own metrics.
+    """
+
+    def __init__(self, render: Callable[[], str], interval: float):
+        self.render = render
+        self.interval = interval
+        self.key = f"metrics:{os.getpid()}"
+        self.task: Optional[asyncio.Task] = None
+
+    async def publish(self):
+        store = get_shared_store()
+
+        if store is not None:
+            await store.set(self.key, self.render(), self.interval * 3)
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.publish()
+            except SharedStoreError:
+                pass
+
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if get_shared_store() is not None:
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+            self.task = None
+
+    async def collect(self) -> str:
+        """
+        Render the metrics of all workers, with those of this worker up to date. Falls back to this worker alone if the store is unreachable.
+        """
+        rendered = self.render()
+        store = get_shared_store()
+
+        if store is None:
+            return rendered
+
+        try:
+            renders = await store.scan("metrics:")
+        except SharedStoreError:
+            return rendered
+
+        renders[self.key] = rendered
+
+        return merge_worker_metrics(
+            {key.split(":", 1)[1]: value for key, value in renders.items()}
+        )
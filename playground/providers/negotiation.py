@@ -0,0 +1,386 @@
+import asyncio
+import importlib.util
+from dataclasses import dataclass
+from datetime import date
+from functools import wraps
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import msgpack
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute, serialize_response
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.status import HTTP_422_UNPROCESSABLE_ENTITY
+from starlette.types import Receive, Scope, Send
+
+from playground.providers.settings import get_settings
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    Encodes Python objects to a media type, and decodes them again.
+    """
+
+    media_type: str
+    encode: Callable[[Any], bytes]
+    decode: Callable[[bytes], Any]
+
+
+def encode_default(value: Any) -> Any:
+    """
+    Encode what the encoders do not support natively: the column views of a `ColumnarDataset` as a list, pydantic models, such as the
+    return values of `trusted_response` endpoints, as a dict, and dates as ISO 8601 strings, like FastAPI's validation would.
+    """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+
+    if isinstance(value, date):
+        return value.isoformat()
+
+    if isinstance(value, BaseModel):
+        return value.dict(by_alias=True)
+
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+JSON_CODEC = Codec(
+    "application/json",
+    # The same options as FastAPI's `ORJSONResponse`.
+    lambda content: orjson.dumps(
+        content,
+        default=encode_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+    ),
+    orjson.loads,
+)
+MSGPACK_CODEC = Codec(
+    "application/x-msgpack",
+    lambda content: msgpack.packb(content, default=encode_default),
+    lambda body: msgpack.unpackb(body, raw=False),
+)
+
+
+def create_codecs() -> Dict[str, Codec]:
+    """
+    Map every supported media type to its codec. CBOR is only supported if the optional `cbor2` package is installed.
+    """
+    codecs = {
+        "application/json": JSON_CODEC,
+        "application/x-msgpack": MSGPACK_CODEC,
+        "application/msgpack": MSGPACK_CODEC,
+        "application/vnd.msgpack": MSGPACK_CODEC,
+    }
+
+    if importlib.util.find_spec("cbor2") is not None:
+        import cbor2
+
+        codecs["application/cbor"] = Codec(
+            "application/cbor",
+            lambda content: cbor2.dumps(
+                content,
+                default=lambda encoder, value: encoder.encode(encode_default(value)),
+            ),
+            cbor2.loads,
+        )
+
+    return codecs
+
+
+CODECS = create_codecs()
+
+
+def parse_accept(accept: str) -> List[Tuple[str, float]]:
+    """
+    Parse an `Accept` header into media types and their quality, best first.
+    """
+    media_types = []
+
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = part.strip().split(";")
+        quality = 1.0
+
+        for param in params:
+            name, _, value = param.strip().partition("=")
+
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if media_type:
+            media_types.append((media_type.strip().lower(), quality, position))
+
+    media_types.sort(key=lambda item: (-item[1], item[2]))
+
+    return [(media_type, quality) for media_type, quality, _ in media_types]
+
+
+def select_codec(accept: Optional[str]) -> Codec:
+    """
+    Get the codec for the most preferred media type in `accept` that we support. Falls back to JSON.
+    """
+    for media_type, quality in parse_accept(accept or ""):
+        if quality > 0 and media_type in CODECS:
+            return CODECS[media_type]
+
+    return JSON_CODEC
+
+
+def get_content_codec(content_type: Optional[str]) -> Optional[Codec]:
+    """
+    Get the codec for a `Content-Type` header, without its parameters.
+    """
+    if not content_type:
+        return None
+
+    return CODECS.get(content_type.split(";")[0].strip().lower())
+
+
+class NegotiatedResponse(Response):
+    """
+    A response that encodes its content straight to the format the client asked for in its `Accept` header: JSON, msgpack or CBOR.
+
+    Encoding is postponed until the format is known, either when `negotiate` is called or when the response is sent.
+    The content is encoded once, from the Python objects, instead of encoding JSON first and converting that in a middleware.
+    """
+
+    media_type = JSON_CODEC.media_type
+
+    def __init__(
+        self,
+        content: Any = None,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        background: Optional[BackgroundTask] = None,
+    ) -> None:
+        self.content = content
+        self.status_code = status_code
+        self.background = background
+        self.body: Optional[bytes] = None  # type: ignore
+        self.codec: Optional[Codec] = (
+            get_content_codec(media_type) if media_type else None
+        )
+        # Without a body and media type, `init_headers` leaves out the content length and type. `negotiate` adds them.
+        self.media_type = None  # type: ignore
+        self.init_headers(headers)
+
+    def negotiate(self, accept: Optional[str]):
+        """
+        Encode the content for the given `Accept` header. Does nothing if the content is already encoded.
+        """
+        if self.body is not None:
+            return
+
+        codec = self.codec or select_codec(accept)
+        self.body = codec.encode(self.content)
+        self.media_type = codec.media_type
+
+        headers = self.headers
+
+        if "content-type" not in headers:
+            headers["content-type"] = codec.media_type
+
+        if "content-length" not in headers and not (
+            self.status_code < 200 or self.status_code in (204, 304)
+        ):
+            headers["content-length"] = str(len(self.body))
+
+        headers.add_vary_header("Accept")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.negotiate(Headers(scope=scope).get("accept"))
+        await super().__call__(scope, receive, send)
+
+
+class TrustedResponse(NegotiatedResponse):
+    """
+    The return value of a `trusted_response` endpoint, encoded without validating it against the route's `response_model` first.
+    """
+
+
+class TrustedResponseMismatch(Exception):
+    """
+    Raised when `trusted_response_verify` is on and a trusted response differs from what FastAPI's validation would have returned.
+    """
+
+
+def trusted_response(
+    enabled: bool = True,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Mark an endpoint's return value as trusted. Only has an effect on routers that use `NegotiatedRoute`, or a subclass, as their `route_class`.
+
+    FastAPI validates every return value against the `response_model`, which copies all data and runs it through `jsonable_encoder`.
+    Only trust endpoints that already return the declared model, or rows of a query that selects it. Those are encoded straight from the
+    objects, while the `response_model` still documents the endpoint in the OpenAPI schema.
+
+    Turn on `trusted_response_verify` to check every trusted response against the validated one, e.g. in tests.
+    """
+
+    def decorator(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+        endpoint.trusted_response = enabled  # type: ignore
+        return endpoint
+
+    return decorator
+
+
+class DecodedRequest(Request):
+    """
+    A request whose msgpack or CBOR body is presented to FastAPI as JSON.
+
+    FastAPI only parses bodies with a JSON content type, with `Request.json`. This request claims to be JSON and decodes the body with the
+    codec of its original content type instead, so the body is decoded straight to Python objects, once.
+    """
+
+    def __init__(self, request: Request, codec: Codec):
+        headers = [
+            (name, value)
+            for name, value in request.scope["headers"]
+            if name != b"content-type"
+        ]
+        headers.append((b"content-type", JSON_CODEC.media_type.encode()))
+
+        super().__init__({**request.scope, "headers": headers}, request.receive)
+        self.codec = codec
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = self.codec.decode(await self.body())
+
+        return self._json
+
+
+class NegotiatedRoute(APIRoute):
+    """
+    A route that decodes request bodies and encodes `NegotiatedResponse` content in the formats the client uses.
+
+    Routes that read the request themselves, without a declared body, get the request untouched.
+    Endpoints marked with `trusted_response` skip the validation of their return value.
+    """
+
+    def create_trusted_call(self) -> Callable[..., Any]:
+        """
+        Wrap the endpoint, so it returns a `TrustedResponse`. FastAPI returns `Response` objects as they are, without validating them.
+        """
+        endpoint = self.endpoint
+        status_code = self.status_code or 200
+
+        def respond(content: Any) -> Any:
+            if isinstance(content, Response):
+                return content
+
+            return TrustedResponse(content, status_code=status_code)
+
+        if asyncio.iscoroutinefunction(endpoint):
+
+            @wraps(endpoint)
+            async def trusted_async_call(**values):
+                return respond(await endpoint(**values))
+
+            return trusted_async_call
+
+        @wraps(endpoint)
+        def trusted_call(**values):
+            return respond(endpoint(**values))
+
+        return trusted_call
+
+    async def verify_trusted_response(self, response: TrustedResponse):
+        """
+        Check that a trusted response encodes to the same content as the validated return value would, in every supported format.
+        :raises TrustedResponseMismatch: When they differ.
+        :raises pydantic.ValidationError: When the return value does not match the `response_model` at all.
+        """
+        validated = await serialize_response(
+            field=self.secure_cloned_response_field,
+            response_content=response.content,
+            by_alias=self.response_model_by_alias,
+            is_coroutine=True,
+        )
+        # Every codec encodes the trusted response on its own, so check them all, not just the one the client asked for.
+        for codec in {codec.media_type: codec for codec in CODECS.values()}.values():
+            expected = codec.decode(codec.encode(validated))
+            actual = codec.decode(codec.encode(response.content))
+
+            if actual != expected:
+                raise TrustedResponseMismatch(
+                    f"The {codec.media_type} encoding of the trusted response of {self.path} differs from the validated response: "
+                    f"{actual!r} != {expected!r}"
+                )
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        trusted = getattr(self.endpoint, "trusted_response", False)
+
+        if trusted:
+            if (
+                self.response_model_include
+                or self.response_model_exclude
+                or self.response_model_exclude_unset
+                or self.response_model_exclude_defaults
+                or self.response_model_exclude_none
+            ):
+                raise ValueError(
+                    f"{self.path} filters its response model, so its responses cannot be trusted"
+                )
+
+            self.dependant.call = self.create_trusted_call()
+
+        handler = super().get_route_handler()
+        has_body = self.body_field is not None
+
+        async def negotiated_handler(request: Request) -> Response:
+            if has_body:
+                codec = get_content_codec(request.headers.get("content-type"))
+
+                if codec is not None and codec is not JSON_CODEC:
+                    request = DecodedRequest(request, codec)
+
+            response = await handler(request)
+
+            if (
+                trusted
+                and isinstance(response, TrustedResponse)
+                and get_settings().trusted_response_verify
+            ):
+                await self.verify_trusted_response(response)
+
+            if isinstance(response, NegotiatedResponse):
+                response.negotiate(request.headers.get("accept"))
+
+            return response
+
+        return negotiated_handler
+
+
+async def http_exception_handler(
+    request: Request, exc: StarletteHTTPException
+) -> Response:
+    """
+    FastAPI's default `HTTPException` handler, with the error encoded in the negotiated format.
+    """
+    return NegotiatedResponse(
+        {"detail": exc.detail},
+        status_code=exc.status_code,
+        headers=getattr(exc, "headers", None),
+    )
+
+
+async def request_validation_exception_handler(
+    request: Request, exc: RequestValidationError
+) -> Response:
+    """
+    FastAPI's default validation error handler, with the errors encoded in the negotiated format.
+    """
+    return NegotiatedResponse(
+        {"detail": jsonable_encoder(exc.errors())},
+        status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+    )
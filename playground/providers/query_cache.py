@@ -0,0 +1,206 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Hashable, List, Optional
+
+from pydantic import BaseModel
+
+from playground.providers.shared_store import SharedStoreError, get_shared_store
+
+# Other workers replay at most this many writes. After more writes than that, their cache is cleared instead.
+MAX_REPLAYED_WRITES = 1000
+
+
+def normalize_date(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Drop the timezone of a date, like SQLite does when it stores or compares one, so equal filters get equal keys.
+    """
+    return value.replace(tzinfo=None) if value is not None else None
+
+
+@dataclass
+class QueryCacheEntry:
+    rows: List[Any]
+    # The dates the query read. `None` is unbounded.
+    time_from: Optional[datetime]
+    time_to: Optional[datetime]
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        return (self.time_to is None or start <= self.time_to) and (
+            self.time_from is None or end >= self.time_from
+        )
+
+
+class QueryCacheStatistics(BaseModel):
+    entries: int
+    rows: int
+    hits: int
+    misses: int
+    invalidated: int
+
+
+class QueryCache:
+    """
+    An LRU cache of the rows of queries that filter on a date range. Memory is bounded by the total amount of cached rows, `max_rows`.
+
+    Every entry remembers the range it read. A write only evicts the entries whose range covers a date it wrote, so entries of other ranges
+    survive it. With a shared store, every write is published to the other workers, which replay it before their next lookup.
+    """
+
+    def __init__(self, name: str, max_rows: int):
+        self.name = name
+        self.max_rows = max_rows
+        self.entries: OrderedDict[Hashable, QueryCacheEntry] = OrderedDict()
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        # Bumped by every invalidation. Rows read before an invalidation may be stale, so they are not stored.
+        self.generation = 0
+        # The last write of the shared store that this worker replayed. `None` until it first looked.
+        self.replayed: Optional[int] = None
+
+    def get(self, key: Hashable) -> Optional[List[Any]]:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return entry.rows
+
+    def put(
+        self,
+        key: Hashable,
+        rows: List[Any],
+        time_from: Optional[datetime],
+        time_to: Optional[datetime],
+        generation: int,
+    ):
+        """
+        Store the rows of a query that read the dates `time_from` up to `time_to`.
+        :param generation: The `generation` of the cache before the query ran.
+        """
+        if generation != self.generation or len(rows) > self.max_rows:
+            return
+
+        self.remove(key)
+
+        self.entries[key] = QueryCacheEntry(
+            rows, normalize_date(time_from), normalize_date(time_to)
+        )
+        self.rows += len(rows)
+
+        while self.rows > self.max_rows:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key: Hashable):
+        entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            self.rows -= len(entry.rows)
+
+    def invalidate(self, start: datetime, end: datetime) -> int:
+        """
+        Evict every entry whose range overlaps the dates `start` up to `end` of a write.
+        :return: The amount of evicted entries.
+        """
+        start, end = normalize_date(start), normalize_date(end)
+        keys = [
+            key for key, entry in self.entries.items() if entry.overlaps(start, end)
+        ]
+
+        for key in keys:
+            self.remove(key)
+
+        self.generation += 1
+        self.invalidated += len(keys)
+
+        return len(keys)
+
+    def clear(self):
+        self.entries.clear()
+        self.rows = 0
+        self.generation += 1
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @property
+    def sequence_key(self) -> str:
+        return f"query_cache:{self.name}:writes"
+
+    def write_key(self, sequence: int) -> str:
+        return f"query_cache:{self.name}:write:{sequence}"
+
+    async def publish(self, start: datetime, end: datetime):
+        """
+        Evict the entries that a write of the dates `start` up to `end` changed, here and in every other worker.
+        """
+        self.invalidate(start, end)
+        store = get_shared_store()
+
+        if store is None:
+            return
+
+        try:
+            sequence = await store.incr(self.sequence_key)
+            await store.set(
+                self.write_key(sequence),
+                [normalize_date(start).isoformat(), normalize_date(end).isoformat()],
+                ttl=3600,
+            )
+        except SharedStoreError:
+            # Other workers cannot reach the store either, and skip their caches until they can.
+            pass
+
+    async def sync(self) -> bool:
+        """
+        Replay the writes that other workers published since the last sync.
+        :return: If the cache can be used. It cannot when the shared store is unreachable.
+        """
+        store = get_shared_store()
+
+        if store is None:
+            return True
+
+        try:
+            sequence = await store.get(self.sequence_key) or 0
+
+            # A lower sequence means the store was restarted and lost the writes.
+            if (
+                self.replayed is None
+                or sequence < self.replayed
+                or sequence - self.replayed > MAX_REPLAYED_WRITES
+            ):
+                writes: List[Any] = [None]
+            else:
+                writes = await store.get_many(
+                    [self.write_key(n) for n in range(self.replayed + 1, sequence + 1)]
+                )
+        except SharedStoreError:
+            return False
+
+        for write in writes:
+            if write is None:
+                # The write expired or is not stored yet, so any entry could be stale.
+                self.clear()
+                break
+
+            self.invalidate(*map(datetime.fromisoformat, write))
+
+        self.replayed = sequence
+
+        return True
+
+    def statistics(self) -> QueryCacheStatistics:
+        return QueryCacheStatistics(
+            entries=len(self.entries),
+            rows=self.rows,
+            hits=self.hits,
+            misses=self.misses,
+            invalidated=self.invalidated,
+        )
@@ -0,0 +1,477 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from playground.providers.negotiation import NegotiatedResponse
+from playground.providers.settings import UpstreamSettings
+
+# Only these methods are retried. Retrying anything else could apply a change twice.
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# Responses that mean the upstream is temporarily unavailable. Other 5xx responses are returned right away.
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+    """
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(
+            f"The circuit breaker of upstream {upstream} is open. Retry in {retry_after:.1f}s."
+        )
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class ResilienceStatistics(BaseModel):
+    upstream: str
+    state: str
+    failures: int
+    requests: int
+    retries: int
+    rejected: int
+    coalesced: int
+    cache_hits: int
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after `failure_threshold` failures in a row, and lets it recover.
+
+    - `closed`: all calls go through.
+    - `open`: all calls are rejected, until `reset_timeout` seconds have passed.
+    - `half_open`: up to `half_open_probes` calls go through. A success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(
+        self, failure_threshold: int, reset_timeout: float, half_open_probes: int = 1
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def allow(self) -> bool:
+        """
+        Check if a call may go through. Every allowed call must end with `record_success`, `record_failure` or `release`.
+        """
+        with self.lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+
+                self.state = "half_open"
+                self.probes = 0
+
+            if self.state == "half_open":
+                if self.probes >= self.half_open_probes:
+                    return False
+
+                self.probes += 1
+
+            return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        End a call that neither succeeded nor failed, e.g. because it was cancelled.
+        """
+        with self.lock:
+            if self.state == "half_open":
+                self.probes = max(0, self.probes - 1)
+
+
+class RetryBudget:
+    """
+    Limits retries to `ratio` of the requests of the last `window` seconds, plus `minimum_per_second`.
+
+    Retries help with the occasional failure, but multiply the load on an upstream that is already struggling. The budget keeps that bounded.
+    """
+
+    def __init__(self, ratio: float, minimum_per_second: float, window: float = 10.0):
+        self.ratio = ratio
+        self.minimum_per_second = minimum_per_second
+        self.window = window
+
+        self.lock = threading.Lock()
+        self.requests: Deque[float] = deque()
+        self.retries: Deque[float] = deque()
+
+    def expire(self, now: float):
+        for timestamps in (self.requests, self.retries):
+            while timestamps and timestamps[0] <= now - self.window:
+                timestamps.popleft()
+
+    def deposit(self):
+        """
+        Record a request. Every request adds `ratio` retries to the budget.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.expire(now)
+            self.requests.append(now)
+
+    def withdraw(self) -> bool:
+        """
+        Take a retry from the budget.
+        :return: If the retry is allowed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.expire(now)
+            budget = self.minimum_per_second * self.window + self.ratio * len(
+                self.requests
+            )
+
+            if len(self.retries) >= budget:
+                return False
+
+            self.retries.append(now)
+
+            return True
+
+
+class ResponseTtlCache:
+    """
+    Keeps successful responses for `ttl` seconds, up to `max_entries` of them.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[
+            Hashable, Tuple[float, httpx.Response]
+        ] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[httpx.Response]:
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+
+            return entry[1]
+
+    def store(self, key: Hashable, response: httpx.Response):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, response)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into a single call. Everyone waiting on the key gets its result, or its exception.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, asyncio.Future] = {}
+        self.sync_calls: Dict[Hashable, Tuple[threading.Event, Dict[str, Any]]] = {}
+
+    async def run(
+        self, key: Hashable, call: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        :return: The result of the call, and if it came from another caller.
+        """
+        future = self.calls.get(key)
+
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = self.calls[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            result = await call()
+            future.set_result(result)
+
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Only the waiting callers should see the exception, not the event loop's exception handler.
+            future.exception()
+            raise
+        finally:
+            del self.calls[key]
+
+    def run_sync(self, key: Hashable, call: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        The blocking version of `run`, for calls made from worker threads.
+        """
+        with self.lock:
+            waiting = self.sync_calls.get(key)
+
+            if waiting is None:
+                event, outcome = self.sync_calls[key] = (threading.Event(), {})
+
+        if waiting is not None:
+            event, outcome = waiting
+            event.wait()
+
+            if "error" in outcome:
+                raise outcome["error"]
+
+            return outcome["result"], True
+
+        try:
+            outcome["result"] = call()
+
+            return outcome["result"], False
+        except BaseException as e:
+            outcome["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.sync_calls[key]
+
+            event.set()
+
+
+class UpstreamResilience:
+    """
+    Wraps the calls to a single upstream in a circuit breaker, jittered retries under a shared `RetryBudget`, and coalescing and caching of GETs.
+
+    Requests are keyed by their method, URL and headers. Requests on behalf of different users, with a different `Authorization` header,
+    are never coalesced or cached together.
+    """
+
+    def __init__(
+        self, upstream: str, upstream_settings: UpstreamSettings, budget: RetryBudget
+    ):
+        self.upstream = upstream
+        self.settings = upstream_settings
+        self.budget = budget
+        self.breaker = CircuitBreaker(
+            upstream_settings.breaker_failure_threshold,
+            upstream_settings.breaker_reset_timeout,
+            upstream_settings.breaker_half_open_probes,
+        )
+        self.cache = ResponseTtlCache(upstream_settings.cache_ttl)
+        self.single_flight = SingleFlight()
+
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def get_key(self, request: httpx.Request) -> Optional[Hashable]:
+        if request.method != "GET":
+            return None
+
+        return str(request.url), tuple(sorted(request.headers.multi_items()))
+
+    def get_backoff(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter, so retries of many callers do not arrive at the same time.
+        """
+        return random.uniform(0, self.settings.retry_backoff * 2**attempt)
+
+    def may_retry(self, request: httpx.Request, attempt: int) -> bool:
+        if attempt >= self.settings.retries or request.method not in IDEMPOTENT_METHODS:
+            return False
+
+        if not self.budget.withdraw():
+            return False
+
+        self.retries += 1
+
+        return True
+
+    def before_attempt(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(self.upstream, self.breaker.retry_after())
+
+    def after_response(self, response: httpx.Response):
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    async def send_with_retries(
+        self, client: httpx.AsyncClient, request: httpx.Request
+    ) -> httpx.Response:
+        self.budget.deposit()
+        attempt = 0
+
+        while True:
+            self.before_attempt()
+
+            try:
+                response = await client.send(request, follow_redirects=False)
+            except httpx.TransportError:
+                self.breaker.record_failure()
+
+                if not self.may_retry(request, attempt):
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.after_response(response)
+
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or not self.may_retry(request, attempt)
+                ):
+                    return response
+
+                await response.aclose()
+
+            await asyncio.sleep(self.get_backoff(attempt))
+            attempt += 1
+
+    def send_with_retries_sync(
+        self, client: httpx.Client, request: httpx.Request
+    ) -> httpx.Response:
+        """
+        The blocking version of `send_with_retries`.
+        """
+        self.budget.deposit()
+        attempt = 0
+
+        while True:
+            self.before_attempt()
+
+            try:
+                response = client.send(request, follow_redirects=False)
+            except httpx.TransportError:
+                self.breaker.record_failure()
+
+                if not self.may_retry(request, attempt):
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.after_response(response)
+
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or not self.may_retry(request, attempt)
+                ):
+                    return response
+
+                response.close()
+
+            time.sleep(self.get_backoff(attempt))
+            attempt += 1
+
+    def store(self, key: Hashable, response: httpx.Response, shared: bool):
+        if shared:
+            self.coalesced += 1
+        elif self.settings.cache_ttl and response.is_success:
+            self.cache.store(key, response)
+
+    async def send(
+        self, client: httpx.AsyncClient, request: httpx.Request
+    ) -> httpx.Response:
+        """
+        Send `request` with `client`, through the circuit breaker, retries, coalescing and cache.
+        :raises CircuitOpenError: When the upstream's circuit breaker is open.
+        """
+        self.requests += 1
+        key = self.get_key(request)
+
+        if key is None or not self.settings.coalesce:
+            return await self.send_with_retries(client, request)
+
+        if (cached := self.cache.get(key)) is not None:
+            self.cache_hits += 1
+            return cached
+
+        response, shared = await self.single_flight.run(
+            key, lambda: self.send_with_retries(client, request)
+        )
+        self.store(key, response, shared)
+
+        return response
+
+    def send_sync(self, client: httpx.Client, request: httpx.Request) -> httpx.Response:
+        """
+        The blocking version of `send`.
+        """
+        self.requests += 1
+        key = self.get_key(request)
+
+        if key is None or not self.settings.coalesce:
+            return self.send_with_retries_sync(client, request)
+
+        if (cached := self.cache.get(key)) is not None:
+            self.cache_hits += 1
+            return cached
+
+        response, shared = self.single_flight.run_sync(
+            key, lambda: self.send_with_retries_sync(client, request)
+        )
+        self.store(key, response, shared)
+
+        return response
+
+    def statistics(self) -> ResilienceStatistics:
+        return ResilienceStatistics(
+            upstream=self.upstream,
+            state=self.breaker.state,
+            failures=self.breaker.failures,
+            requests=self.requests,
+            retries=self.retries,
+            rejected=self.rejected,
+            coalesced=self.coalesced,
+            cache_hits=self.cache_hits,
+        )
+
+
+async def circuit_open_exception_handler(
+    request: Request, exc: CircuitOpenError
+) -> Response:
+    """
+    Answer with a 503 when an upstream is unavailable, and tell the client when its circuit breaker will let requests through again.
+    """
+    return NegotiatedResponse(
+        {"detail": str(exc)},
+        status_code=HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
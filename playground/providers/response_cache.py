@@ -0,0 +1,397 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Any
+
+import msgpack
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from playground.providers.negotiation import NegotiatedRoute
+from playground.providers.settings import get_settings
+from playground.providers.shared_store import (
+    SharedStore,
+    SharedStoreError,
+    get_shared_store,
+)
+
+# The route, the normalized query params and the `Accept` header. With a shared store, also the generations of the tags of the route.
+CacheKey = Tuple[Any, ...]
+
+
+@dataclass
+class CachePolicy:
+    """
+    How the responses of an endpoint are cached. Attached to the endpoint by `cache_response`.
+    """
+
+    ttl: Optional[float] = None
+    tags: Sequence[str] = ()
+
+
+@dataclass
+class CachedResponse:
+    """
+    An encoded response, together with its strong ETag.
+    """
+
+    body: bytes
+    etag: str
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    expires: float
+    tags: Sequence[str] = field(default_factory=tuple)
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    def respond(self, request: Request) -> Response:
+        """
+        Answer `request` from the cache: `304 Not Modified` if the client already has it, the body otherwise.
+
+        Compression is left to the `CompressionMiddleware`, which compresses every ETag only once per encoding.
+        """
+        if self.etag in request.headers.get("if-none-match", ""):
+            response = Response(status_code=304, headers={"ETag": self.etag})
+            response.raw_headers.extend(
+                (name, value) for name, value in self.headers if name == b"vary"
+            )
+
+            return response
+
+        response = Response(self.body, status_code=self.status_code)
+
+        # Response() already set the content length of the body it got.
+        response.raw_headers.extend(self.headers)
+        response.headers["ETag"] = self.etag
+
+        return response
+
+    def pack(self) -> bytes:
+        """
+        Encode the entry for the shared store. The expiry is stored as a wall clock time, as monotonic clocks differ between processes.
+        """
+        return msgpack.packb(
+            [
+                self.body,
+                self.etag,
+                self.status_code,
+                self.headers,
+                time.time() + self.expires - time.monotonic(),
+                list(self.tags),
+            ],
+            use_bin_type=True,
+        )
+
+    @classmethod
+    def unpack(cls, packed: bytes) -> "CachedResponse":
+        body, etag, status_code, headers, expires, tags = msgpack.unpackb(packed)
+
+        return cls(
+            body=body,
+            etag=etag,
+            status_code=status_code,
+            headers=[(name, value) for name, value in headers],
+            expires=time.monotonic() + expires - time.time(),
+            tags=tuple(tags),
+        )
+
+
+class ResponseCacheStatistics(BaseModel):
+    entries: int
+    size: int
+    hits: int
+    misses: int
+    # Misses that were answered from the shared store, with a response another worker encoded.
+    shared_hits: int
+
+
+class ResponseCache:
+    """
+    An LRU cache of encoded responses. Entries are evicted when they expire or when the total size exceeds `max_size` bytes.
+
+    Entries can be tagged, so writes can invalidate every cached response that depends on them. Every invalidation bumps the generation of
+    its tag, so a response that was computed before a write is not stored after it.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+        self.tags: Dict[str, Set[CacheKey]] = {}
+        # Bumped by `clear`, and per tag by `invalidate`.
+        self.generation = 0
+        self.tag_generations: Dict[str, int] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+
+        if entry is None or entry.expires <= time.monotonic():
+            if entry is not None:
+                self.remove(key)
+
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return entry
+
+    def get_generation(self, tags: Sequence[str]) -> Tuple[int, ...]:
+        """
+        Get the generation of the cache and of every tag in `tags`. It changes whenever responses with one of those tags are invalidated.
+        """
+        return (self.generation, *(self.tag_generations.get(tag, 0) for tag in tags))
+
+    def store(
+        self,
+        key: CacheKey,
+        response: Response,
+        policy: CachePolicy,
+        generation: Optional[Tuple[int, ...]] = None,
+    ) -> Optional[CachedResponse]:
+        """
+        Store the body of `response` and its ETag under `key`.
+        :param generation: The `get_generation` of the tags of `policy` before the response was computed.
+        :return: The stored entry, or `None` when the tags were invalidated since, and the response may be stale.
+        """
+        if generation is not None and generation != self.get_generation(policy.tags):
+            return None
+
+        body = response.body
+        headers = [
+            (name, value)
+            for name, value in response.raw_headers
+            if name not in (b"content-length", b"etag")
+        ]
+
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            status_code=response.status_code,
+            headers=headers,
+            expires=time.monotonic() + (self.ttl if policy.ttl is None else policy.ttl),
+            tags=policy.tags,
+        )
+
+        return self.add(key, entry)
+
+    def add(self, key: CacheKey, entry: CachedResponse) -> CachedResponse:
+        self.remove(key)
+        self.entries[key] = entry
+        self.size += entry.size
+
+        for tag in entry.tags:
+            self.tags.setdefault(tag, set()).add(key)
+
+        while self.size > self.max_size and self.entries:
+            self.remove(next(iter(self.entries)))
+
+        return entry
+
+    def remove(self, key: CacheKey):
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            return
+
+        self.size -= entry.size
+
+        for tag in entry.tags:
+            self.tags.get(tag, set()).discard(key)
+
+    def invalidate(self, tag: str):
+        """
+        Remove every cached response that was stored with `tag`.
+        """
+        self.tag_generations[tag] = self.tag_generations.get(tag, 0) + 1
+
+        for key in list(self.tags.pop(tag, ())):
+            self.remove(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.tags.clear()
+        self.generation += 1
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def statistics(self) -> ResponseCacheStatistics:
+        return ResponseCacheStatistics(
+            entries=len(self.entries),
+            size=self.size,
+            hits=self.hits,
+            misses=self.misses,
+            shared_hits=self.shared_hits,
+        )
+
+
+@lru_cache(None)
+def get_response_cache() -> ResponseCache:
+    """
+    Get the application wide `ResponseCache`.
+    """
+    settings = get_settings()
+
+    return ResponseCache(
+        settings.response_cache_max_size,
+        settings.response_cache_ttl,
+    )
+
+
+def tag_key(tag: str) -> str:
+    return f"response_cache:tag:{tag}"
+
+
+def shared_key(key: CacheKey) -> str:
+    return f"response_cache:{hashlib.blake2b(msgpack.packb(key), digest_size=16).hexdigest()}"
+
+
+async def invalidate_responses(tag: str):
+    """
+    Remove every cached response that was stored with `tag`, in this process and, through the shared store, in every other worker.
+
+    Workers look up the generation of the tags of a route before every cached request. Bumping it makes them miss the responses they stored
+    before.
+    """
+    get_response_cache().invalidate(tag)
+    store = get_shared_store()
+
+    if store is not None:
+        try:
+            await store.incr(tag_key(tag))
+        except SharedStoreError:
+            # The other workers keep serving their responses until they expire.
+            pass
+
+
+async def load_shared_response(
+    store: SharedStore, key: CacheKey
+) -> Optional[CachedResponse]:
+    try:
+        packed = await store.get(shared_key(key))
+    except SharedStoreError:
+        return None
+
+    if packed is None:
+        return None
+
+    entry = CachedResponse.unpack(packed)
+
+    return entry if entry.expires > time.monotonic() else None
+
+
+async def save_shared_response(
+    store: SharedStore, key: CacheKey, entry: CachedResponse
+):
+    try:
+        await store.set(
+            shared_key(key), entry.pack(), max(entry.expires - time.monotonic(), 0)
+        )
+    except SharedStoreError:
+        pass
+
+
+def cache_response(
+    ttl: Optional[float] = None, tags: Sequence[str] = ()
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Mark an endpoint as cacheable. Only has an effect on routers that use `CachedRoute` as their `route_class`.
+
+    :param ttl: How long responses are cached, in seconds. Defaults to `response_cache_ttl` from the settings.
+    :param tags: Tags to invalidate the cached responses with. See `ResponseCache.invalidate`.
+    """
+
+    def decorator(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+        endpoint.response_cache_policy = CachePolicy(ttl, tags)  # type: ignore
+        return endpoint
+
+    return decorator
+
+
+class CachedRoute(NegotiatedRoute):
+    """
+    A route that answers GET requests of endpoints marked with `cache_response` from the `ResponseCache`.
+
+    Responses are keyed by the route, the normalized query params and the `Accept` header. Cache hits skip the endpoint, its dependencies and the serialization.
+
+    With a shared store, responses that miss the cache of this process are looked up in the store before calling the endpoint, and new ones
+    are stored there as well, so every worker can answer with them. The key then includes the generations of the tags of the route.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+        policy: Optional[CachePolicy] = getattr(
+            self.endpoint, "response_cache_policy", None
+        )
+
+        if policy is None:
+            return handler
+
+        async def cached_handler(request: Request) -> Response:
+            if request.method != "GET":
+                return await handler(request)
+
+            cache = get_response_cache()
+            store = get_shared_store()
+            key: CacheKey = (
+                self.path_format,
+                tuple(sorted(request.query_params.multi_items())),
+                request.headers.get("accept", ""),
+            )
+
+            if store is not None and policy.tags:
+                try:
+                    generations = await store.get_many(
+                        [tag_key(tag) for tag in policy.tags]
+                    )
+                except SharedStoreError:
+                    # Without the generations, a cached response may have been invalidated by another worker.
+                    return await handler(request)
+
+                key += (tuple(generation or 0 for generation in generations),)
+
+            entry = cache.get(key)
+
+            if entry is None and store is not None:
+                entry = await load_shared_response(store, key)
+
+                if entry is not None:
+                    cache.shared_hits += 1
+                    cache.add(key, entry)
+
+            if entry is None:
+                # A write that invalidates the tags while the handler runs makes its response stale.
+                generation = cache.get_generation(policy.tags)
+                response = await handler(request)
+
+                if (
+                    response.status_code != 200
+                    or isinstance(response, StreamingResponse)
+                    or response.background is not None
+                ):
+                    return response
+
+                entry = cache.store(key, response, policy, generation)
+
+                if entry is None:
+                    return response
+
+                if store is not None:
+                    await save_shared_response(store, key, entry)
+
+            return entry.respond(request)
+
+        return cached_handler
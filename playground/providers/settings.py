@@ -1,6 +1,79 @@
+import os
 from functools import lru_cache
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseSettings, Field
+from pydantic import BaseModel, BaseSettings, Field
+
+
+class UpstreamSettings(BaseModel):
+    """
+    Connection pool settings for a single upstream that we call over HTTP.
+    """
+
+    max_connections: int = Field(100, ge=1)
+    max_keepalive_connections: int = Field(20, ge=0)
+    keepalive_expiry: float = Field(5.0, ge=0)
+    http2: bool = Field(False)
+    follow_redirects: bool = Field(False)
+    # Seconds to wait for a connection, and for the whole request.
+    connect_timeout: float = Field(2.0, gt=0)
+    timeout: float = Field(5.0, gt=0)
+    # Idempotent requests are retried on connection errors and 502/503/504, with jittered exponential backoff.
+    retries: int = Field(2, ge=0)
+    retry_backoff: float = Field(0.1, ge=0)
+    # The circuit opens after this many failures in a row, and lets a probe through after `breaker_reset_timeout` seconds.
+    breaker_failure_threshold: int = Field(5, ge=1)
+    breaker_reset_timeout: float = Field(30.0, ge=0)
+    breaker_half_open_probes: int = Field(1, ge=1)
+    # Concurrent identical GETs share a single call. Successful results are kept for `cache_ttl` seconds.
+    coalesce: bool = Field(True)
+    cache_ttl: float = Field(0.0, ge=0)
+
+
+class ExecutorSettings(BaseModel):
+    """
+    Limits of a named executor that runs blocking work on worker threads.
+    """
+
+    # At most `max_workers` calls run at a time. When `max_queue` more are waiting, new calls are rejected.
+    max_workers: int = Field(10, ge=1)
+    max_queue: int = Field(100, ge=0)
+
+
+class DatabaseProfile(BaseModel):
+    """
+    Tuning of the SQLite connections. The pragmas are applied to every new connection.
+
+    WAL lets readers continue while a single writer commits. `synchronous=NORMAL` is safe in WAL mode and saves a fsync per commit.
+    """
+
+    journal_mode: str = Field("WAL")
+    synchronous: str = Field("NORMAL")
+    mmap_size: int = Field(256 * 1024 * 1024, ge=0)
+    # Negative values are in KiB, positive values in pages.
+    cache_size: int = Field(-64_000)
+    busy_timeout: int = Field(5_000, ge=0)
+    # SQLite only allows one writer at a time, more writer connections would only wait on its lock.
+    pool_size: int = Field(1, ge=1)
+    read_pool_size: int = Field(5, ge=1)
+
+
+class CompressionRouteSettings(BaseModel):
+    """
+    Compression of the responses of a single path. Levels are per encoding, e.g. `{"gzip": 9}`.
+
+    Only mark a path `immutable` if its responses never change while the app runs. They are compressed once and served from memory.
+    """
+
+    levels: Dict[str, int] = Field(default_factory=dict)
+    minimum_size: Optional[int] = Field(None, ge=0)
+    immutable: bool = Field(False)
+
+
+# Immutable responses are compressed once, so they can use the slowest levels.
+MAXIMUM_COMPRESSION = CompressionRouteSettings(
+    levels={"zstd": 19, "br": 11, "gzip": 9}, immutable=True
+)
 
 
 class Settings(BaseSettings):
@@ -8,8 +81,144 @@ class Settings(BaseSettings):
     Configure application settings. These should be filled from envvars first, .env files second.
     """
 
+    # `python -m playground` runs `workers` processes that accept connections from one socket. On SIGHUP they are replaced one by one, and
+    # every stopped worker gets `worker_graceful_timeout` seconds to finish its requests.
+    host: str = Field("127.0.0.1")
+    port: int = Field(8000, ge=0, le=65535)
+    workers: int = Field(default_factory=lambda: os.cpu_count() or 1, ge=1)
+    worker_startup_timeout: float = Field(60.0, gt=0)
+    worker_graceful_timeout: float = Field(30.0, ge=0)
+
+    # Workers share caches, counters and metrics through a store served on this Unix socket. `python -m playground` sets it for its
+    # workers. Without it, every process keeps its state to itself.
+    shared_store_path: Optional[str] = Field(None)
+    shared_store_timeout: float = Field(0.5, gt=0)
+    shared_store_max_size: int = Field(256 * 1024 * 1024, ge=0)
+    # Every worker publishes its metrics to the shared store this often, so `/metrics` can report all of them.
+    metrics_publish_interval: float = Field(5.0, gt=0)
+
     database_echo: bool = Field(False)
     database_url: str = "./database.db"
+    database_profile: DatabaseProfile = Field(default_factory=DatabaseProfile)
+    # Startup creates the tables unless they are managed elsewhere, and opens the pooled connections up front.
+    database_skip_ddl: bool = Field(False)
+    database_warm_pools: bool = Field(True)
+
+    # Used to sign keyset pagination cursors. Override it in any deployed environment.
+    pagination_cursor_secret: str = Field("playground-cursor-secret")
+    # How long `COUNT(*)` results of paginated queries are cached, in seconds.
+    pagination_count_ttl: float = Field(30.0, ge=0)
+    # Rows of the in-memory example dataset of `/pagination/dataset`. It is built on startup.
+    pagination_dataset_size: int = Field(1_000_000, ge=0)
+
+    # Every upstream gets its own connection pool. Unknown upstreams use the `default` settings.
+    http_upstreams: Dict[str, UpstreamSettings] = Field(
+        default_factory=lambda: {
+            "default": UpstreamSettings(cache_ttl=1.0),
+            "audited": UpstreamSettings(follow_redirects=True),
+        }
+    )
+    # Retries of all upstreams together may add at most this ratio of extra requests, plus a small minimum per second.
+    http_retry_budget_ratio: float = Field(0.2, ge=0)
+    http_retry_budget_minimum: float = Field(1.0, ge=0)
+
+    # The auth passthrough routes verify the bearer token of the client against the JSON Web Key Set at `auth_jwks_path` before they call
+    # an upstream. Without it, tokens are forwarded unchecked. Claims of verified tokens are cached until they expire, for up to
+    # `auth_claims_cache_size` tokens.
+    auth_jwks_path: Optional[str] = Field(None)
+    auth_algorithms: List[str] = Field(default_factory=lambda: ["RS256", "ES256"])
+    auth_audience: Optional[str] = Field(None)
+    auth_issuer: Optional[str] = Field(None)
+    auth_leeway: int = Field(0, ge=0)
+    auth_claims_cache_size: int = Field(10_000, ge=0)
+
+    # Every client gets a token bucket of `rate_limit_capacity` tokens that refills at `rate_limit_refill_rate` tokens per second. Clients
+    # are told apart by the subject of their verified bearer token, or else their IP. A request costs the tokens of the longest path prefix
+    # in `rate_limit_costs`, or 1. Paths that cost 0 are not limited at all, not even by the concurrency limit.
+    # Both limits are kept per worker process, also with a shared store, to keep admission free of round trips. A client whose requests
+    # are spread over all workers can use up to `workers` times the capacity and refill rate, size them for a single worker.
+    rate_limit_enabled: bool = Field(True)
+    rate_limit_capacity: float = Field(100.0, gt=0)
+    rate_limit_refill_rate: float = Field(20.0, gt=0)
+    rate_limit_max_clients: int = Field(100_000, ge=1)
+    rate_limit_sweep_interval: float = Field(10.0, gt=0)
+    rate_limit_costs: Dict[str, float] = Field(
+        default_factory=lambda: {
+            "/pagination/unpaginated": 10,
+            "/pagination/dataset": 5,
+            "/timeranged/bulk": 10,
+            "/timeranged/export": 20,
+            "/timeranged/search": 2,
+            "/health": 0,
+            "/metrics": 0,
+        }
+    )
+    # At most `admission_max_concurrency` requests run at a time per worker. Up to `admission_queue_size` more wait for at most
+    # `admission_queue_timeout` seconds, the others are turned away with a 503.
+    admission_max_concurrency: int = Field(64, ge=1)
+    admission_queue_size: int = Field(256, ge=0)
+    admission_queue_timeout: float = Field(1.0, gt=0)
+
+    # Blocking work runs on named executors, so slow work of one kind cannot starve the others. Unknown executors use the `default` settings.
+    executors: Dict[str, ExecutorSettings] = Field(
+        default_factory=lambda: {
+            "default": ExecutorSettings(),
+            "blocking_http": ExecutorSettings(max_workers=20, max_queue=50),
+            "database": ExecutorSettings(max_workers=10, max_queue=50),
+            "cpu": ExecutorSettings(max_workers=4, max_queue=100),
+        }
+    )
+
+    # Health checks run in the background every `health_check_interval` seconds. Probes answer from their last results, which count as
+    # unhealthy once they are older than `health_check_stale_after` seconds. Upstreams map to a URL that is checked with a `HEAD` request.
+    health_check_interval: float = Field(5.0, gt=0)
+    health_check_timeout: float = Field(2.0, gt=0)
+    health_check_stale_after: float = Field(15.0, gt=0)
+    health_check_upstreams: Dict[str, str] = Field(default_factory=dict)
+
+    # Audit records are queued in memory and written to the backend in batches by a background thread. The file based backends write to
+    # `audit_path`, by default `./audit.jsonl` and `./audit.db` respectively.
+    audit_backend: Literal["stdout", "jsonl", "sqlite"] = Field("stdout")
+    audit_path: Optional[str] = Field(None)
+    audit_queue_size: int = Field(10_000, ge=1)
+    audit_batch_size: int = Field(100, ge=1)
+    audit_flush_interval: float = Field(1.0, gt=0)
+    audit_backpressure: Literal["block", "drop_oldest", "sample"] = Field("drop_oldest")
+    audit_sample_rate: float = Field(0.1, ge=0, le=1)
+
+    # New comments are folded into the histogram rollups every `timeranged_rollup_interval` seconds.
+    timeranged_rollup_interval: float = Field(10.0, gt=0)
+    # Results of comment queries are cached per time range and page, up to this many rows in total.
+    timeranged_query_cache_max_rows: int = Field(100_000, ge=0)
+    # New comments are pushed to the subscribers of `/timeranged/live`. A subscriber that falls more than `timeranged_live_buffer_size`
+    # batches behind is disconnected, and resumes from its last event in pages of `timeranged_live_resume_page_size` comments. Idle
+    # streams get a keepalive every `timeranged_live_heartbeat` seconds. Comments of other workers are relayed through the shared store
+    # every `timeranged_live_relay_interval` seconds.
+    timeranged_live_buffer_size: int = Field(256, ge=1)
+    timeranged_live_resume_page_size: int = Field(500, ge=1)
+    timeranged_live_heartbeat: float = Field(15.0, gt=0)
+    timeranged_live_relay_interval: float = Field(0.2, gt=0)
+
+    # Check every response of a `trusted_response` endpoint against FastAPI's validation. Slow, meant for tests and debugging.
+    trusted_response_verify: bool = Field(False)
+
+    # Encoded responses of cacheable endpoints are kept in memory, up to `response_cache_max_size` bytes in total.
+    response_cache_max_size: int = Field(32 * 1024 * 1024, ge=0)
+    response_cache_ttl: float = Field(60.0, ge=0)
+
+    # Responses are compressed with the best encoding the client accepts. Larger bodies are compressed on a worker thread.
+    compression_minimum_size: int = Field(1000, ge=0)
+    compression_levels: Dict[str, int] = Field(
+        default_factory=lambda: {"zstd": 3, "br": 4, "gzip": 6}
+    )
+    compression_offload_size: int = Field(256 * 1024, ge=0)
+    compression_cache_max_size: int = Field(16 * 1024 * 1024, ge=0)
+    compression_routes: Dict[str, CompressionRouteSettings] = Field(
+        default_factory=lambda: {
+            "/openapi.json": MAXIMUM_COMPRESSION,
+            "/pagination/unpaginated": MAXIMUM_COMPRESSION,
+        }
+    )
 
 
 @lru_cache(None)
@@ -0,0 +1,331 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import msgpack
+
+from playground.providers.settings import get_settings
+
+
+class SharedStoreError(Exception):
+    """
+    Raised when the shared store cannot be reached, does not answer in time or rejects a command.
+    """
+
+
+class MemoryStore:
+    """
+    The keys and values of the shared store. Values are anything msgpack can encode, and may expire after a TTL.
+
+    Once the values take more than `max_size` bytes, the least recently used ones are evicted. Strings and bytes count with their length,
+    anything else as 8 bytes.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict[str, Tuple[Any, Optional[float]]] = OrderedDict()
+        self.size = 0
+
+    @staticmethod
+    def size_of(value: Any) -> int:
+        return len(value) if isinstance(value, (bytes, str)) else 8
+
+    def lookup(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            self.delete(key)
+            return None
+
+        self.entries.move_to_end(key)
+
+        return entry
+
+    def get(self, key: str) -> Any:
+        entry = self.lookup(key)
+
+        return None if entry is None else entry[0]
+
+    def get_many(self, keys: List[str]) -> List[Any]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.delete(key)
+        self.entries[key] = (value, None if ttl is None else time.monotonic() + ttl)
+        self.size += self.size_of(value)
+
+        while self.size > self.max_size and self.entries:
+            self.delete(next(iter(self.entries)))
+
+    def delete(self, key: str) -> bool:
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            return False
+
+        self.size -= self.size_of(entry[0])
+
+        return True
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Add `amount` to the counter at `key` and return the new value. The TTL only applies when the counter is created, so a counter with
+        a TTL counts the calls of a fixed window.
+        """
+        entry = self.lookup(key)
+
+        if entry is None:
+            self.set(key, amount, ttl)
+            return amount
+
+        value = entry[0] + amount
+        self.entries[key] = (value, entry[1])
+
+        return value
+
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        """
+        Get all live keys that start with `prefix`, and their values.
+        """
+        return {
+            key: entry[0]
+            for key in [key for key in self.entries if key.startswith(prefix)]
+            if (entry := self.lookup(key)) is not None
+        }
+
+    def evict_expired(self):
+        now = time.monotonic()
+
+        for key in [
+            key
+            for key, (_, expires) in self.entries.items()
+            if expires is not None and expires <= now
+        ]:
+            self.delete(key)
+
+
+# Commands that clients may call on the `MemoryStore` of the server.
+STORE_COMMANDS = ("get", "get_many", "set", "delete", "incr", "scan")
+
+
+class StoreServer:
+    """
+    Serves a `MemoryStore` on a Unix socket, so every worker process of `python -m playground` sees the same keys.
+
+    Requests and responses are msgpack arrays. A request is `[id, command, args]`, its response `[id, error, result]`. Clients may send
+    many requests without waiting for their responses. Every command runs to completion on the event loop, so `incr` is atomic.
+    """
+
+    def __init__(self, path: str, store: MemoryStore, sweep_interval: float = 1.0):
+        self.path = path
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.sweeper: Optional[asyncio.Task] = None
+        self.connections: Set[asyncio.StreamWriter] = set()
+
+    def call(self, command: str, args: List[Any]) -> Tuple[Optional[str], Any]:
+        if command not in STORE_COMMANDS:
+            return f"Unknown command {command}", None
+
+        try:
+            return None, getattr(self.store, command)(*args)
+        except Exception as e:
+            return str(e) or type(e).__name__, None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        unpacker = msgpack.Unpacker(raw=False)
+        self.connections.add(writer)
+
+        try:
+            while data := await reader.read(64 * 1024):
+                unpacker.feed(data)
+
+                for request_id, command, args in unpacker:
+                    error, result = self.call(command, args)
+                    writer.write(
+                        msgpack.packb([request_id, error, result], use_bin_type=True)
+                    )
+
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.store.evict_expired()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.server = await asyncio.start_unix_server(self.handle, path=self.path)
+        self.sweeper = asyncio.create_task(self.sweep())
+
+    async def stop(self):
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+            self.sweeper = None
+
+        if self.server is not None:
+            self.server.close()
+
+            for writer in list(self.connections):
+                writer.close()
+
+            await self.server.wait_closed()
+            self.server = None
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def serve_forever(self):
+        await self.start()
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+
+class SharedStore:
+    """
+    An async client of a `StoreServer`. Every process keeps a single connection, on which all requests are pipelined.
+
+    The connection is opened on first use and again after it was lost. Every call fails with a `SharedStoreError` instead of hanging when
+    the server is gone, so callers can fall back to their local state.
+    """
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path
+        self.timeout = timeout
+        self.ids = itertools.count()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.reader_task: Optional[asyncio.Task] = None
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def connect(self) -> asyncio.StreamWriter:
+        loop = asyncio.get_running_loop()
+
+        # Connections belong to the event loop that opened them.
+        if self.loop is not loop:
+            self.loop, self.writer, self.lock = loop, None, asyncio.Lock()
+
+        async with self.lock:
+            if self.writer is None or self.writer.is_closing():
+                try:
+                    reader, self.writer = await asyncio.wait_for(
+                        asyncio.open_unix_connection(self.path), self.timeout
+                    )
+                except (OSError, asyncio.TimeoutError) as e:
+                    raise SharedStoreError(
+                        f"Cannot connect to the shared store at {self.path}"
+                    ) from e
+
+                self.reader_task = asyncio.create_task(self.read_responses(reader))
+
+        return self.writer
+
+    async def read_responses(self, reader: asyncio.StreamReader):
+        unpacker = msgpack.Unpacker(raw=False)
+
+        try:
+            while data := await reader.read(64 * 1024):
+                unpacker.feed(data)
+
+                for request_id, error, result in unpacker:
+                    future = self.pending.get(request_id)
+
+                    if future is None or future.done():
+                        continue
+
+                    if error is not None:
+                        future.set_exception(SharedStoreError(error))
+                    else:
+                        future.set_result(result)
+        except ConnectionError:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(
+                        SharedStoreError("Lost the connection to the shared store")
+                    )
+
+    async def call(self, command: str, *args: Any) -> Any:
+        """
+        Run `command` on the server and wait for its result.
+        :raises SharedStoreError: When the server cannot be reached, does not answer within `timeout` or the command failed.
+        """
+        writer = await self.connect()
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+
+        try:
+            writer.write(
+                msgpack.packb([request_id, command, list(args)], use_bin_type=True)
+            )
+
+            return await asyncio.wait_for(future, self.timeout)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            writer.close()
+            raise SharedStoreError(f"The shared store did not answer {command}") from e
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def get(self, key: str) -> Any:
+        return await self.call("get", key)
+
+    async def get_many(self, keys: List[str]) -> List[Any]:
+        return await self.call("get_many", keys)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.call("set", key, value, ttl)
+
+    async def delete(self, key: str) -> bool:
+        return await self.call("delete", key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return await self.call("incr", key, amount, ttl)
+
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        return await self.call("scan", prefix)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+@lru_cache(None)
+def get_shared_store() -> Optional[SharedStore]:
+    """
+    Get the client of the store that all workers share, or `None` when `shared_store_path` is not set and this process is on its own.
+    """
+    settings = get_settings()
+
+    if not settings.shared_store_path:
+        return None
+
+    return SharedStore(settings.shared_store_path, settings.shared_store_timeout)
+
+
+def run_store_server(path: str, max_size: int):
+    """
+    Serve a new `MemoryStore` on `path` until the process is terminated. The target of the store process of the supervisor.
+    """
+    asyncio.run(StoreServer(path, MemoryStore(max_size)).serve_forever())
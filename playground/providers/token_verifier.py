@@ -0,0 +1,284 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.status import HTTP_401_UNAUTHORIZED
+
+from playground.providers.executors import get_executors
+from playground.providers.settings import get_settings
+
+Claims = Dict[str, Any]
+
+# The algorithm of keys that do not name one in their `alg`.
+DEFAULT_ALGORITHMS = {"RSA": "RS256", "EC": "ES256", "oct": "HS256"}
+# Seconds a rejected token is rejected from the cache. Short, because a token that is not valid yet may become valid.
+REJECTION_TTL = 60.0
+
+
+class TokenVerificationError(Exception):
+    """
+    Raised when a token is malformed, signed by an unknown key, has a bad signature or has invalid claims.
+    """
+
+
+class TokenVerifierStatistics(BaseModel):
+    keys: int
+    cached: int
+    cached_rejections: int
+    hits: int
+    misses: int
+    rejected: int
+
+
+class TokenVerifier:
+    """
+    Verifies JWTs against the keys of a JSON Web Key Set, and caches the claims of verified tokens until they expire.
+
+    A signature check costs far more than a request needs to spend on auth, and clients send the same token many times. Claims are cached
+    per SHA-256 of the token, in an LRU of at most `cache_size` tokens. Tokens without an `exp` are verified every time. Rejected tokens are
+    kept in an LRU of their own for `REJECTION_TTL` seconds, so a client that repeats a bad token does not cost a signature check every
+    time, and cannot push out valid tokens either.
+
+    Keys are picked by the `kid` of the token, or the only key when the set has one. A token is only accepted with the algorithm of its key.
+    """
+
+    def __init__(
+        self,
+        jwks: Dict[str, Any],
+        algorithms: Sequence[str],
+        cache_size: int,
+        audience: Optional[str] = None,
+        issuer: Optional[str] = None,
+        leeway: int = 0,
+    ):
+        self.keys: Dict[Optional[str], Tuple[str, Key]] = {}
+
+        for key in jwks.get("keys", []):
+            algorithm = key.get("alg") or DEFAULT_ALGORITHMS.get(key.get("kty"))
+
+            if algorithm in algorithms:
+                self.keys[key.get("kid")] = (algorithm, jwk.construct(key, algorithm))
+
+        self.cache_size = cache_size
+        self.audience = audience
+        self.issuer = issuer
+        self.options = {"leeway": leeway, "verify_aud": audience is not None}
+        self.cache: OrderedDict[bytes, Tuple[Claims, float]] = OrderedDict()
+        # Per rejected token: the reason, and until when it is rejected without a check.
+        self.rejections: OrderedDict[bytes, Tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def find_key(self, token: str) -> Tuple[str, Key]:
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError as e:
+            raise TokenVerificationError("Malformed token") from e
+
+        kid = header.get("kid")
+
+        if kid is None and len(self.keys) == 1:
+            algorithm, key = next(iter(self.keys.values()))
+        elif kid in self.keys:
+            algorithm, key = self.keys[kid]
+        else:
+            raise TokenVerificationError("Unknown signing key")
+
+        if header.get("alg") != algorithm:
+            raise TokenVerificationError("Unexpected signing algorithm")
+
+        return algorithm, key
+
+    def decode(self, token: str) -> Claims:
+        """
+        Verify the signature and claims of a token, without the cache.
+        :raises TokenVerificationError: When the token is not valid.
+        """
+        algorithm, key = self.find_key(token)
+
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                options=self.options,
+            )
+        except JWTError as e:
+            raise TokenVerificationError(str(e) or "Invalid token") from e
+
+    def cached(self, token: str) -> Optional[Claims]:
+        """
+        Get the claims of a token that was verified before, without checking its signature.
+        :return: The claims, or `None` when the token was not verified before or its entry expired.
+        :raises TokenVerificationError: When the token was rejected before.
+        """
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        entry = self.cache.get(digest)
+
+        if entry is not None:
+            if entry[1] > now:
+                self.cache.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+
+            del self.cache[digest]
+
+        rejection = self.rejections.get(digest)
+
+        if rejection is not None:
+            if rejection[1] > now:
+                self.rejections.move_to_end(digest)
+                self.hits += 1
+                self.rejected += 1
+                raise TokenVerificationError(rejection[0])
+
+            del self.rejections[digest]
+
+        return None
+
+    def remember(
+        self, token: str, claims: Optional[Claims], error: Optional[Exception]
+    ):
+        """
+        Cache the outcome of verifying a token, either its claims or the error it was rejected with.
+        """
+        digest = hashlib.sha256(token.encode()).digest()
+        self.misses += 1
+
+        if error is not None:
+            self.rejected += 1
+            self.store(
+                self.rejections, digest, (str(error), time.time() + REJECTION_TTL)
+            )
+        elif isinstance(claims.get("exp"), (int, float)):
+            self.store(self.cache, digest, (claims, claims["exp"]))
+
+    def verify(self, token: str) -> Claims:
+        """
+        Get the claims of a valid token, from the cache if it was verified before. The claims are shared, do not change them.
+        :raises TokenVerificationError: When the token is not valid.
+        """
+        claims = self.cached(token)
+
+        if claims is not None:
+            return claims
+
+        try:
+            claims = self.decode(token)
+        except TokenVerificationError as e:
+            self.remember(token, None, e)
+            raise
+
+        self.remember(token, claims, None)
+
+        return claims
+
+    async def averify(self, token: str) -> Claims:
+        """
+        The async version of `verify`. Tokens that are not cached are checked on the `cpu` executor, so signature checks do not hold up
+        the event loop. The caches are only touched on the event loop.
+        :raises TokenVerificationError: When the token is not valid.
+        :raises ExecutorSaturatedError: When the `cpu` executor is saturated.
+        """
+        claims = self.cached(token)
+
+        if claims is not None:
+            return claims
+
+        try:
+            claims = await get_executors().run("cpu", self.decode, token)
+        except TokenVerificationError as e:
+            self.remember(token, None, e)
+            raise
+
+        self.remember(token, claims, None)
+
+        return claims
+
+    def store(self, cache: OrderedDict, digest: bytes, entry: tuple):
+        if self.cache_size:
+            cache[digest] = entry
+
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def statistics(self) -> TokenVerifierStatistics:
+        return TokenVerifierStatistics(
+            keys=len(self.keys),
+            cached=len(self.cache),
+            cached_rejections=len(self.rejections),
+            hits=self.hits,
+            misses=self.misses,
+            rejected=self.rejected,
+        )
+
+
+def load_jwks(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+@lru_cache(None)
+def get_token_verifier() -> Optional[TokenVerifier]:
+    """
+    Get the application wide `TokenVerifier`, or `None` when `auth_jwks_path` is not set and tokens are not verified.
+    """
+    settings = get_settings()
+
+    if not settings.auth_jwks_path:
+        return None
+
+    return TokenVerifier(
+        load_jwks(settings.auth_jwks_path),
+        settings.auth_algorithms,
+        settings.auth_claims_cache_size,
+        audience=settings.auth_audience,
+        issuer=settings.auth_issuer,
+        leeway=settings.auth_leeway,
+    )
+
+
+async def with_verified_claims(request: Request) -> Optional[Claims]:
+    """
+    A FastAPI dependency that verifies the bearer token in the `Authorization` header of the client.
+
+    Depend on it before anything that acts on behalf of the client, so invalid tokens are rejected first. Verified tokens are answered
+    from memory, only new tokens cost a signature check, on the `cpu` executor.
+
+    :return: The claims of the token, or `None` when tokens are not verified.
+    :raises HTTPException: A 401 when the token is missing or not valid.
+    """
+    verifier = get_token_verifier()
+
+    if verifier is None:
+        return None
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="Missing bearer token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    try:
+        return await verifier.averify(token.strip())
+    except TokenVerificationError as e:
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="Invalid bearer token",
+            headers={"WWW-Authenticate": 'Bearer error="invalid_token"'},
+        ) from e
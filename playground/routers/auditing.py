@@ -3,12 +3,14 @@ from typing import List
 from fastapi import APIRouter, Depends
 from starlette.requests import Request
 
+from playground.providers.audit_sink import get_audit_sink, AuditRecord
+
 
 class Auditor:
     """
     A basic implementation of an auditing resource. It should be instantiated once per request.
 
-    During a request, messages can be added to the auditor. At the end of a session, the auditor will flush all messages.
+    During a request, messages can be added to the auditor. At the end of a session, the auditor hands all messages to the `AuditSink`.
     """
 
     def __init__(self, request: Request, audit_name: str = "Audit"):
@@ -20,9 +22,20 @@ class Auditor:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        sink = get_audit_sink()
+        client = f"{self.request.client.host}:{self.request.client.port}"
+
         for message in self.messages:
-            print(
-                f"AUDIT ({self.audit_name}) - CLIENT {self.request.client.host}:{self.request.client.port} - HOST: {self.request.url} - {message}"
+            sink.enqueue(
+                AuditRecord(
+                    audit_name=self.audit_name,
+                    message=f"AUDIT ({self.audit_name}) - CLIENT {client} - HOST: {self.request.url} - {message}",
+                    details={
+                        "client": client,
+                        "url": str(self.request.url),
+                        "message": message,
+                    },
+                )
             )
 
     def add_message(self, message: str):
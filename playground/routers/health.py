@@ -1,22 +1,59 @@
-from fastapi import APIRouter, Depends
+from typing import List, Optional
 
-from playground.providers.database import get_session
+from fastapi import APIRouter, HTTPException
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from playground.providers.admission import (
+    get_concurrency_limiter,
+    get_rate_limiter,
+    ConcurrencyStatistics,
+    RateLimitStatistics,
+)
+from playground.providers.audit_sink import get_audit_sink, AuditSinkStatistics
+from playground.providers.database_lifespan import (
+    get_startup_timings,
+    DatabaseStartupTimings,
+)
+from playground.providers.executors import get_executors, ExecutorStatistics
+from playground.providers.health_checks import get_health_checks, HealthReport
+from playground.providers.http_clients import get_http_clients, PoolStatistics
+from playground.providers.resilience import ResilienceStatistics
+from playground.providers.response_cache import (
+    get_response_cache,
+    ResponseCacheStatistics,
+)
+from playground.providers.token_verifier import (
+    get_token_verifier,
+    TokenVerifierStatistics,
+)
 
 health_router = APIRouter()
 
 
-@health_router.get("/health", dependencies=[Depends(get_session)])
+@health_router.get("/health")
 async def get_health():
     """
-    Health endpoint that returns if the application can connect to all its services. If it does not return, the app cannot take requests nor connect to a database.
+    Health endpoint that returns if the application can connect to all its services. If it does not return OK, the app cannot take requests nor connect to a database.
 
-    It depends on a database session. If the session is present, the health check is ok. If the session cannot be started, the health check has failed.
+    It answers from the results of the background health checks, so probes never open a database session themselves.
+    A critical check that failed, or that has not run recently, makes it return a 503.
 
     It should be used as a readyness-check.
     """
+    if not get_health_checks().is_healthy():
+        raise HTTPException(HTTP_503_SERVICE_UNAVAILABLE, "Unhealthy")
+
     return "OK"
 
 
+@health_router.get("/checks", response_model=HealthReport)
+async def get_health_checks_report():
+    """
+    The last result and latency of every health check, including the non-critical ones.
+    """
+    return get_health_checks().report()
+
+
 @health_router.get("/ping")
 async def get_ping():
     """
@@ -25,3 +62,78 @@ async def get_ping():
     It should be used as a liveness-check.
     """
     return "pong"
+
+
+@health_router.get("/http-clients", response_model=List[PoolStatistics])
+async def get_http_client_statistics():
+    """
+    Statistics of the shared outbound HTTP connection pools, such as active and idle connections and the time spent waiting for one.
+    """
+    return get_http_clients().statistics()
+
+
+@health_router.get("/http-resilience", response_model=List[ResilienceStatistics])
+async def get_http_resilience_statistics():
+    """
+    State of the circuit breaker of every upstream, and how many requests were retried, rejected, coalesced or served from cache.
+    """
+    return get_http_clients().resilience_statistics()
+
+
+@health_router.get("/executors", response_model=List[ExecutorStatistics])
+async def get_executor_statistics():
+    """
+    Active and queued calls of every executor, how many were rejected, and how long calls wait for a worker thread.
+    """
+    return get_executors().statistics()
+
+
+@health_router.get("/audit-sink", response_model=AuditSinkStatistics)
+async def get_audit_sink_statistics():
+    """
+    Counters of the audit sink: how many records were enqueued, dropped due to backpressure, flushed to the backend and lost because the
+    backend failed to write them.
+    """
+    return get_audit_sink().statistics()
+
+
+@health_router.get("/startup", response_model=DatabaseStartupTimings)
+async def get_database_startup_timings():
+    """
+    How long the database startup took. Use it to measure the cold-start cost of a deploy.
+    """
+    return get_startup_timings()
+
+
+@health_router.get("/response-cache", response_model=ResponseCacheStatistics)
+async def get_response_cache_statistics():
+    """
+    Size and hit rate of the response cache.
+    """
+    return get_response_cache().statistics()
+
+
+@health_router.get("/token-verifier", response_model=Optional[TokenVerifierStatistics])
+async def get_token_verifier_statistics():
+    """
+    Hit rate of the cache of verified tokens, and how many tokens were rejected. Empty when tokens are not verified.
+    """
+    verifier = get_token_verifier()
+
+    return verifier.statistics() if verifier is not None else None
+
+
+@health_router.get("/rate-limits", response_model=RateLimitStatistics)
+async def get_rate_limit_statistics():
+    """
+    How many clients have a token bucket, and how many of their requests were allowed and limited, in this worker.
+    """
+    return get_rate_limiter().statistics()
+
+
+@health_router.get("/concurrency", response_model=ConcurrencyStatistics)
+async def get_concurrency_statistics():
+    """
+    Requests that are running and waiting for a slot, and how many were admitted and turned away, in this worker.
+    """
+    return get_concurrency_limiter().statistics()
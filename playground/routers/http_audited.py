@@ -7,6 +7,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from starlette.requests import Request
 
+from playground.providers.audit_sink import get_audit_sink, AuditRecord
+from playground.providers.http_clients import get_http_clients, AsyncScopedClient
 from playground.routers.http_authorized import a_raise_on_4xx_5xx
 
 
@@ -22,7 +24,7 @@ class Auditor:
     """
     A basic implementation of an auditing resource. It should be instantiated once per request.
 
-    During a request, messages can be added to the auditor. At the end of a session, the auditor will flush all messages.
+    During a request, messages can be added to the auditor. At the end of a session, the auditor hands all messages to the `AuditSink`.
     """
 
     def __init__(self, audit_name: str = "Audit"):
@@ -33,10 +35,35 @@ class Auditor:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for message in self.messages:
-            print(
-                f"AUDIT ({self.audit_name}) {'SUCCESS' if message.success else 'FAILED'} - {message.source_host} to {message.destination_host} - {message.extra_message}"
+        sink = get_audit_sink()
+
+        for record in self.records():
+            sink.enqueue(record)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """
+        Hand the messages to the `AuditSink` without blocking the event loop, also when it has to wait for room.
+        """
+        sink = get_audit_sink()
+
+        for record in self.records():
+            await sink.aenqueue(record)
+
+    def records(self) -> List[AuditRecord]:
+        return [
+            AuditRecord(
+                audit_name=self.audit_name,
+                message=(
+                    f"AUDIT ({self.audit_name}) {'SUCCESS' if message.success else 'FAILED'} - "
+                    f"{message.source_host} to {message.destination_host} - {message.extra_message}"
+                ),
+                details=message.dict(),
             )
+            for message in self.messages
+        ]
 
     def add_message(self, message: AuditMessage):
         self.messages.append(message)
@@ -80,22 +107,20 @@ class AuditedWebClient:
 
     async def __call__(
         self, request: Request
-    ) -> AsyncGenerator[httpx.AsyncClient, None]:
-        with Auditor(self.name) as auditor:
-
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                client.event_hooks["response"] = [
-                    audit_httpx_request(auditor),
-                    a_raise_on_4xx_5xx,
-                ]
+    ) -> AsyncGenerator[AsyncScopedClient, None]:
+        async with Auditor(self.name) as auditor:
+            client = get_http_clients().async_client(
+                "audited",
+                response_hooks=[audit_httpx_request(auditor), a_raise_on_4xx_5xx],
+            )
 
-                try:
-                    yield client
-                    auditor.add_starlette_request(request, True)
-                except Exception as e:
-                    auditor.add_starlette_request(request, False)
+            try:
+                yield client
+                auditor.add_starlette_request(request, True)
+            except Exception as e:
+                auditor.add_starlette_request(request, False)
 
-                    raise e
+                raise e
 
 
 http_audited_router = APIRouter()
@@ -103,7 +128,7 @@ http_audited_router = APIRouter()
 
 @http_audited_router.get("/success")
 async def http_audited_passthrough_success(
-    client: httpx.AsyncClient = Depends(AuditedWebClient("AUDIT_SUCCESS")),
+    client: AsyncScopedClient = Depends(AuditedWebClient("AUDIT_SUCCESS")),
 ):
     await asyncio.gather(
         client.get("https://google.com"),
@@ -116,7 +141,7 @@ async def http_audited_passthrough_success(
 
 @http_audited_router.get("/fail", status_code=422)
 async def http_audited_passthrough_fail(
-    client: httpx.AsyncClient = Depends(AuditedWebClient("AUDIT_FAIL")),
+    client: AsyncScopedClient = Depends(AuditedWebClient("AUDIT_FAIL")),
 ):
     await asyncio.gather(
         client.get("https://google.com"),
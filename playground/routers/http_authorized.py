@@ -1,7 +1,17 @@
 import httpx
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
 from starlette.requests import Request
 
+from playground.providers.executors import offload
+from playground.providers.http_clients import (
+    get_http_clients,
+    ScopedClient,
+    AsyncScopedClient,
+)
+from playground.providers.token_verifier import Claims, with_verified_claims
+
 
 def raise_on_4xx_5xx(response: httpx.Response):
     """
@@ -39,11 +49,16 @@ async def a_raise_on_4xx_5xx(response: httpx.Response):
         ) from e
 
 
-def with_http_client(request: Request) -> httpx.Client:
+@offload("blocking_http")
+def with_http_client(
+    request: Request, claims: Optional[Claims] = Depends(with_verified_claims)
+) -> ScopedClient:
     """
-    A FastAPI dependency that creates a HTTP client to call other services.
+    A FastAPI dependency that provides a HTTP client to call other services.
 
     It automatically inserts the clients `Authorization`, allowing us to act on behalf of a user.
+    When `auth_jwks_path` is set, the token is verified first, and invalid tokens are rejected with a 401 without calling any upstream.
+    The header only applies to this client. The underlying connection pool is shared by the whole application.
 
     This method is blocking. It can be used in both regular and async functions. However, it should not be used in async functions due to said blocking.
     """
@@ -52,16 +67,18 @@ def with_http_client(request: Request) -> httpx.Client:
     if auth := request.headers.get("authorization"):
         headers["Authorization"] = auth
 
-    with httpx.Client(headers=headers) as client:
-        client.event_hooks["response"] = [raise_on_4xx_5xx]
-        yield client
+    return get_http_clients().client(headers=headers, response_hooks=[raise_on_4xx_5xx])
 
 
-async def with_ahttp_client(request: Request) -> httpx.AsyncClient:
+async def with_ahttp_client(
+    request: Request, claims: Optional[Claims] = Depends(with_verified_claims)
+) -> AsyncScopedClient:
     """
-    A FastAPI dependency that creates a HTTP client to call other services.
+    A FastAPI dependency that provides a HTTP client to call other services.
 
     It automatically inserts the clients `Authorization`, allowing us to act on behalf of a user.
+    When `auth_jwks_path` is set, the token is verified first, and invalid tokens are rejected with a 401 without calling any upstream.
+    The header only applies to this client. The underlying connection pool is shared by the whole application.
 
     This method is non-blocking. It can only be used in async functions. Running in sync is possible but should be avoided.
     """
@@ -70,29 +87,28 @@ async def with_ahttp_client(request: Request) -> httpx.AsyncClient:
     if auth := request.headers.get("authorization"):
         headers["Authorization"] = auth
 
-    async with httpx.AsyncClient(
-        headers=headers,
-    ) as client:
-        client.event_hooks["response"] = [a_raise_on_4xx_5xx]
-        yield client
+    return get_http_clients().async_client(
+        headers=headers, response_hooks=[a_raise_on_4xx_5xx]
+    )
 
 
 auth_passthrough_router = APIRouter()
 
 
 @auth_passthrough_router.get("/sync")
-def get_ip_sync(client: httpx.Client = Depends(with_http_client)):
+@offload("blocking_http")
+def get_ip_sync(client: ScopedClient = Depends(with_http_client)):
     """
     Get the server IP with the clients `Authorization` header.
 
-    This method is blocking.
+    This method is blocking. It runs on the `blocking_http` executor, so a slow upstream only uses up the threads of that executor.
     """
     ip = client.get("https://ifconfig.me/ip")
     return {"ip": ip.text, "auth_token": client.headers.get("Authorization")}
 
 
 @auth_passthrough_router.get("/async")
-async def get_ip_async(client: httpx.AsyncClient = Depends(with_ahttp_client)):
+async def get_ip_async(client: AsyncScopedClient = Depends(with_ahttp_client)):
     """
     Get the server IP with the clients `Authorization` header.
 
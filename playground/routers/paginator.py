@@ -1,9 +1,20 @@
+import itertools
 import math
+import time
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Callable, TypeVar, List
+from typing import Callable, TypeVar, List, Optional, Iterable, Tuple, Any
 
-from fastapi import Query, APIRouter, Depends
+from fastapi import Query, APIRouter, Depends, HTTPException
 from pydantic.generics import GenericModel, Generic
+from sqlalchemy import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from playground.providers.datasets import DatasetPage, get_example_dataset
+from playground.providers.negotiation import NegotiatedResponse, trusted_response
+from playground.providers.response_cache import CachedRoute, cache_response
+from playground.providers.settings import get_settings
 
 PaginatedType = TypeVar("PaginatedType")
 
@@ -13,46 +24,157 @@ PAGINATED_SIZE = 1000
 class PaginatedResult(GenericModel, Generic[PaginatedType]):
     """
     A wrapped around `PaginatedType` that provides page information.
+
+    `total` and `page_count` are empty when the source does not know its size, such as a generator.
     """
 
     page: int
     page_size: int
-    page_count: int
+    page_count: Optional[int]
+    total: Optional[int]
+    has_next: bool
 
     data: List[PaginatedType]
 
 
-PaginatorFunction = Callable[[List[PaginatedType]], PaginatedResult[PaginatedType]]
+class CountCache:
+    """
+    Caches `COUNT(*)` results of SQL queries, keyed by the SQL and its parameters. Entries expire after `ttl` seconds.
+
+    Walking through the pages of a query only counts its rows once, instead of once per page.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries: OrderedDict[Tuple[Any, ...], Tuple[float, int]] = OrderedDict()
 
+    @staticmethod
+    def get_key(query: SelectOfScalar[Any]) -> Tuple[Any, ...]:
+        """
+        Create the filter signature of a query. Queries with the same SQL and parameters count the same rows.
+        """
+        compiled = query.compile()
 
-def with_paginator(
-    page: int = Query(0, ge=0, le=1_000_000), page_size: int = Query(100, ge=1, le=1000)
-) -> PaginatorFunction:
+        return str(compiled), tuple(sorted(compiled.params.items()))
+
+    async def count(self, session: AsyncSession, query: SelectOfScalar[Any]) -> int:
+        """
+        Count the rows of `query`, or get the count from the cache if it has not expired yet.
+        """
+        key = self.get_key(query)
+        now = time.monotonic()
+
+        if (entry := self.entries.get(key)) and entry[0] > now:
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        count_query = select(func.count()).select_from(query.subquery())
+        total = (await session.execute(count_query)).scalar_one()
+
+        self.entries[key] = (now + self.ttl, total)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+        return total
+
+    def clear(self):
+        self.entries.clear()
+
+
+@lru_cache(None)
+def get_count_cache() -> CountCache:
     """
-    A FastAPI dependency that paginates in-memory data sources. It uses dependencies to automatically get the params from the request.
+    Get the application wide `CountCache`.
+    """
+    return CountCache(get_settings().pagination_count_ttl)
 
-    This paginator is generic and can be added to any endpoint that returns a list.
 
-    :param page: The page you want to get. Starts at 0. Should be greater than or equal to 0.
-    :param page_size: The size of the pages you want to get. Defaults to 100. Must be larger than 1 and less than or equal to 1000.
-    :return: A function that takes a list of `PaginatedType` and paginates it in memory. This function then returns the `PaginatedResult`.
+class Paginator:
+    """
+    Paginates any data source. Call it with the items to paginate in memory, or use `query` to paginate a SQL query.
+
+    Sources that support `len()` and slicing, like lists, ranges and NumPy arrays, are sliced directly.
+    Other iterables, like generators, are consumed lazily up to the requested page only.
     """
 
-    def paginate(items: List[PaginatedType]) -> PaginatedResult[PaginatedType]:
-        start_item = page_size * page
-        end_item = start_item + page_size
+    def __init__(self, page: int, page_size: int):
+        self.page = page
+        self.page_size = page_size
+        self.start = page_size * page
+        self.end = self.start + page_size
+
+    def __call__(
+        self, items: Iterable[PaginatedType]
+    ) -> PaginatedResult[PaginatedType]:
+        if hasattr(items, "__len__") and hasattr(items, "__getitem__"):
+            data = items[self.start : self.end]  # type: ignore
+
+            # NumPy arrays would otherwise be turned into a list of NumPy scalars.
+            if hasattr(data, "tolist"):
+                data = data.tolist()
+
+            return self.create_result(list(data), len(items))  # type: ignore
+
+        window = list(itertools.islice(items, self.start, self.end + 1))
+
+        if hasattr(items, "__len__"):
+            return self.create_result(window[: self.page_size], len(items))  # type: ignore
 
         return PaginatedResult(
-            page=page,
-            page_size=page_size,
-            page_count=math.floor(len(items) / page_size),
-            data=items[start_item:end_item],
+            page=self.page,
+            page_size=self.page_size,
+            page_count=None,
+            total=None,
+            has_next=len(window) > self.page_size,
+            data=window[: self.page_size],
         )
 
-    return paginate
+    async def query(
+        self, session: AsyncSession, query: SelectOfScalar[PaginatedType]
+    ) -> PaginatedResult[PaginatedType]:
+        """
+        Paginate a SQL query. The total is counted with a `COUNT(*)` query that is cached by `CountCache`.
+        """
+        total = await get_count_cache().count(session, query)
+        result = await session.exec(query.limit(self.page_size).offset(self.start))
 
+        return self.create_result(result.all(), total)
 
-pagination_router = APIRouter()
+    def create_result(
+        self, data: List[PaginatedType], total: int
+    ) -> PaginatedResult[PaginatedType]:
+        return PaginatedResult(
+            page=self.page,
+            page_size=self.page_size,
+            page_count=math.ceil(total / self.page_size),
+            total=total,
+            has_next=self.end < total,
+            data=data,
+        )
+
+
+PaginatorFunction = Callable[[Iterable[PaginatedType]], PaginatedResult[PaginatedType]]
+
+
+def with_paginator(
+    page: int = Query(0, ge=0, le=1_000_000), page_size: int = Query(100, ge=1, le=1000)
+) -> Paginator:
+    """
+    A FastAPI dependency that paginates data sources. It uses dependencies to automatically get the params from the request.
+
+    This paginator is generic and can be added to any endpoint that returns a list, an iterable or a SQL query.
+
+    :param page: The page you want to get. Starts at 0. Should be greater than or equal to 0.
+    :param page_size: The size of the pages you want to get. Defaults to 100. Must be larger than 1 and less than or equal to 1000.
+    :return: A `Paginator`. Call it with an iterable of `PaginatedType` to paginate it in memory, or use `Paginator.query` for SQL queries.
+    """
+    return Paginator(page, page_size)
+
+
+pagination_router = APIRouter(route_class=CachedRoute)
 
 
 @lru_cache
@@ -65,6 +187,8 @@ def get_example_list() -> List[int]:
 
 
 @pagination_router.get("/unpaginated", response_model=List[int])
+@cache_response()
+@trusted_response()
 def get_unpaginated() -> List[int]:
     """
     Get the `example_list` and return it without pagination.
@@ -73,6 +197,8 @@ def get_unpaginated() -> List[int]:
 
 
 @pagination_router.get("/paginated", response_model=PaginatedResult[int])
+@cache_response()
+@trusted_response()
 def get_paginated(
     paginator: PaginatorFunction = Depends(with_paginator),
 ) -> PaginatedResult[int]:
@@ -84,3 +210,39 @@ def get_paginated(
     example_list = get_example_list()
 
     return paginator(example_list)
+
+
+@pagination_router.get("/generated", response_model=PaginatedResult[int])
+@trusted_response()
+def get_generated(
+    paginator: PaginatorFunction = Depends(with_paginator),
+) -> PaginatedResult[int]:
+    """
+    Paginate a generator. Only the items up to the requested page are generated, so the total is unknown.
+    """
+    return paginator(number for number in range(0, PAGINATED_SIZE))
+
+
+@pagination_router.get("/dataset", response_model=DatasetPage)
+async def get_dataset_page(
+    paginator: Paginator = Depends(with_paginator),
+    sort: Optional[str] = Query(None, description="A column with a sort index"),
+    descending: bool = Query(False),
+) -> NegotiatedResponse:
+    """
+    Paginate a large in-memory `ColumnarDataset`, optionally sorted by one of its indexed columns.
+
+    The page is returned as a response right away, so FastAPI does not validate it against `DatasetPage`. The encoder reads the values
+    straight from the column buffers, without creating a model or a Python object per row first.
+    """
+    dataset = get_example_dataset()
+
+    if sort is not None and sort not in dataset.sorted_columns:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot sort by {sort}. Sortable columns: {', '.join(dataset.sorted_columns)}",
+        )
+
+    return NegotiatedResponse(
+        dataset.page(paginator.page, paginator.page_size, sort, descending)
+    )
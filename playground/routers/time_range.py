@@ -1,33 +1,206 @@
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import hmac
+import json
+import time
+from collections import Counter
 from datetime import datetime
-from typing import Optional, List, TypeVar, Callable, Any
+from functools import lru_cache
+from typing import (
+    Optional,
+    List,
+    TypeVar,
+    Callable,
+    Any,
+    Generic,
+    Tuple,
+    AsyncIterator,
+    Dict,
+    Literal,
+)
 
-from fastapi import APIRouter, Depends, Query
-from pydantic import BaseModel
-from sqlalchemy import Column, DateTime
+import msgpack
+import orjson
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    Query,
+    HTTPException,
+    WebSocket,
+)
+from pydantic import BaseModel, ValidationError, parse_obj_as
+from pydantic.generics import GenericModel
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    column,
+    event,
+    func,
+    insert,
+    literal_column,
+    table,
+    text,
+    tuple_,
+    type_coerce,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
 from sqlmodel import SQLModel, Field, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel.sql.expression import SelectOfScalar
 
-from playground.providers.database_async import get_session
+from playground.providers.broadcast import (
+    BroadcastBus,
+    BroadcastRelay,
+    Subscription,
+    SubscriptionClosed,
+)
+from playground.providers.database_async import (
+    get_session,
+    get_read_session,
+    get_session_factory,
+)
+from playground.providers.negotiation import trusted_response
+from playground.providers.query_cache import QueryCache, normalize_date
+from playground.providers.response_cache import (
+    CachedRoute,
+    cache_response,
+    invalidate_responses,
+)
+from playground.providers.settings import get_settings
+from playground.providers.shared_store import get_shared_store
+from playground.routers.paginator import (
+    PaginatedResult,
+    Paginator,
+    with_paginator as with_counted_paginator,
+)
 
-time_range_router = APIRouter()
+time_range_router = APIRouter(route_class=CachedRoute)
 
 
 class TimeRangedModel(SQLModel, table=True):
     """
     A SQLModel that can be inserted into a database. Any database will work as SQLAlchemy will take care of the implementation specifics.
+
+    The composite index on `(date_created, id)` lets keyset pagination seek straight to a cursor instead of scanning.
     """
 
+    __table_args__ = (
+        Index("ix_timerangedmodel_date_created_id", "date_created", "id"),
+    )
+
     id: Optional[int] = Field(None, primary_key=True, le=2**8)
     comment: str = Field(...)
     date_created: datetime = Field(..., sa_column=Column(DateTime))
 
 
+class TimeRangedRollup(SQLModel, table=True):
+    """
+    The amount of `TimeRangedModels` per minute, hour and day. Maintained by the `RollupCompactor`.
+    """
+
+    bucket: str = Field(..., primary_key=True)
+    bucket_start: datetime = Field(..., sa_column=Column(DateTime, primary_key=True))
+    count: int = Field(0)
+
+
+class RollupWatermark(SQLModel, table=True):
+    """
+    The highest id of a table that has been folded into its rollups.
+    """
+
+    name: str = Field(..., primary_key=True)
+    last_id: int = Field(0)
+
+
+# An external content FTS5 index on `TimeRangedModel.comment`. It only stores the index and reads the comments from their table.
+SEARCH_TABLE = "timerangedmodel_fts"
+
+SEARCH_INDEX_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "USING fts5(comment, content='timerangedmodel', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS timerangedmodel_fts_insert AFTER INSERT ON timerangedmodel BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, comment) VALUES (new.id, new.comment); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS timerangedmodel_fts_delete AFTER DELETE ON timerangedmodel BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, comment) VALUES ('delete', old.id, old.comment); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS timerangedmodel_fts_update AFTER UPDATE ON timerangedmodel BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, comment) VALUES ('delete', old.id, old.comment); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, comment) VALUES (new.id, new.comment); "
+    "END",
+)
+
+search_table = table(SEARCH_TABLE, column("rowid"), column("comment"))
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def create_search_index(target, connection, **kwargs):
+    """
+    Create the search index and the triggers that keep it in sync with every insert, update and delete of a comment.
+
+    It runs after every `create_all`, so databases created before the index existed get it too. A new index is rebuilt from the comments
+    that are already there.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": SEARCH_TABLE}
+    ).first()
+
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+
+    if not exists:
+        connection.execute(
+            text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+        )
+
+
+@event.listens_for(SQLModel.metadata, "before_drop")
+def drop_search_index(target, connection, **kwargs):
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
 T = TypeVar("T")
 
 TimerangeFilterFunction = Callable[[Any, SelectOfScalar[T]], SelectOfScalar[T]]
 
 
+class Timerange:
+    """
+    Filters a query on a datetime column. Call it on a SQLAlchemy expression to add the filters. Created by `with_timerange`.
+
+    The bounds are kept, so they can also key caches of the filtered results.
+    """
+
+    def __init__(self, time_from: Optional[datetime], time_to: Optional[datetime]):
+        self.time_from = time_from
+        self.time_to = time_to
+
+    def __call__(self, column, query: SelectOfScalar[T]) -> SelectOfScalar[T]:
+        """
+        :param column: Column of `T` that can be filtered as a datetime.
+        :param query: The actual SQLAlchemy query that has not yet been executed.
+        :return: The query with time filters applied.
+        """
+        if self.time_to:
+            query = query.where(column <= self.time_to)
+
+        if self.time_from:
+            query = query.where(column >= self.time_from)
+
+        return query
+
+
 def with_timerange(
     time_from: Optional[datetime] = Query(
         None, description="The minimum datetime of items to include"
@@ -35,7 +208,7 @@ def with_timerange(
     time_to: Optional[datetime] = Query(
         None, description="The maximum datetime of items to include"
     ),
-) -> TimerangeFilterFunction:
+) -> Timerange:
     """
     A FastAPI dependency to generically filter on a date column.
 
@@ -47,87 +220,500 @@ def with_timerange(
     :param time_to: Latest datetime to be included in the results.
     :return: A function to apply time filters. Call it on a SQLAlchemy expression to add the filters.
     """
+    return Timerange(time_from, time_to)
 
-    def apply_timerange(column, query: SelectOfScalar[T]) -> SelectOfScalar[T]:
-        """
-        :param column: Column of `T` that can be filtered as a datetime.
-        :param query: The actual SQLAlchemy query that has not yet been executed.
-        :return: The query with time filters applied.
-        """
-        if time_to:
-            query = query.where(column <= time_to)
 
-        if time_from:
-            query = query.where(column >= time_from)
+PaginatorFilterFunction = Callable[[SelectOfScalar[T]], SelectOfScalar[T]]
 
-        return query
 
-    return apply_timerange
+class OffsetPagination:
+    """
+    Applies pagination to a query with `LIMIT` and `OFFSET`. Created by `with_paginator`.
+    """
 
+    def __init__(self, page: int, page_size: int):
+        self.page = page
+        self.page_size = page_size
 
-PaginatorFilterFunction = Callable[[SelectOfScalar[T]], SelectOfScalar[T]]
+    def __call__(self, query: SelectOfScalar[T]) -> SelectOfScalar[T]:
+        """
+        Apply pagination to the SQL query.
+        :param query: An existing query that we want to paginate.
+        :return: The query with pagination applied.
+        """
+        return query.limit(self.page_size).offset(self.page_size * self.page)
 
 
 def with_paginator(
     page: int = Query(0, ge=0, le=2**8), page_size: int = Query(100, ge=0, le=1000)
-) -> PaginatorFilterFunction:
+) -> OffsetPagination:
     """
     A FastAPI dependency to apply pagination via the SQL query. See `playground.paginator.with_paginator` for more details.
 
     It is generic and can be used to paginate any SQL query.
     """
+    return OffsetPagination(page, page_size)
+
+
+def encode_cursor(values: Tuple[Any, ...], direction: str) -> str:
+    """
+    Encode the sort key of a row into an opaque cursor. The cursor is signed so clients cannot forge or edit it.
+
+    :param values: The sort key of the row the cursor points at. Datetimes are stored as ISO strings.
+    :param direction: Either `next` or `prev`. Tells the paginator which way to seek from the cursor.
+    :return: A url-safe string of the form `<payload>.<signature>`.
+    """
+    raw = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    payload = base64.urlsafe_b64encode(json.dumps([direction, raw]).encode()).rstrip(
+        b"="
+    )
+    signature = hmac.new(
+        get_settings().pagination_cursor_secret.encode(), payload, hashlib.sha256
+    ).digest()[:16]
+
+    return f"{payload.decode()}.{base64.urlsafe_b64encode(signature).rstrip(b'=').decode()}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, List[Any]]:
+    """
+    Verify and decode a cursor created by `encode_cursor`.
+
+    :param cursor: The cursor as sent by the client.
+    :return: The direction and the raw sort key values. Datetime values are left as ISO strings.
+    :raises HTTPException: When the cursor is malformed or the signature does not match.
+    """
+    try:
+        payload, signature = cursor.encode().split(b".")
+        expected = hmac.new(
+            get_settings().pagination_cursor_secret.encode(), payload, hashlib.sha256
+        ).digest()[:16]
+
+        if not hmac.compare_digest(
+            base64.urlsafe_b64decode(signature + b"=" * (-len(signature) % 4)), expected
+        ):
+            raise ValueError("Signature mismatch")
+
+        direction, values = json.loads(
+            base64.urlsafe_b64decode(payload + b"=" * (-len(payload) % 4))
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor") from e
+
+    if direction not in ("next", "prev") or not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+    return direction, values
+
 
-    def apply_pagination(query: SelectOfScalar[T]) -> SelectOfScalar[T]:
+def get_cursor_types(column: Any) -> Tuple[type, ...]:
+    """
+    Get the types the value of `column` may have in a cursor. Float columns accept ints as well, JSON does not tell them apart.
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        # Expressions without a type, e.g. the result of a SQL function.
+        return int, float, str
+
+    return (int, float) if python_type is float else (python_type,)
+
+
+class KeysetPage(GenericModel, Generic[T]):
+    """
+    A page of results produced by keyset pagination. Pass `next_cursor` or `prev_cursor` as `cursor` to move between pages.
+    """
+
+    page_size: int
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+    data: List[T]
+
+
+class KeysetPaginator:
+    """
+    Paginates a SQL query by seeking past the sort key of the last row, instead of skipping rows with `OFFSET`.
+
+    Every page costs O(page_size) as long as the sort columns are covered by an index, no matter how deep the page is.
+    """
+
+    def __init__(self, cursor: Optional[str], page_size: int):
+        self.page_size = page_size
+        self.direction, self.values = (
+            decode_cursor(cursor) if cursor else ("next", None)
+        )
+
+    def apply(
+        self, columns: Tuple[Any, ...], query: SelectOfScalar[T]
+    ) -> SelectOfScalar[T]:
         """
-        Apply pagination to the SQL query.
-        :param query: An existing query that we want to paginate.
-        :return: The query with pagination applied.
+        Add the seek condition, ordering and limit to the query. One extra row is fetched to detect if there are more pages.
+
+        :param columns: The columns that make up the sort key. The last column must be unique, e.g. the primary key.
+        :param query: The actual SQLAlchemy query that has not yet been executed.
+        :return: The query with keyset pagination applied.
         """
-        return query.limit(page_size).offset(page_size * page)
+        key = tuple_(*columns)
+
+        if self.values is not None:
+            values = self.decode_values(columns)
+            query = query.where(
+                key > values if self.direction == "next" else key < values
+            )
 
-    return apply_pagination
+        if self.direction == "next":
+            query = query.order_by(*columns)
+        else:
+            query = query.order_by(*(column.desc() for column in columns))
+
+        return query.limit(self.page_size + 1)
+
+    def decode_values(self, columns: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        """
+        Turn the values of the cursor back into the sort key of `columns`. The signing secret may leak, so the values are checked as well.
+        :raises HTTPException: When the values do not match the columns in number or type.
+        """
+        if len(self.values) != len(columns):
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+        values = []
+
+        for column, value in zip(columns, self.values):
+            try:
+                if isinstance(column.type, DateTime):
+                    value = datetime.fromisoformat(value)
+                elif isinstance(value, bool) or not isinstance(
+                    value, get_cursor_types(column)
+                ):
+                    raise TypeError(f"Unexpected {type(value).__name__} for {column}")
+            except (TypeError, ValueError) as e:
+                raise HTTPException(
+                    status_code=400, detail="Invalid pagination cursor"
+                ) from e
+
+            values.append(value)
+
+        return tuple(values)
+
+    def paginate(
+        self, rows: List[T], key: Callable[[T], Tuple[Any, ...]]
+    ) -> KeysetPage[T]:
+        """
+        Turn the rows of a query created with `apply` into a page with cursors.
+
+        :param rows: The rows returned by the database.
+        :param key: Function that returns the sort key of a row. Should match the `columns` passed to `apply`.
+        :return: The page of rows, in ascending order, and the cursors to the neighbouring pages.
+        """
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+
+        if self.direction == "prev":
+            rows.reverse()
+
+        # Rows ahead of us exist if the extra row was fetched. Rows behind us exist if we came from a cursor.
+        ahead, behind = has_more, self.values is not None
+        has_next, has_prev = (
+            (ahead, behind) if self.direction == "next" else (behind, ahead)
+        )
+
+        next_cursor = prev_cursor = None
+
+        if rows and has_next:
+            next_cursor = encode_cursor(key(rows[-1]), "next")
+
+        if rows and has_prev:
+            prev_cursor = encode_cursor(key(rows[0]), "prev")
+
+        return KeysetPage(
+            page_size=self.page_size,
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor,
+            data=rows,
+        )
+
+
+def with_keyset_paginator(
+    cursor: Optional[str] = Query(
+        None,
+        description="Opaque cursor taken from `next_cursor` or `prev_cursor` of a previous page",
+    ),
+    page_size: int = Query(100, ge=1, le=1000),
+) -> KeysetPaginator:
+    """
+    A FastAPI dependency to apply keyset (seek) pagination via the SQL query.
+
+    Unlike `with_paginator`, the cost of a page does not grow with its depth. It is generic and can be used on any query with an indexed, unique sort key.
+    """
+    return KeysetPaginator(cursor, page_size)
+
+
+@lru_cache(None)
+def get_comment_cache() -> QueryCache:
+    """
+    Get the application wide `QueryCache` of the comment queries of `get_comments`.
+    """
+    return QueryCache("timeranged", get_settings().timeranged_query_cache_max_rows)
+
+
+async def invalidate_comments(dates: List[datetime]):
+    """
+    Invalidate what was cached about the comments after comments with `dates` were written.
+
+    Cached responses are all dropped. Cached queries are only dropped if their time range covers one of the dates.
+    """
+    if dates:
+        await get_comment_cache().publish(min(dates), max(dates))
+
+    await invalidate_responses("timeranged")
 
 
 @time_range_router.get("/", response_model=List[TimeRangedModel], tags=["Pagination"])
+@cache_response(tags=["timeranged"])
+@trusted_response()
 async def get_comments(
-    session: AsyncSession = Depends(get_session),
-    apply_timerange=Depends(with_timerange),
-    paginator=Depends(with_paginator),
+    session: AsyncSession = Depends(get_read_session),
+    apply_timerange: Timerange = Depends(with_timerange),
+    paginator: OffsetPagination = Depends(with_paginator),
 ):
     """
     Get a list of all `TimeRangedModels`. It uses an async database engine and is non-blocking.
 
-    Filtering and pagination are applied by the dependencies.
+    Filtering and pagination are applied by the dependencies. Results are cached per time range and page. A new comment only evicts the
+    cached results whose time range covers it.
 
     :param session: Async database session to use for queries
     :param apply_timerange: Function to add time filtering to a query.
     :param paginator: Function to add pagination to a query.
     :return: All comments that match the filters.
     """
-    query = select(TimeRangedModel)
+    cache = get_comment_cache()
+    key = (
+        normalize_date(apply_timerange.time_from),
+        normalize_date(apply_timerange.time_to),
+        paginator.page,
+        paginator.page_size,
+    )
+    usable = await cache.sync()
+
+    if usable and (rows := cache.get(key)) is not None:
+        return rows
+
+    generation = cache.generation
+    query = select(
+        TimeRangedModel.id, TimeRangedModel.comment, TimeRangedModel.date_created
+    )
     query = apply_timerange(TimeRangedModel.date_created, query)
     query = paginator(query)
 
+    result = await session.execute(query)
+    rows = [dict(row) for row in result.mappings()]
+
+    if usable:
+        cache.put(
+            key, rows, apply_timerange.time_from, apply_timerange.time_to, generation
+        )
+
+    return rows
+
+
+@time_range_router.get(
+    "/keyset", response_model=KeysetPage[TimeRangedModel], tags=["Pagination"]
+)
+@trusted_response()
+async def get_comments_keyset(
+    session: AsyncSession = Depends(get_read_session),
+    apply_timerange=Depends(with_timerange),
+    paginator: KeysetPaginator = Depends(with_keyset_paginator),
+):
+    """
+    Get a page of `TimeRangedModels` ordered by `date_created`, using keyset pagination.
+
+    Follow `next_cursor` and `prev_cursor` to walk through the results. Each page seeks through the `(date_created, id)` index.
+    """
+    query = select(TimeRangedModel)
+    query = apply_timerange(TimeRangedModel.date_created, query)
+    query = paginator.apply((TimeRangedModel.date_created, TimeRangedModel.id), query)
+
     result = await session.exec(query)
 
-    return result.all()
+    return paginator.paginate(
+        result.all(), lambda comment: (comment.date_created, comment.id)
+    )
 
 
-@time_range_router.post("/")
-async def create_test_comments(session: AsyncSession = Depends(get_session)):
-    """ "
-    Create a set of `TimeRangedModels` as an example.
+@time_range_router.get(
+    "/paginated",
+    response_model=PaginatedResult[TimeRangedModel],
+    tags=["Pagination"],
+)
+@trusted_response()
+async def get_comments_paginated(
+    session: AsyncSession = Depends(get_read_session),
+    apply_timerange=Depends(with_timerange),
+    paginator: Paginator = Depends(with_counted_paginator),
+):
+    """
+    Get a page of `TimeRangedModels` together with the total amount of comments and pages.
+
+    The total is counted once per filter and cached for a while, so walking through the pages does not recount all rows.
     """
-    for i in range(10):
-        comment = TimeRangedModel(
-            comment=f"Comment {i}",
-            date_created=datetime.now(),
+    query = select(TimeRangedModel).order_by(TimeRangedModel.id)
+    query = apply_timerange(TimeRangedModel.date_created, query)
+
+    return await paginator.query(session, query)
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "msgpack": "application/msgpack",
+}
+
+EXPORT_COLUMNS = ("id", "comment", "date_created")
+
+
+def encode_export_rows(export_format: str, rows: List[Dict[str, Any]]) -> bytes:
+    """
+    Encode a batch of exported rows. Batches can be concatenated, so each one can be sent as soon as it is encoded.
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, EXPORT_COLUMNS).writerows(rows)
+        return buffer.getvalue().encode()
+
+    if export_format == "msgpack":
+        return b"".join(
+            msgpack.packb(
+                {**row, "date_created": row["date_created"].isoformat()},
+                use_bin_type=True,
+            )
+            for row in rows
         )
 
-        session.add(comment)
+    return b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+
+@time_range_router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "The comments, encoded one by one as they are read from the database.",
+            "content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()},
+        }
+    },
+)
+async def export_comments(
+    export_format: Literal["ndjson", "csv", "msgpack"] = Query(
+        "ndjson", alias="format"
+    ),
+    fetch_size: int = Query(1000, ge=1, le=10_000),
+    session: AsyncSession = Depends(get_read_session),
+    apply_timerange=Depends(with_timerange),
+):
+    """
+    Export all `TimeRangedModels` that match the time filters as NDJSON, CSV or a stream of msgpack objects.
+
+    Rows are read with a server side cursor, `fetch_size` at a time, and are encoded while the response is being sent.
+    Memory use stays flat no matter how many comments are exported.
+    """
+    query = select(
+        TimeRangedModel.id, TimeRangedModel.comment, TimeRangedModel.date_created
+    ).order_by(TimeRangedModel.date_created, TimeRangedModel.id)
+    query = apply_timerange(TimeRangedModel.date_created, query)
+
+    async def generate() -> AsyncIterator[bytes]:
+        if export_format == "csv":
+            yield ",".join(EXPORT_COLUMNS).encode() + b"\r\n"
+
+        result = await session.stream(query)
+
+        async for rows in result.mappings().partitions(fetch_size):
+            yield encode_export_rows(export_format, [dict(row) for row in rows])
+
+    return StreamingResponse(generate(), media_type=EXPORT_MEDIA_TYPES[export_format])
+
+
+LiveComment = Dict[str, Any]
+
+
+@lru_cache(None)
+def get_comment_bus() -> BroadcastBus[List[LiveComment]]:
+    """
+    Get the application wide `BroadcastBus` that new comments are published on, a batch per commit.
+    """
+    return BroadcastBus("timeranged")
+
+
+@lru_cache(None)
+def get_comment_relay() -> BroadcastRelay:
+    """
+    Get the `BroadcastRelay` that publishes the comments of other workers on the bus of this one.
+    """
+    return BroadcastRelay(
+        get_comment_bus(), get_settings().timeranged_live_relay_interval
+    )
+
+
+def to_live_comment(row: Dict[str, Any]) -> LiveComment:
+    """
+    Turn a comment into the message the live subscribers get. The date is a string, so the shared store can relay it.
+    """
+    return {
+        "id": row["id"],
+        "comment": row["comment"],
+        "date_created": row["date_created"].isoformat(),
+    }
+
+
+async def insert_comments(session: AsyncSession, rows: List[Dict[str, Any]]):
+    """
+    Insert rows into the `TimeRangedModel` table with a single executemany-style Core insert and commit them.
+
+    This skips the ORM unit of work, which would track and flush every object one by one. The inserted comments are read back for the
+    live subscribers, but only if this or another worker may have any.
+    """
+    await session.execute(insert(TimeRangedModel.__table__), rows)
+    comments: List[LiveComment] = []
+
+    if rows and (get_comment_bus().subscriptions or get_shared_store() is not None):
+        # The insert holds SQLite's write lock until the commit, so the newest comments are the ones we just inserted.
+        query = (
+            select(
+                TimeRangedModel.id,
+                TimeRangedModel.comment,
+                TimeRangedModel.date_created,
+            )
+            .order_by(TimeRangedModel.id.desc())
+            .limit(len(rows))
+        )
+        result = await session.execute(query)
+        comments = [to_live_comment(row) for row in reversed(result.mappings().all())]
 
     await session.commit()
 
+    await invalidate_comments([row["date_created"] for row in rows])
+
+    if comments:
+        await get_comment_bus().share(comments)
+
+
+@time_range_router.post("/")
+async def create_test_comments(session: AsyncSession = Depends(get_session)):
+    """ "
+    Create a set of `TimeRangedModels` as an example.
+    """
+    await insert_comments(
+        session,
+        [
+            {"comment": f"Comment {i}", "date_created": datetime.now()}
+            for i in range(10)
+        ],
+    )
+
 
 class ModelCreateSerializer(BaseModel):
     comment: str = Field(..., min_length=3)
@@ -141,7 +727,617 @@ async def create_new(
 
     session.add(time_model)
 
+    # The session does not expire objects on commit and the id is set during the flush, so there is nothing to refresh.
     await session.commit()
-    await session.refresh(time_model)
+
+    await invalidate_comments([time_model.date_created])
+    await get_comment_bus().share([to_live_comment(time_model.dict())])
 
     return time_model
+
+
+async def follow_comments(
+    session: AsyncSession, subscription: Subscription, last_event_id: Optional[int]
+) -> AsyncIterator[Optional[LiveComment]]:
+    """
+    Yield the comments after `last_event_id` from the database, and then every new comment that is published on `subscription`.
+
+    The subscription has to exist before the comments are read back, so nothing committed in between is missed. Comments that were read
+    back are skipped when they are published. After that the session is closed, so idle subscribers cost no database connection or query.
+    New comments are yielded as they are published, which may be slightly out of order across concurrent writes.
+
+    :param session: Async database session to read back missed comments with.
+    :param subscription: Subscription to the bus of `get_comment_bus`.
+    :param last_event_id: The id of the last comment the subscriber got, or `None` to only follow new comments.
+    :return: The comments, and `None` every `timeranged_live_heartbeat` seconds without any, so the caller can send a keepalive.
+    :raises SubscriptionClosed: When the subscriber fell too far behind. It should resume from the last comment it got.
+    """
+    settings = get_settings()
+    resumed = last_event_id
+
+    if last_event_id is not None:
+        page_size = settings.timeranged_live_resume_page_size
+
+        while True:
+            query = (
+                select(
+                    TimeRangedModel.id,
+                    TimeRangedModel.comment,
+                    TimeRangedModel.date_created,
+                )
+                .where(TimeRangedModel.id > resumed)
+                .order_by(TimeRangedModel.id)
+                .limit(page_size)
+            )
+            rows = (await session.execute(query)).mappings().all()
+
+            for row in rows:
+                yield to_live_comment(row)
+
+            if rows:
+                resumed = rows[-1]["id"]
+
+            if len(rows) < page_size:
+                break
+
+    await session.close()
+
+    while True:
+        comments = await subscription.get(settings.timeranged_live_heartbeat)
+
+        if comments is None:
+            yield None
+            continue
+
+        for comment in comments:
+            if resumed is None or comment["id"] > resumed:
+                yield comment
+
+
+def encode_live_event(comment: Optional[LiveComment]) -> bytes:
+    """
+    Encode a comment as a server-sent event, or a keepalive comment line for `None`.
+    """
+    if comment is None:
+        return b": keepalive\n\n"
+
+    return b"id: %d\nevent: comment\ndata: %s\n\n" % (
+        comment["id"],
+        orjson.dumps(comment),
+    )
+
+
+@time_range_router.get(
+    "/live",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Server-sent events, one `comment` event per new comment.",
+            "content": {"text/event-stream": {}},
+        }
+    },
+    tags=["Live"],
+)
+async def get_live_comments(
+    last_event_id: Optional[int] = Header(
+        None,
+        description="Resume after the comment with this id. Browsers send it when they reconnect",
+    ),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Follow new `TimeRangedModels` as server-sent events. The id of every event is the id of the comment.
+
+    A client that reconnects with `Last-Event-ID` first gets the comments it missed. Idle streams get a keepalive comment line. A client
+    that falls too far behind gets an `error` event and is disconnected, and resumes from its last event when it reconnects.
+    """
+    settings = get_settings()
+
+    async def generate() -> AsyncIterator[bytes]:
+        with get_comment_bus().subscribe(
+            settings.timeranged_live_buffer_size
+        ) as subscription:
+            yield b"retry: 1000\n\n"
+
+            try:
+                async for comment in follow_comments(
+                    session, subscription, last_event_id
+                ):
+                    yield encode_live_event(comment)
+            except SubscriptionClosed as e:
+                yield b"event: error\ndata: %s\n\n" % orjson.dumps({"detail": e.reason})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        # Proxies must pass every event on right away.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@time_range_router.websocket("/live")
+async def follow_live_comments(
+    websocket: WebSocket,
+    last_event_id: Optional[int] = Query(
+        None, description="Resume after the comment with this id"
+    ),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Follow new `TimeRangedModels` over a WebSocket, one JSON text message per comment. Messages from the client are ignored.
+
+    A client that falls too far behind is closed with code 1013, and should reconnect with the id of the last comment it got.
+    """
+    await websocket.accept()
+
+    with get_comment_bus().subscribe(
+        get_settings().timeranged_live_buffer_size
+    ) as subscription:
+
+        async def watch_disconnect():
+            try:
+                while (await websocket.receive())["type"] != "websocket.disconnect":
+                    pass
+            finally:
+                subscription.close("Disconnected")
+
+        watcher = asyncio.create_task(watch_disconnect())
+
+        try:
+            async for comment in follow_comments(session, subscription, last_event_id):
+                if comment is not None:
+                    await websocket.send_text(orjson.dumps(comment).decode())
+        except SubscriptionClosed as e:
+            if not watcher.done():
+                await websocket.close(code=1013, reason=e.reason)
+        finally:
+            watcher.cancel()
+
+
+class BulkChunkResult(BaseModel):
+    rows: int
+    seconds: float
+    rows_per_second: float
+
+
+class BulkInsertResult(BaseModel):
+    inserted: int
+    chunks: List[BulkChunkResult]
+
+
+async def iter_request_items(request: Request) -> AsyncIterator[Any]:
+    """
+    Decode the items of a bulk request body. NDJSON and msgpack bodies are decoded while they stream in.
+
+    Supported content types are `application/json` (an array), `application/x-ndjson` and `application/msgpack`.
+    A msgpack body can either be a single array or a stream of objects.
+    """
+    content_type = request.headers.get("content-type", "application/json")
+    content_type = content_type.split(";")[0].strip()
+
+    if content_type in ("application/x-ndjson", "application/ndjson"):
+        buffer = b""
+
+        async for chunk in request.stream():
+            *lines, buffer = (buffer + chunk).split(b"\n")
+
+            for line in lines:
+                if line.strip():
+                    yield orjson.loads(line)
+
+        if buffer.strip():
+            yield orjson.loads(buffer)
+    elif content_type in ("application/msgpack", "application/x-msgpack"):
+        unpacker = msgpack.Unpacker(raw=False)
+
+        async for chunk in request.stream():
+            unpacker.feed(chunk)
+
+            for item in unpacker:
+                if isinstance(item, list):
+                    for element in item:
+                        yield element
+                else:
+                    yield item
+    elif content_type == "application/json":
+        items = orjson.loads(await request.body())
+
+        if not isinstance(items, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array")
+
+        for item in items:
+            yield item
+    else:
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported content type {content_type}"
+        )
+
+
+@time_range_router.post(
+    "/bulk",
+    response_model=BulkInsertResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                content_type: {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/ModelCreateSerializer"},
+                    }
+                }
+                for content_type in (
+                    "application/json",
+                    "application/x-ndjson",
+                    "application/msgpack",
+                )
+            },
+        }
+    },
+)
+async def create_bulk(
+    request: Request,
+    chunk_size: int = Query(1000, ge=1, le=10_000),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Create many `TimeRangedModels` at once from a JSON array, an NDJSON stream or msgpack.
+
+    Rows are validated and inserted per chunk of `chunk_size`, every chunk in its own transaction. Chunks before an invalid row stay inserted.
+    """
+    result = BulkInsertResult(inserted=0, chunks=[])
+    chunk: List[Any] = []
+
+    async def flush():
+        started = time.perf_counter()
+
+        try:
+            models = parse_obj_as(List[ModelCreateSerializer], chunk)
+        except ValidationError as e:
+            errors = e.errors()
+
+            for error in errors:
+                error["loc"] = (
+                    "body",
+                    result.inserted + error["loc"][1],
+                    *error["loc"][2:],
+                )
+
+            raise HTTPException(status_code=422, detail=errors) from e
+
+        now = datetime.now()
+        await insert_comments(
+            session,
+            [{"comment": model.comment, "date_created": now} for model in models],
+        )
+
+        seconds = time.perf_counter() - started
+        result.inserted += len(models)
+        result.chunks.append(
+            BulkChunkResult(
+                rows=len(models),
+                seconds=seconds,
+                rows_per_second=len(models) / seconds if seconds else 0,
+            )
+        )
+        chunk.clear()
+
+    try:
+        async for item in iter_request_items(request):
+            chunk.append(item)
+
+            if len(chunk) >= chunk_size:
+                await flush()
+    except (orjson.JSONDecodeError, msgpack.UnpackException, ValueError) as e:
+        raise HTTPException(status_code=422, detail="Invalid request body") from e
+
+    if chunk:
+        await flush()
+
+    return result
+
+
+# How SQLite truncates a date to the start of its bucket, in the format SQLAlchemy stores dates in.
+HISTOGRAM_BUCKETS = {
+    "minute": "%Y-%m-%d %H:%M:00.000000",
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+HistogramBucketName = Literal["minute", "hour", "day"]
+
+
+def truncate_date(column, bucket: str):
+    """
+    Truncate a date column to the start of its bucket, e.g. the whole hour. The result compares and loads as a datetime again.
+    """
+    return type_coerce(func.strftime(HISTOGRAM_BUCKETS[bucket], column), DateTime)
+
+
+async def get_rollup_watermark(session: AsyncSession) -> int:
+    watermark = await session.get(RollupWatermark, TimeRangedModel.__tablename__)
+
+    return watermark.last_id if watermark else 0
+
+
+async def compact_rollups(session: AsyncSession) -> int:
+    """
+    Fold all comments above the watermark into the rollups of every bucket and move the watermark past them, in a single transaction.
+
+    Every worker process runs a compactor. The watermark is only moved if no other compactor moved it since it was read, and the rollups
+    are only written after that, so comments are never folded twice.
+    :return: The amount of comments folded.
+    """
+    watermark = await get_rollup_watermark(session)
+    last_id = (await session.execute(select(func.max(TimeRangedModel.id)))).scalar()
+
+    if last_id is None or last_id <= watermark:
+        await session.rollback()
+        return 0
+
+    counts = {}
+
+    for bucket in HISTOGRAM_BUCKETS:
+        start = truncate_date(TimeRangedModel.date_created, bucket)
+        query = (
+            select(start, func.count())
+            .where(TimeRangedModel.id > watermark, TimeRangedModel.id <= last_id)
+            .group_by(start)
+        )
+        counts[bucket] = (await session.execute(query)).all()
+
+    # The first write takes SQLite's write lock, so nothing can move the watermark between this check and the commit.
+    watermarks = RollupWatermark.__table__
+    upsert = sqlite_insert(watermarks)
+    moved = await session.execute(
+        upsert.on_conflict_do_update(
+            index_elements=[watermarks.c.name],
+            set_={"last_id": upsert.excluded.last_id},
+            where=watermarks.c.last_id == watermark,
+        ),
+        {"name": TimeRangedModel.__tablename__, "last_id": last_id},
+    )
+
+    if moved.rowcount == 0:
+        await session.rollback()
+        return 0
+
+    folded = 0
+    rollups = TimeRangedRollup.__table__
+
+    for bucket, bucket_counts in counts.items():
+        if not bucket_counts:
+            continue
+
+        upsert = sqlite_insert(rollups)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[rollups.c.bucket, rollups.c.bucket_start],
+            set_={"count": rollups.c.count + upsert.excluded.count},
+        )
+        await session.execute(
+            upsert,
+            [
+                {"bucket": bucket, "bucket_start": bucket_start, "count": count}
+                for bucket_start, count in bucket_counts
+            ],
+        )
+        # Every bucket size counts the same comments.
+        folded = sum(count for _, count in bucket_counts)
+
+    await session.commit()
+
+    return folded
+
+
+class RollupCompactor:
+    """
+    Folds new comments into the rollups every `interval` seconds, on a background task.
+
+    Comments are never counted twice or missed, no matter how they were inserted: the watermark and the rollups move in one transaction,
+    and histograms count the comments above the watermark themselves.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.folded = 0
+        self.last_error: Optional[str] = None
+
+    async def compact(self):
+        async with (await get_session_factory())() as session:
+            self.folded += await compact_rollups(session)
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await self.compact()
+                self.last_error = None
+            except Exception as e:
+                # Try again next time. Until then, histograms count the comments above the watermark themselves.
+                self.last_error = str(e) or type(e).__name__
+
+    def start(self):
+        self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+            self.task = None
+
+
+@lru_cache(None)
+def get_rollup_compactor() -> RollupCompactor:
+    """
+    Get the application wide `RollupCompactor`.
+    """
+    return RollupCompactor(get_settings().timeranged_rollup_interval)
+
+
+class HistogramBucket(BaseModel):
+    start: datetime
+    count: int
+
+
+@time_range_router.get(
+    "/histogram", response_model=List[HistogramBucket], tags=["Aggregation"]
+)
+@cache_response(tags=["timeranged"])
+@trusted_response()
+async def get_histogram(
+    bucket: HistogramBucketName = Query("hour"),
+    session: AsyncSession = Depends(get_read_session),
+    apply_timerange=Depends(with_timerange),
+):
+    """
+    Count the `TimeRangedModels` per minute, hour or day.
+
+    Counts are read from the rollups, one row per bucket, plus the few comments that have not been compacted yet. The time filters apply to
+    the start of the buckets, so buckets are always counted whole.
+    """
+    start = truncate_date(TimeRangedModel.date_created, bucket)
+    watermark = await get_rollup_watermark(session)
+
+    rollups = select(TimeRangedRollup.bucket_start, TimeRangedRollup.count).where(
+        TimeRangedRollup.bucket == bucket
+    )
+    rollups = apply_timerange(TimeRangedRollup.bucket_start, rollups)
+    pending = (
+        select(start, func.count())
+        .where(TimeRangedModel.id > watermark)
+        .group_by(start)
+    )
+    pending = apply_timerange(start, pending)
+
+    counts: Counter = Counter()
+
+    for query in (rollups, pending):
+        for bucket_start, count in (await session.execute(query)).all():
+            counts[bucket_start] += count
+
+    return [
+        {"start": bucket_start, "count": count}
+        for bucket_start, count in sorted(counts.items())
+    ]
+
+
+def to_match_query(q: str) -> str:
+    """
+    Turn a search into an FTS5 query that matches comments containing all of its terms.
+
+    Every term is quoted, so FTS5 operators and syntax in the search are matched literally instead of raising an error. A trailing `*`
+    searches for the term as a prefix.
+    """
+    terms = []
+
+    for term in q.split():
+        prefix = "*" if term.endswith("*") else ""
+        term = term.rstrip("*")
+
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + prefix)
+
+    return " ".join(terms)
+
+
+class CommentSearch:
+    """
+    A full-text search on `TimeRangedModel.comment`, backed by the FTS5 index.
+
+    `rank` is the bm25 score of a comment, where lower is more relevant. `snippet` is the part of the comment with the most matches, with
+    every match wrapped in `<mark>` tags. The comment itself is not escaped.
+    """
+
+    def __init__(self, match: str, snippet_tokens: int):
+        self.match = match
+        self.rank = func.bm25(literal_column(SEARCH_TABLE))
+        self.snippet = func.snippet(
+            literal_column(SEARCH_TABLE), 0, "<mark>", "</mark>", "…", snippet_tokens
+        )
+
+    def apply(self, query: SelectOfScalar[T]) -> SelectOfScalar[T]:
+        """
+        Join the index and only keep the comments that match.
+        :param query: A query on `TimeRangedModel` that has not yet been executed.
+        :return: The query with the search applied.
+        """
+        return query.join(
+            search_table, search_table.c.rowid == TimeRangedModel.id
+        ).where(literal_column(SEARCH_TABLE).op("MATCH")(self.match))
+
+
+def with_search(
+    q: str = Query(
+        ...,
+        min_length=1,
+        max_length=256,
+        description="Words the comments must contain. End a word with `*` to search for it as a prefix",
+    ),
+    snippet_tokens: int = Query(
+        12, ge=1, le=64, description="The maximum amount of words in a snippet"
+    ),
+) -> CommentSearch:
+    """
+    A FastAPI dependency to search comments. Combine it with `with_timerange` and `with_keyset_paginator` on the same query.
+
+    :raises HTTPException: When the search has no terms.
+    """
+    match = to_match_query(q)
+
+    if not match:
+        raise HTTPException(status_code=400, detail="The search has no terms")
+
+    return CommentSearch(match, snippet_tokens)
+
+
+class CommentSearchResult(BaseModel):
+    id: int
+    comment: str
+    date_created: datetime
+    # The bm25 score of the comment. Lower is more relevant.
+    rank: float
+    snippet: str
+
+
+@time_range_router.get(
+    "/search", response_model=KeysetPage[CommentSearchResult], tags=["Search"]
+)
+@cache_response(tags=["timeranged"])
+@trusted_response()
+async def search_comments(
+    session: AsyncSession = Depends(get_read_session),
+    search: CommentSearch = Depends(with_search),
+    apply_timerange=Depends(with_timerange),
+    paginator: KeysetPaginator = Depends(with_keyset_paginator),
+):
+    """
+    Search the `TimeRangedModels` by their comment, most relevant first, with a highlighted snippet of every match.
+
+    Pages seek past the `(rank, id)` of the last result. Scores change as comments are added, so a cursor taken before that may skip or
+    repeat a few results.
+    """
+    query = select(TimeRangedModel, search.rank, search.snippet)
+    query = search.apply(query)
+    query = apply_timerange(TimeRangedModel.date_created, query)
+    query = paginator.apply((search.rank, TimeRangedModel.id), query)
+
+    result = await session.execute(query)
+    rows = [
+        CommentSearchResult(
+            id=comment.id,
+            comment=comment.comment,
+            date_created=comment.date_created,
+            rank=rank,
+            snippet=snippet,
+        )
+        for comment, rank, snippet in result.all()
+    ]
+
+    return paginator.paginate(rows, lambda row: (row.rank, row.id))
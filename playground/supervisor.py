@@ -0,0 +1,256 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import uvicorn
+from uvicorn import Config
+
+from playground.providers.shared_store import run_store_server
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    A uvicorn server that signals `ready` once the app has started and the server accepts connections.
+    """
+
+    def __init__(self, config: Config, ready):
+        super().__init__(config)
+        self.ready = ready
+
+    async def startup(self, sockets: Optional[list] = None):
+        await super().startup(sockets=sockets)
+
+        if not self.should_exit:
+            self.ready.set()
+
+
+def run_worker(config: Config, sockets: List[socket.socket], ready):
+    """
+    The target of a worker process: serve the app on the sockets of the supervisor until it receives SIGTERM or SIGINT.
+    """
+    # SIGHUP is meant for the supervisor. Workers may get it too, when it is sent to the whole process group.
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    config.configure_logging()
+    WorkerServer(config, ready).run(sockets=sockets)
+
+
+def run_store(path: str, max_size: int):
+    # A Ctrl+C or SIGHUP may reach the whole process group. The store has to outlive the workers, the supervisor stops it last.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    run_store_server(path, max_size)
+
+
+@dataclass
+class Worker:
+    process: multiprocessing.Process
+    ready: "multiprocessing.synchronize.Event"
+
+
+class Supervisor:
+    """
+    Runs `workers` uvicorn processes that all accept connections from one listening socket, and a store process they share state through.
+
+    Crashed workers are replaced. Signals control the workers:
+
+    - SIGHUP replaces all workers one by one. A new worker has to be ready before an old one is stopped, so capacity never drops.
+    - SIGTTIN adds a worker, SIGTTOU removes one.
+    - SIGTERM and SIGINT stop all workers, the store and the supervisor.
+
+    Stopped workers finish the requests they are handling, for up to `graceful_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        workers: int,
+        startup_timeout: float,
+        graceful_timeout: float,
+        store_path: Optional[str] = None,
+        store_max_size: int = 256 * 1024 * 1024,
+    ):
+        self.config = config
+        self.target_workers = workers
+        self.startup_timeout = startup_timeout
+        self.graceful_timeout = graceful_timeout
+        self.store_path = store_path or os.path.join(
+            tempfile.mkdtemp(prefix="playground-"), "store.sock"
+        )
+        self.store_max_size = store_max_size
+
+        # Workers are spawned, not forked, so they do not inherit the state of the supervisor.
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: List[Worker] = []
+        self.store: Optional[multiprocessing.Process] = None
+        self.sockets: List[socket.socket] = []
+        self.signals: List[int] = []
+        self.wakeup = threading.Event()
+        self.should_exit = False
+
+    def handle_signal(self, signum: int, frame):
+        self.signals.append(signum)
+        self.wakeup.set()
+
+    def start_store(self):
+        self.store = self.context.Process(
+            target=run_store,
+            args=(self.store_path, self.store_max_size),
+            name="playground-store",
+        )
+        self.store.start()
+        deadline = time.monotonic() + self.startup_timeout
+
+        while not os.path.exists(self.store_path):
+            if not self.store.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("The shared store did not start")
+
+            time.sleep(0.01)
+
+        # Workers read their settings from the environment they inherit.
+        os.environ["SHARED_STORE_PATH"] = self.store_path
+
+    def spawn(self) -> Worker:
+        ready = self.context.Event()
+        process = self.context.Process(
+            target=run_worker, args=(self.config, self.sockets, ready)
+        )
+        process.start()
+        worker = Worker(process, ready)
+        self.workers.append(worker)
+
+        return worker
+
+    def wait_ready(self, worker: Worker) -> bool:
+        deadline = time.monotonic() + self.startup_timeout
+
+        while not worker.ready.wait(0.1):
+            if not worker.process.is_alive() or time.monotonic() > deadline:
+                return False
+
+        return True
+
+    def stop_workers(self, workers: List[Worker]):
+        """
+        Send SIGTERM to `workers`, so they finish their requests and exit, and kill those that are still running after `graceful_timeout`.
+        """
+        for worker in workers:
+            self.workers.remove(worker)
+            worker.process.terminate()
+
+        deadline = time.monotonic() + self.graceful_timeout
+
+        for worker in workers:
+            worker.process.join(max(deadline - time.monotonic(), 0))
+
+            if worker.process.is_alive():
+                logger.warning(
+                    "Killing worker [%d] after %ss",
+                    worker.process.pid,
+                    self.graceful_timeout,
+                )
+                worker.process.kill()
+                worker.process.join()
+
+    def restart(self):
+        """
+        Replace every worker with a new one, one at a time. Stops at the first new worker that does not start, and keeps the rest.
+        """
+        logger.info("Restarting %d workers", len(self.workers))
+
+        for old in list(self.workers):
+            new = self.spawn()
+
+            if not self.wait_ready(new):
+                logger.error(
+                    "Worker [%d] did not start, stopping the restart", new.process.pid
+                )
+                self.stop_workers([new])
+                return
+
+            self.stop_workers([old])
+
+    def reap(self):
+        for worker in list(self.workers):
+            if not worker.process.is_alive():
+                logger.warning(
+                    "Worker [%d] exited with %s",
+                    worker.process.pid,
+                    worker.process.exitcode,
+                )
+                self.workers.remove(worker)
+
+        while len(self.workers) < self.target_workers:
+            self.spawn()
+
+        if len(self.workers) > self.target_workers:
+            self.stop_workers(self.workers[: len(self.workers) - self.target_workers])
+
+    def handle_signals(self):
+        while self.signals:
+            signum = self.signals.pop(0)
+
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                self.should_exit = True
+            elif signum == signal.SIGHUP:
+                self.restart()
+            elif signum == signal.SIGTTIN:
+                self.target_workers += 1
+            elif signum == signal.SIGTTOU:
+                self.target_workers = max(self.target_workers - 1, 1)
+
+    def run(self):
+        """
+        Start the store and the workers, and supervise them until SIGTERM or SIGINT.
+
+        The first worker starts on its own, so creating the tables and other startup work does not race between workers.
+        """
+        self.config.configure_logging()
+        self.start_store()
+        self.sockets = [self.config.bind_socket()]
+
+        for signum in (
+            signal.SIGTERM,
+            signal.SIGINT,
+            signal.SIGHUP,
+            signal.SIGTTIN,
+            signal.SIGTTOU,
+        ):
+            signal.signal(signum, self.handle_signal)
+
+        try:
+            if not self.wait_ready(self.spawn()):
+                raise RuntimeError("The first worker did not start")
+
+            logger.info("Started supervisor [%d]", os.getpid())
+
+            while not self.should_exit:
+                self.reap()
+                self.wakeup.wait(1.0)
+                self.wakeup.clear()
+                self.handle_signals()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.stop_workers(list(self.workers))
+
+        if self.store is not None:
+            self.store.terminate()
+            self.store.join()
+
+        for sock in self.sockets:
+            sock.close()
+
+        if os.path.exists(self.store_path):
+            os.unlink(self.store_path)
+
+        logger.info("Stopped supervisor [%d]", os.getpid())
@@ -0,0 +1,66 @@
+import pytest
+
+from benchmarks.harness import BenchmarkResult, compare, run_load, run_micro
+from benchmarks.scenarios import create_middleware_app
+
+
+def create_benchmark_result(
+    operations_per_second: float, p99: float
+) -> BenchmarkResult:
+    return BenchmarkResult(
+        name="load/example",
+        operations=100,
+        operations_per_second=operations_per_second,
+        p50=p99 / 2,
+        p95=p99,
+        p99=p99,
+    )
+
+
+@pytest.mark.parametrize(
+    "operations_per_second,p99,metrics",
+    [
+        (1000, 10, []),
+        (850, 11.5, []),
+        (700, 10, ["operations_per_second"]),
+        (1000, 13, ["p99"]),
+        (500, 20, ["operations_per_second", "p99"]),
+    ],
+)
+def test_compare_against_baseline(operations_per_second, p99, metrics):
+    baseline = {"load/example": create_benchmark_result(1000, 10)}
+
+    regressions = compare(
+        [create_benchmark_result(operations_per_second, p99)], baseline, threshold=0.2
+    )
+
+    assert [regression.metric for regression in regressions] == metrics
+
+
+def test_compare_skips_new_benchmarks():
+    assert compare([create_benchmark_result(1, 1000)], {}, threshold=0.2) == []
+
+
+@pytest.mark.anyio
+async def test_run_load():
+    result = await run_load(
+        "middleware/metrics",
+        create_middleware_app(["metrics"]),
+        "GET",
+        "/",
+        requests=20,
+        concurrency=4,
+        memory_iterations=2,
+    )
+
+    assert result.operations == 20
+    assert result.errors == 0
+    assert 0 < result.p50 <= result.p95 <= result.p99
+    assert result.memory_per_operation > 0
+
+
+def test_run_micro():
+    result = run_micro("micro/sum", lambda: sum(range(100)), iterations=50)
+
+    assert result.operations == 50
+    assert result.operations_per_second > 0
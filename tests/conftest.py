@@ -7,8 +7,15 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel.pool import StaticPool
 
 from playground.main import app
+from playground.providers.admission import get_rate_limiter
+from playground.providers.settings import get_settings
 from playground.providers.database import get_session as get_sync_session
-from playground.providers.database_async import get_session as get_async_session
+from playground.providers.response_cache import get_response_cache
+from playground.routers.time_range import get_comment_cache
+from playground.providers.database_async import (
+    get_session as get_async_session,
+    get_read_session as get_async_read_session,
+)
 
 pytestmark = pytest.mark.anyio
 
@@ -45,12 +52,27 @@ def client_fixture(session: Session, async_session: AsyncSession):
 
     app.dependency_overrides[get_sync_session] = get_session_override
     app.dependency_overrides[get_async_session] = lambda: async_session
+    app.dependency_overrides[get_async_read_session] = lambda: async_session
+
+    # Every test has its own database, so responses and queries cached by other tests are stale. Every test gets a full token bucket.
+    get_response_cache().clear()
+    get_comment_cache().clear()
+    get_rate_limiter().clear()
+
+    with TestClient(app) as client:
+        yield client
 
-    client = TestClient(app)
-    yield client
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(autouse=True)
+def verify_trusted_responses(monkeypatch):
+    """
+    Check that every response that skipped validation matches the validated response.
+    """
+    monkeypatch.setattr(get_settings(), "trusted_response_verify", True)
+
+
 @pytest.fixture(autouse=True)
 def anyio_backend():
     return "asyncio"
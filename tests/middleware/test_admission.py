@@ -0,0 +1,190 @@
+import time
+
+import pytest
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from playground.middleware import admission
+from playground.middleware.admission import AdmissionMiddleware
+from playground.providers.admission import ConcurrencyLimiter, RateLimiter
+from playground.providers.token_verifier import TokenVerifier
+
+KEY = {"kty": "oct", "kid": "test", "k": "cGxheWdyb3VuZC1hZG1pc3Npb24ta2V5"}
+
+
+@pytest.fixture(name="limiters")
+def limiters_fixture():
+    return RateLimiter(
+        capacity=3, refill_rate=0.01, max_clients=10
+    ), ConcurrencyLimiter(limit=1, queue_size=0, queue_timeout=0.1)
+
+
+@pytest.fixture(name="admission_client")
+def admission_client_fixture(limiters):
+    app = Starlette(
+        routes=[
+            Route("/cheap", lambda request: PlainTextResponse("cheap")),
+            Route("/expensive/items", lambda request: PlainTextResponse("expensive")),
+            Route("/health/ping", lambda request: PlainTextResponse("pong")),
+        ]
+    )
+    rate_limiter, concurrency_limiter = limiters
+    app.add_middleware(
+        AdmissionMiddleware,
+        rate_limiter=rate_limiter,
+        concurrency_limiter=concurrency_limiter,
+        costs={"/expensive": 3, "/health/": 0},
+    )
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_clients_over_their_rate_limit_get_a_429(admission_client: TestClient):
+    for _ in range(3):
+        assert admission_client.get("/cheap").status_code == 200
+
+    response = admission_client.get("/cheap")
+
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    assert int(response.headers["Retry-After"]) == 100
+
+
+def test_routes_cost_their_longest_prefix(admission_client: TestClient):
+    assert admission_client.get("/expensive/items").status_code == 200
+    assert admission_client.get("/cheap").status_code == 429
+
+    # Free routes are never limited.
+    for _ in range(10):
+        assert admission_client.get("/health/ping").status_code == 200
+
+
+@pytest.fixture(name="verifier")
+def verifier_fixture(monkeypatch):
+    verifier = TokenVerifier({"keys": [KEY]}, ["HS256"], cache_size=10)
+    monkeypatch.setattr(admission, "get_token_verifier", lambda: verifier)
+
+    return verifier
+
+
+def sign(subject: str) -> str:
+    claims = {"sub": subject, "exp": int(time.time()) + 60}
+
+    return jwt.encode(claims, KEY, algorithm="HS256", headers={"kid": "test"})
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_verified_subjects_get_their_own_bucket(
+    admission_client: TestClient, verifier: TokenVerifier
+):
+    a, b = sign("a"), sign("b")
+    # Both were verified by earlier requests.
+    verifier.verify(a)
+    verifier.verify(b)
+
+    assert (
+        admission_client.get("/expensive/items", headers=bearer(a)).status_code == 200
+    )
+    assert (
+        admission_client.get("/expensive/items", headers=bearer(b)).status_code == 200
+    )
+    assert (
+        admission_client.get("/expensive/items", headers=bearer(a)).status_code == 429
+    )
+    # Invalid tokens are limited by IP.
+    assert (
+        admission_client.get("/expensive/items", headers=bearer("x")).status_code == 200
+    )
+
+
+def test_new_tokens_are_verified_after_their_ip_admitted_them(
+    admission_client: TestClient, verifier: TokenVerifier
+):
+    token = sign("a")
+
+    assert (
+        admission_client.get("/expensive/items", headers=bearer(token)).status_code
+        == 200
+    )
+    assert verifier.cached(token)["sub"] == "a"
+
+    # The IP has no tokens left, so another new token is turned away before its signature is checked.
+    assert (
+        admission_client.get("/expensive/items", headers=bearer(sign("b"))).status_code
+        == 429
+    )
+    assert verifier.statistics().misses == 1
+    # The verified subject has a bucket of its own now.
+    assert (
+        admission_client.get("/expensive/items", headers=bearer(token)).status_code
+        == 200
+    )
+
+
+async def call(app: AdmissionMiddleware) -> list:
+    """
+    Send a request straight to `app`, and get the messages it sent back with the active requests of the concurrency limiter at the time.
+    """
+    messages = []
+    received = []
+
+    async def receive():
+        # The request has no body. After that the client goes away, which ends the disconnect listener of streaming responses.
+        if received:
+            return {"type": "http.disconnect"}
+
+        received.append(True)
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append((message, app.concurrency_limiter.active))
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    await app(scope, receive, send)
+
+    return messages
+
+
+@pytest.mark.anyio
+async def test_requests_over_the_concurrency_limit_get_a_503(limiters):
+    _, concurrency_limiter = limiters
+    app = AdmissionMiddleware(PlainTextResponse("OK"), None, concurrency_limiter, {})
+    await concurrency_limiter.acquire()
+
+    (start, _), _ = await call(app)
+
+    assert start["status"] == 503
+    assert (b"retry-after", b"1") in start["headers"]
+
+    concurrency_limiter.release()
+    (start, active), _ = await call(app)
+
+    assert start["status"] == 200
+    assert active == 1
+    assert concurrency_limiter.statistics().active == 0
+
+
+@pytest.mark.anyio
+async def test_event_streams_give_up_their_slot_once_they_start(limiters):
+    _, concurrency_limiter = limiters
+
+    async def events():
+        yield "data: started\n\n"
+
+    app = AdmissionMiddleware(
+        StreamingResponse(events(), media_type="text/event-stream"),
+        None,
+        concurrency_limiter,
+        {},
+    )
+    messages = await call(app)
+
+    assert [active for _, active in messages] == [0, 0, 0]
+    assert concurrency_limiter.statistics().admitted == 1
@@ -0,0 +1,186 @@
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from playground.middleware.compression import (
+    CompressionMiddleware,
+    GzipCompressor,
+    select_encoding,
+)
+from playground.providers.settings import CompressionRouteSettings
+
+BODY = "All work and no play makes Jack a dull boy. " * 100
+
+
+@pytest.fixture(name="calls")
+def calls_fixture():
+    return []
+
+
+@pytest.fixture(name="compressed_client")
+def compressed_client_fixture(calls):
+    def text(request: Request):
+        calls.append(request.url.path)
+        return PlainTextResponse(BODY, headers={"ETag": '"text"'})
+
+    def small(request: Request):
+        return PlainTextResponse("small")
+
+    def image(request: Request):
+        return Response(BODY.encode(), media_type="image/png")
+
+    def stream(request: Request):
+        async def chunks():
+            for _ in range(5):
+                yield BODY
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app = Starlette(
+        routes=[
+            Route("/text", text),
+            Route("/static", text),
+            Route("/small", small),
+            Route("/image", image),
+            Route("/stream", stream),
+        ]
+    )
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=100,
+        offload_size=1000,
+        routes={
+            "/static": CompressionRouteSettings(levels={"gzip": 9}, immutable=True)
+        },
+    )
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,encodings,expected",
+    [
+        ("", ("zstd", "br", "gzip"), None),
+        ("gzip, deflate", ("zstd", "br", "gzip"), "gzip"),
+        ("gzip, br, zstd", ("zstd", "br", "gzip"), "zstd"),
+        ("gzip, br;q=0.8", ("br", "gzip"), "gzip"),
+        ("*", ("br", "gzip"), "br"),
+        ("*, br;q=0", ("br", "gzip"), "gzip"),
+        ("identity", ("gzip",), None),
+    ],
+)
+def test_select_encoding(accept_encoding, encodings, expected):
+    assert select_encoding(accept_encoding, encodings) == expected
+
+
+def test_compresses_with_accepted_encoding(compressed_client: TestClient):
+    response = compressed_client.get("/text", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(BODY)
+    assert response.text == BODY
+
+
+@pytest.mark.parametrize("path", ["/small", "/image"])
+def test_skips_small_and_incompressible_bodies(compressed_client: TestClient, path):
+    response = compressed_client.get(path, headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_skips_clients_without_accept_encoding(compressed_client: TestClient):
+    response = compressed_client.get("/text", headers={"Accept-Encoding": ""})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
+
+
+@pytest.mark.anyio
+async def test_compresses_streams_chunk_by_chunk():
+    async def chunks():
+        for _ in range(5):
+            yield BODY
+
+    middleware = CompressionMiddleware(
+        StreamingResponse(chunks(), media_type="text/plain"), minimum_size=100
+    )
+    messages = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/stream",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    await middleware(scope, receive, send)
+
+    start, *bodies = messages
+    headers = dict(start["headers"])
+    decompressor = zlib.decompressobj(31)
+
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    assert len(bodies) == 6
+    # Every chunk is flushed, so it can be decoded as soon as it arrives.
+    assert decompressor.decompress(bodies[0]["body"]).decode() == BODY
+    assert (
+        b"".join(decompressor.decompress(body["body"]) for body in bodies[1:]).decode()
+        == BODY * 4
+    )
+
+
+def test_serves_immutable_paths_from_memory(compressed_client: TestClient, calls):
+    first = compressed_client.get("/static", headers={"Accept-Encoding": "gzip"})
+    second = compressed_client.get("/static", headers={"Accept-Encoding": "gzip"})
+
+    assert calls == ["/static"]
+    assert second.text == first.text == BODY
+    assert second.headers["content-encoding"] == "gzip"
+    assert second.headers["etag"] == '"text"'
+
+
+def test_immutable_paths_answer_conditional_requests(
+    compressed_client: TestClient, calls
+):
+    gzip = {"Accept-Encoding": "gzip"}
+    first = compressed_client.get("/static", headers=gzip)
+
+    not_modified = compressed_client.get(
+        "/static", headers={**gzip, "If-None-Match": first.headers["etag"]}
+    )
+    modified = compressed_client.get(
+        "/static", headers={**gzip, "If-None-Match": '"other"'}
+    )
+
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == '"text"'
+    # Other conditions are left to the app.
+    assert modified.status_code == 200
+    assert calls == ["/static", "/static"]
+
+
+def test_gzip_compressor_chunks_are_decodable():
+    compressor = GzipCompressor(6)
+    decompressor = zlib.decompressobj(31)
+
+    first = compressor.compress(b"hello ")
+
+    assert decompressor.decompress(first) == b"hello "
+    assert (
+        decompressor.decompress(compressor.compress(b"world") + compressor.finish())
+        == b"world"
+    )
@@ -0,0 +1,118 @@
+import pytest
+from starlette.testclient import TestClient
+
+from playground.providers.metrics import (
+    LatencyHistogram,
+    get_metrics,
+    merge_worker_metrics,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    get_metrics.cache_clear()
+
+
+def get_metric(client: TestClient, line_prefix: str) -> float:
+    for line in client.get("/metrics").text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+
+    raise AssertionError(f"No metric starts with {line_prefix}")
+
+
+@pytest.mark.apitest
+def test_process_time_header(client: TestClient):
+    response = client.get("/pagination/generated")
+
+    assert float(response.headers["x-process-time"]) > 0
+
+
+@pytest.mark.apitest
+def test_latency_is_recorded_per_route_template(client: TestClient):
+    client.get("/pagination/generated", params={"page": 1})
+    client.get("/pagination/generated", params={"page": 2})
+    client.get("/does-not-exist")
+
+    labels = 'method="GET",route="/pagination/generated"'
+
+    assert (
+        get_metric(client, f"playground_request_duration_seconds_count{{{labels}}}")
+        == 2
+    )
+    assert (
+        get_metric(
+            client, f'playground_request_duration_seconds{{{labels},quantile="0.99"}}'
+        )
+        > 0
+    )
+    assert (
+        get_metric(
+            client,
+            'playground_responses_total{method="GET",route="unmatched",status="404"}',
+        )
+        == 1
+    )
+
+
+@pytest.mark.apitest
+def test_response_sizes_before_and_after_compression(client: TestClient):
+    client.get("/pagination/generated", params={"page_size": 500})
+
+    labels = 'method="GET",route="/pagination/generated"'
+    body_size = get_metric(client, f"playground_response_body_bytes_total{{{labels}}}")
+    sent_size = get_metric(client, f"playground_response_sent_bytes_total{{{labels}}}")
+
+    assert 0 < sent_size < body_size
+
+
+@pytest.mark.apitest
+def test_database_time_is_recorded(client: TestClient):
+    client.get("/timeranged/keyset")
+
+    labels = 'method="GET",route="/timeranged/keyset"'
+
+    assert (
+        get_metric(client, f"playground_request_database_seconds_total{{{labels}}}") > 0
+    )
+    assert (
+        get_metric(client, f"playground_request_upstream_seconds_total{{{labels}}}")
+        == 0
+    )
+
+
+def test_histogram_quantiles_are_within_precision():
+    histogram = LatencyHistogram(significant_bits=5)
+
+    for value in range(1, 100_001):
+        histogram.record(value)
+
+    assert histogram.count == 100_000
+
+    for quantile in (0.5, 0.95, 0.99):
+        expected = quantile * 100_000
+        assert abs(histogram.quantile(quantile) - expected) / expected < 1 / 32
+
+
+def test_worker_metrics_are_merged():
+    rendered = "\n".join(
+        [
+            "# HELP requests Requests.",
+            "# TYPE requests counter",
+            'requests{route="/"} 1',
+            "# HELP in_flight In flight.",
+            "# TYPE in_flight gauge",
+            "in_flight 0",
+        ]
+    )
+
+    assert merge_worker_metrics({"1": rendered, "2": rendered}).splitlines() == [
+        "# HELP requests Requests.",
+        "# TYPE requests counter",
+        'requests{worker="1",route="/"} 1',
+        'requests{worker="2",route="/"} 1',
+        "# HELP in_flight In flight.",
+        "# TYPE in_flight gauge",
+        'in_flight{worker="1"} 0',
+        'in_flight{worker="2"} 0',
+    ]
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from playground.providers.admission import (
+    AdmissionRejected,
+    ConcurrencyLimiter,
+    RateLimiter,
+)
+
+
+def test_buckets_refill_over_time():
+    limiter = RateLimiter(capacity=10, refill_rate=5, max_clients=10)
+    limiter.take("client", 10, now=0)
+
+    with pytest.raises(AdmissionRejected) as e:
+        limiter.take("client", 5, now=0.5)
+
+    # After half a second the bucket holds 2.5 tokens, it takes another half second to hold 5.
+    assert e.value.retry_after == pytest.approx(0.5)
+
+    limiter.take("client", 5, now=1.0)
+    limiter.take("other", 10, now=1.0)
+
+    assert limiter.statistics().limited == 1
+    assert limiter.statistics().allowed == 3
+
+
+def test_sweep_drops_buckets_that_are_full_again():
+    limiter = RateLimiter(capacity=10, refill_rate=5, max_clients=10)
+    limiter.take("quiet", 10, now=0)
+    limiter.take("busy", 10, now=1)
+
+    assert limiter.sweep(now=2.5) == 1
+    assert list(limiter.buckets) == ["busy"]
+
+
+def test_least_recently_used_buckets_are_evicted():
+    limiter = RateLimiter(capacity=10, refill_rate=5, max_clients=2)
+    limiter.take("a", 1, now=0)
+    limiter.take("b", 1, now=0)
+    limiter.take("a", 1, now=0)
+    limiter.take("c", 1, now=0)
+
+    assert list(limiter.buckets) == ["a", "c"]
+    assert limiter.statistics().evicted == 1
+
+
+@pytest.mark.anyio
+async def test_requests_queue_for_a_slot_until_the_timeout():
+    limiter = ConcurrencyLimiter(limit=1, queue_size=1, queue_timeout=0.05)
+    await limiter.acquire()
+
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    # The queue is full.
+    with pytest.raises(AdmissionRejected):
+        await limiter.acquire()
+
+    limiter.release()
+    await waiting
+
+    assert limiter.statistics().active == 1
+
+    with pytest.raises(AdmissionRejected):
+        await limiter.acquire()
+
+    limiter.release()
+
+    assert limiter.statistics().dict() == {
+        "active": 0,
+        "queued": 0,
+        "limit": 1,
+        "admitted": 2,
+        "rejected": 2,
+    }
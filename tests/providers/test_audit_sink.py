@@ -0,0 +1,159 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import List
+
+import pytest
+
+from playground.providers.audit_sink import (
+    AuditSink,
+    AuditBackend,
+    AuditRecord,
+    JsonLinesBackend,
+    SqliteBackend,
+    create_audit_backend,
+)
+
+
+class ListBackend(AuditBackend):
+    def __init__(self):
+        self.batches: List[List[AuditRecord]] = []
+
+    def write(self, records: List[AuditRecord]):
+        self.batches.append(records)
+
+
+def record(message: str) -> AuditRecord:
+    return AuditRecord(audit_name="test", message=message)
+
+
+def test_flush_writes_in_batches():
+    backend = ListBackend()
+    sink = AuditSink(backend, batch_size=2)
+
+    for i in range(5):
+        sink.enqueue(record(str(i)))
+
+    assert sink.flush() == 5
+    assert [len(batch) for batch in backend.batches] == [2, 2, 1]
+    assert sink.statistics().flushed == 5
+
+
+def test_drop_oldest_when_full():
+    backend = ListBackend()
+    sink = AuditSink(backend, queue_size=2, backpressure="drop_oldest")
+
+    for i in range(3):
+        assert sink.enqueue(record(str(i)))
+
+    sink.flush()
+
+    assert [r.message for r in backend.batches[0]] == ["1", "2"]
+    assert sink.statistics().dropped == 1
+
+
+def test_sample_drops_when_under_pressure():
+    sink = AuditSink(ListBackend(), queue_size=4, backpressure="sample", sample_rate=0)
+
+    accepted = [sink.enqueue(record(str(i))) for i in range(4)]
+
+    assert accepted == [True, True, False, False]
+    assert sink.statistics().dropped == 2
+
+
+@pytest.mark.anyio
+async def test_blocking_enqueue_waits_off_the_event_loop():
+    writing = threading.Event()
+    gate = threading.Event()
+
+    class GatedBackend(ListBackend):
+        def write(self, records: List[AuditRecord]):
+            writing.set()
+            gate.wait(5)
+            super().write(records)
+
+    backend = GatedBackend()
+    sink = AuditSink(backend, queue_size=1, batch_size=1, backpressure="block")
+    sink.start()
+
+    # The first record is being written, the second fills the queue.
+    sink.enqueue(record("0"))
+    writing.wait(5)
+    sink.enqueue(record("1"))
+
+    waiting = asyncio.create_task(sink.aenqueue(record("2")))
+    await asyncio.sleep(0.05)
+
+    # The event loop kept running while the record waited for room.
+    assert not waiting.done()
+
+    gate.set()
+
+    assert await waiting
+    sink.stop()
+    assert [r.message for batch in backend.batches for r in batch] == ["0", "1", "2"]
+
+
+def test_failed_writes_are_counted_and_the_worker_keeps_going():
+    class FlakyBackend(ListBackend):
+        def write(self, records: List[AuditRecord]):
+            if records[0].message == "fail":
+                raise OSError("No space left on device")
+
+            super().write(records)
+
+    backend = FlakyBackend()
+    sink = AuditSink(
+        backend, queue_size=1, batch_size=1, flush_interval=0.01, backpressure="block"
+    )
+    sink.start()
+
+    for message in ["fail", "fail", "ok"]:
+        sink.enqueue(record(message))
+
+    sink.stop()
+
+    assert [r.message for batch in backend.batches for r in batch] == ["ok"]
+    assert sink.statistics().failed == 2
+    assert sink.statistics().flushed == 1
+
+
+def test_stop_flushes_remaining_records():
+    backend = ListBackend()
+    sink = AuditSink(backend, batch_size=100, flush_interval=60)
+    sink.start()
+
+    sink.enqueue(record("last words"))
+    sink.stop()
+
+    assert [[r.message for r in batch] for batch in backend.batches] == [["last words"]]
+
+
+def test_jsonl_and_sqlite_backends(tmp_path):
+    jsonl = JsonLinesBackend(str(tmp_path / "audit.jsonl"))
+    jsonl.write([record("a"), record("b")])
+    jsonl.close()
+
+    lines = (tmp_path / "audit.jsonl").read_text().splitlines()
+    assert [json.loads(line)["message"] for line in lines] == ["a", "b"]
+
+    database = str(tmp_path / "audit.db")
+    backend = SqliteBackend(database)
+    backend.write([record("c")])
+    backend.close()
+
+    rows = sqlite3.connect(database).execute("SELECT message FROM audit_record")
+    assert rows.fetchall() == [("c",)]
+
+
+def test_file_backends_have_their_own_default_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    create_audit_backend("jsonl").close()
+    create_audit_backend("sqlite").close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "audit.db",
+        "audit.jsonl",
+    ]
@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+import pytest
+
+from playground.providers import broadcast
+from playground.providers.broadcast import BroadcastBus, SubscriptionClosed
+from playground.providers.shared_store import MemoryStore, SharedStore, StoreServer
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_messages_are_fanned_out_to_every_subscriber():
+    bus = BroadcastBus("test")
+
+    with bus.subscribe(10) as first, bus.subscribe(10) as second:
+        assert bus.publish("hello") == 2
+
+        assert await first.get(1.0) == "hello"
+        assert await second.get(1.0) == "hello"
+        assert await first.get(0.01) is None
+
+    assert bus.statistics().subscribers == 0
+    assert bus.publish("nobody") == 0
+
+
+async def test_slow_subscribers_are_disconnected():
+    bus = BroadcastBus("test")
+    slow = bus.subscribe(2)
+    fast = bus.subscribe(10)
+
+    for message in range(3):
+        bus.publish(message)
+
+    assert fast.messages
+    assert bus.statistics().disconnected == 1
+    assert bus.statistics().subscribers == 1
+
+    # The buffered messages can still be read, after those the subscriber learns why it was closed.
+    assert await slow.get(1.0) == 0
+    assert await slow.get(1.0) == 1
+
+    with pytest.raises(SubscriptionClosed) as e:
+        await slow.get(1.0)
+
+    assert e.value.reason == "Too slow to keep up"
+
+
+async def test_workers_relay_each_others_messages(monkeypatch):
+    path = os.path.join(tempfile.mkdtemp(), "store.sock")
+    server = StoreServer(path, MemoryStore(1024))
+    await server.start()
+    store = SharedStore(path, timeout=1.0)
+    monkeypatch.setattr(broadcast, "get_shared_store", lambda: store)
+
+    try:
+        writer = BroadcastBus("test")
+        reader = BroadcastBus("test")
+        await writer.relay()
+        await reader.relay()
+
+        with writer.subscribe(10) as local, reader.subscribe(10) as remote:
+            await writer.share("hello")
+
+            assert await writer.relay() == 0
+            assert await reader.relay() == 1
+            assert await local.get(1.0) == "hello"
+            assert await remote.get(1.0) == "hello"
+            assert await local.get(0.01) is None
+
+            # Messages that expired before they were relayed cannot be recovered, the subscribers have to resume.
+            await writer.share("lost")
+            await store.delete(reader.message_key(2))
+            await reader.relay()
+
+            with pytest.raises(SubscriptionClosed):
+                await remote.get(1.0)
+    finally:
+        await store.close()
+        await server.stop()
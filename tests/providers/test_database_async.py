@@ -1,6 +1,11 @@
 import pytest
 
-from playground.providers.database_async import get_session, get_engine
+from playground.providers.database_async import (
+    get_session,
+    get_engine,
+    get_read_engine,
+    get_session_factory,
+)
 
 
 @pytest.mark.anyio
@@ -17,3 +22,33 @@ async def test_async_session_not_same():
     s2 = get_session()
 
     assert s1 is not s2
+
+
+@pytest.mark.anyio
+async def test_async_engine_applies_pragmas():
+    engine = await get_engine()
+
+    async with engine.connect() as conn:
+        journal_mode = await conn.exec_driver_sql("PRAGMA journal_mode")
+        synchronous = await conn.exec_driver_sql("PRAGMA synchronous")
+
+        assert journal_mode.scalar() == "wal"
+        # 1 is NORMAL
+        assert synchronous.scalar() == 1
+
+
+@pytest.mark.anyio
+async def test_async_read_engine_is_read_only():
+    engine = await get_read_engine()
+
+    assert engine is not await get_engine()
+
+    async with engine.connect() as conn:
+        query_only = await conn.exec_driver_sql("PRAGMA query_only")
+
+        assert query_only.scalar() == 1
+
+
+@pytest.mark.anyio
+async def test_async_session_factory_is_cached():
+    assert await get_session_factory() is await get_session_factory()
@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import inspect
+
+from playground.providers.database import get_database_engine
+from playground.providers.database_lifespan import start_database, get_startup_timings
+
+
+@pytest.mark.anyio
+async def test_start_database_records_timings():
+    timings = await start_database()
+
+    assert get_startup_timings() is timings
+    assert timings.ddl is not None
+    assert timings.warm_writer is not None and timings.warm_reader is not None
+    assert timings.total >= timings.ddl
+
+
+@pytest.mark.anyio
+async def test_start_database_creates_tables_for_sync_engine():
+    await start_database()
+
+    assert "timerangedmodel" in inspect(get_database_engine()).get_table_names()
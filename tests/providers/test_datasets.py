@@ -0,0 +1,52 @@
+import array
+
+import msgpack
+import pytest
+
+from playground.providers.datasets import ColumnarDataset
+from playground.providers.negotiation import JSON_CODEC, MSGPACK_CODEC
+
+
+@pytest.fixture
+def dataset():
+    return ColumnarDataset(
+        {
+            "id": array.array("q", range(10)),
+            "value": array.array("d", [5, 3, 9, 1, 7, 0, 8, 2, 6, 4]),
+        },
+        sort_columns=("value",),
+    )
+
+
+def to_lists(columns):
+    return {name: column.tolist() for name, column in columns.items()}
+
+
+def test_slices_share_the_column_buffer(dataset: ColumnarDataset):
+    view = dataset.slice(2, 5)["id"].view
+
+    assert view.obj is dataset.columns["id"]
+    assert view.tolist() == [2, 3, 4]
+
+
+def test_sorted_and_descending_slices(dataset: ColumnarDataset):
+    assert to_lists(dataset.slice(0, 3, "value")) == {
+        "id": [5, 3, 7],
+        "value": [0, 1, 2],
+    }
+    assert dataset.slice(0, 3, "value", descending=True)["value"].tolist() == [9, 8, 7]
+    assert dataset.slice(8, 20, descending=True)["id"].tolist() == [1, 0]
+    assert dataset.slice(10, 20, descending=True)["id"].tolist() == []
+
+
+def test_columns_must_have_the_same_length():
+    with pytest.raises(ValueError):
+        ColumnarDataset({"a": array.array("q", [1]), "b": array.array("q", [])})
+
+
+def test_pages_encode_as_lists(dataset: ColumnarDataset):
+    page = dataset.page(1, 4, "value", descending=True)
+
+    assert (page["page_count"], page["has_next"]) == (3, True)
+    assert JSON_CODEC.decode(JSON_CODEC.encode(page))["data"]["value"] == [5, 4, 3, 2]
+    assert msgpack.unpackb(MSGPACK_CODEC.encode(page))["data"]["id"] == [0, 9, 1, 7]
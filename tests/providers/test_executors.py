@@ -0,0 +1,120 @@
+import threading
+
+import anyio
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from playground.providers.executors import (
+    Executor,
+    ExecutorSaturatedError,
+    executor_saturated_exception_handler,
+    get_executors,
+    offload,
+)
+from playground.providers.settings import ExecutorSettings
+
+
+async def wait_until(condition):
+    with anyio.fail_after(5):
+        while not condition():
+            await anyio.sleep(0.01)
+
+
+@pytest.mark.anyio
+async def test_runs_on_a_worker_thread():
+    executor = Executor("test", ExecutorSettings(max_workers=1))
+
+    thread = await executor.run(threading.get_ident)
+
+    assert thread != threading.get_ident()
+    assert executor.statistics().completed == 1
+
+
+@pytest.mark.anyio
+async def test_rejects_calls_when_the_queue_is_full():
+    executor = Executor("test", ExecutorSettings(max_workers=1, max_queue=1))
+    release = threading.Event()
+
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(executor.run, release.wait)
+        tasks.start_soon(executor.run, release.wait)
+
+        await wait_until(lambda: executor.statistics().queued == 1)
+
+        assert executor.statistics().active == 1
+
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(release.wait)
+
+        release.set()
+
+    statistics = executor.statistics()
+
+    assert (statistics.completed, statistics.rejected) == (2, 1)
+
+
+@pytest.mark.anyio
+async def test_cleanup_is_never_rejected():
+    executor = Executor("test", ExecutorSettings(max_workers=1, max_queue=0))
+    release = threading.Event()
+
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(executor.run, release.wait)
+        await wait_until(lambda: executor.statistics().active == 1)
+        tasks.start_soon(lambda: executor.run(lambda: None, reject=False))
+        await wait_until(lambda: executor.statistics().queued == 1)
+        release.set()
+
+    assert executor.statistics().rejected == 0
+
+
+def test_offloaded_endpoints_and_dependencies():
+    threads = {}
+    events = []
+
+    @offload("test")
+    def get_resource():
+        threads["dependency"] = threading.get_ident()
+        events.append("setup")
+        yield "resource"
+        events.append("cleanup")
+
+    app = FastAPI()
+
+    @app.get("/")
+    @offload("test")
+    def get_endpoint(resource: str = Depends(get_resource)):
+        """
+        The docs of the endpoint.
+        """
+        threads["endpoint"] = threading.get_ident()
+        return resource
+
+    with TestClient(app) as client:
+        response = client.get("/")
+
+    assert response.json() == "resource"
+    assert events == ["setup", "cleanup"]
+    assert threading.get_ident() not in threads.values()
+    assert app.openapi()["paths"]["/"]["get"]["description"] == (
+        "The docs of the endpoint."
+    )
+    assert get_executors().get("test").statistics().completed == 3
+
+
+def test_saturated_executors_answer_503():
+    app = FastAPI(
+        exception_handlers={
+            ExecutorSaturatedError: executor_saturated_exception_handler
+        }
+    )
+
+    @app.get("/")
+    def get_saturated():
+        raise ExecutorSaturatedError("test")
+
+    response = TestClient(app).get("/")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from playground.providers.health_checks import HealthCheckFailed, HealthCheckRegistry
+
+
+async def passing():
+    return "fine"
+
+
+async def failing():
+    raise HealthCheckFailed("broken")
+
+
+async def hanging():
+    await asyncio.sleep(10)
+
+
+@pytest.fixture
+def registry():
+    return HealthCheckRegistry(interval=60.0, timeout=0.05, stale_after=60.0)
+
+
+@pytest.mark.anyio
+async def test_unchecked_registry_is_unhealthy(registry: HealthCheckRegistry):
+    registry.register("passing", passing)
+
+    assert not registry.is_healthy()
+
+    await registry.run_all()
+
+    assert registry.is_healthy()
+
+
+@pytest.mark.anyio
+async def test_failures_and_timeouts_are_reported(registry: HealthCheckRegistry):
+    registry.register("passing", passing)
+    registry.register("failing", failing)
+    registry.register("hanging", hanging)
+
+    await registry.run_all()
+    report = {check.name: check for check in registry.report().checks}
+
+    assert not registry.is_healthy()
+    assert report["passing"].healthy and report["passing"].detail == "fine"
+    assert not report["failing"].healthy and report["failing"].detail == "broken"
+    assert not report["hanging"].healthy
+    assert report["hanging"].latency >= 0.05
+
+
+@pytest.mark.anyio
+async def test_non_critical_failures_stay_healthy(registry: HealthCheckRegistry):
+    registry.register("passing", passing)
+    registry.register("failing", failing, critical=False)
+
+    await registry.run_all()
+
+    assert registry.is_healthy()
+    assert not registry.report().checks[1].healthy
+
+
+@pytest.mark.anyio
+async def test_stale_results_are_unhealthy():
+    registry = HealthCheckRegistry(interval=60.0, timeout=1.0, stale_after=0.0)
+    registry.register("passing", passing)
+
+    await registry.run_all()
+
+    assert not registry.is_healthy()
+    assert registry.report().checks[0].stale
+
+
+@pytest.mark.anyio
+async def test_checks_keep_running_in_the_background():
+    registry = HealthCheckRegistry(interval=0.01, timeout=1.0, stale_after=60.0)
+    calls = []
+
+    async def counting():
+        calls.append(None)
+
+    registry.register("counting", counting)
+
+    await registry.start()
+    await asyncio.sleep(0.1)
+    await registry.stop()
+
+    assert len(calls) > 2
+    assert registry.task is None
+
+
+def test_probes_answer_from_the_checks(client: TestClient):
+    response = client.get("/health/health")
+
+    assert response.status_code == 200
+    assert response.json() == "OK"
+
+    report = client.get("/health/checks").json()
+
+    assert report["healthy"]
+    assert {check["name"] for check in report["checks"]} >= {
+        "database",
+        "audit_sink",
+        "executors",
+        "circuit_breakers",
+    }
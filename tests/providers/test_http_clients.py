@@ -0,0 +1,94 @@
+import httpx
+import pytest
+
+from playground.providers.http_clients import HttpClientRegistry
+from playground.providers.resilience import RetryBudget
+from playground.providers.settings import UpstreamSettings
+
+
+@pytest.fixture
+def registry():
+    return HttpClientRegistry(
+        {"default": UpstreamSettings(max_connections=5)}, RetryBudget(0.2, 1.0)
+    )
+
+
+def test_clients_share_a_pool(registry: HttpClientRegistry):
+    c1 = registry.client()
+    c2 = registry.client()
+
+    assert c1 is not c2
+    assert c1.client is c2.client
+
+
+def test_headers_do_not_leak_between_clients(registry: HttpClientRegistry):
+    c1 = registry.client(headers={"Authorization": "user 1"})
+    c2 = registry.client()
+
+    assert c1.headers["Authorization"] == "user 1"
+    assert "Authorization" not in c2.headers
+    assert "Authorization" not in c1.client.headers
+
+
+def test_unknown_upstream_uses_default_settings(registry: HttpClientRegistry):
+    assert registry.get_upstream_settings("unknown").max_connections == 5
+
+
+@pytest.mark.respx(base_url="https://upstream.test")
+def test_request_sends_overlay_and_runs_hooks(registry: HttpClientRegistry, respx_mock):
+    route = respx_mock.get("/ip").mock(return_value=httpx.Response(200, text="ok"))
+    seen = []
+
+    client = registry.client(
+        headers={"Authorization": "user"}, response_hooks=[seen.append]
+    )
+    response = client.get("https://upstream.test/ip")
+
+    assert response.text == "ok"
+    assert seen == [response]
+    assert route.calls.last.request.headers["Authorization"] == "user"
+
+
+@pytest.mark.anyio
+async def test_cookies_do_not_leak_between_users(registry: HttpClientRegistry):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("Cookie"))
+        return httpx.Response(200, headers={"Set-Cookie": "session=alice-secret"})
+
+    transport = httpx.MockTransport(handler)
+    registry.clients["default"] = httpx.Client(
+        transport=transport, **registry.get_client_kwargs("default")
+    )
+    registry.async_clients["default"] = httpx.AsyncClient(
+        transport=transport, **registry.get_client_kwargs("default")
+    )
+
+    registry.client(headers={"Authorization": "alice"}).get("https://upstream.test")
+    registry.client(headers={"Authorization": "bob"}).get("https://upstream.test")
+    await registry.async_client(headers={"Authorization": "alice"}).get(
+        "https://upstream.test"
+    )
+    await registry.async_client(headers={"Authorization": "bob"}).get(
+        "https://upstream.test", cookies={"session": "bob"}
+    )
+
+    assert seen == [None, None, None, "session=bob"]
+
+
+@pytest.mark.anyio
+async def test_statistics_and_stop(registry: HttpClientRegistry):
+    await registry.start()
+
+    statistics = registry.statistics()
+
+    assert {(s.upstream, s.kind) for s in statistics} == {
+        ("default", "sync"),
+        ("default", "async"),
+    }
+    assert all(s.active == 0 and s.waiting == 0 for s in statistics)
+
+    await registry.stop()
+
+    assert registry.statistics() == []
@@ -0,0 +1,172 @@
+from typing import List
+
+import msgpack
+import pytest
+from fastapi import APIRouter, FastAPI
+from pydantic import BaseModel, Field, ValidationError
+from starlette.testclient import TestClient
+
+from playground.providers.negotiation import (
+    JSON_CODEC,
+    MSGPACK_CODEC,
+    NegotiatedResponse,
+    NegotiatedRoute,
+    TrustedResponseMismatch,
+    select_codec,
+    trusted_response,
+)
+from playground.providers.settings import get_settings
+
+MSGPACK = "application/x-msgpack"
+
+
+@pytest.mark.parametrize(
+    "accept,codec",
+    [
+        (None, JSON_CODEC),
+        ("*/*", JSON_CODEC),
+        ("application/json", JSON_CODEC),
+        (MSGPACK, MSGPACK_CODEC),
+        ("application/vnd.msgpack", MSGPACK_CODEC),
+        ("application/json;q=0.5, application/x-msgpack", MSGPACK_CODEC),
+        ("application/x-msgpack;q=0, application/json", JSON_CODEC),
+        ("text/html, application/x-msgpack;q=0.9", MSGPACK_CODEC),
+    ],
+)
+def test_select_codec(accept, codec):
+    assert select_codec(accept) is codec
+
+
+def test_response_is_encoded_once_negotiated():
+    response = NegotiatedResponse({"hello": "world"}, headers={"X-Extra": "1"})
+
+    assert response.body is None
+
+    response.negotiate(MSGPACK)
+    response.negotiate("application/json")
+
+    assert msgpack.unpackb(response.body) == {"hello": "world"}
+    assert response.headers["content-type"] == MSGPACK
+    assert response.headers["content-length"] == str(len(response.body))
+    assert response.headers["vary"] == "Accept"
+    assert response.headers["x-extra"] == "1"
+
+
+@pytest.mark.apitest
+def test_responses_are_encoded_per_accept_header(client: TestClient):
+    as_json = client.get("/pagination/unpaginated")
+    as_msgpack = client.get("/pagination/unpaginated", headers={"Accept": MSGPACK})
+
+    assert as_json.headers["content-type"] == "application/json"
+    assert as_msgpack.headers["content-type"] == MSGPACK
+    assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+
+
+@pytest.mark.apitest
+def test_msgpack_request_body(client: TestClient):
+    response = client.post(
+        "/timeranged/create",
+        data=msgpack.packb({"comment": "Packed comment"}),
+        headers={"Content-Type": MSGPACK, "Accept": MSGPACK},
+    )
+
+    assert response.status_code == 200
+    assert msgpack.unpackb(response.content)["comment"] == "Packed comment"
+
+
+@pytest.mark.apitest
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/timeranged/",
+        "/timeranged/keyset",
+        "/timeranged/paginated",
+        "/timeranged/histogram",
+    ],
+)
+def test_trusted_dates_are_encoded_as_msgpack(client: TestClient, path: str):
+    client.post("/timeranged/create", json={"comment": "Dated comment"})
+
+    as_json = client.get(path)
+    as_msgpack = client.get(path, headers={"Accept": MSGPACK})
+
+    assert as_msgpack.status_code == 200
+    assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+
+
+@pytest.mark.apitest
+def test_msgpack_validation_errors(client: TestClient):
+    response = client.post(
+        "/timeranged/create",
+        data=msgpack.packb({"comment": "no"}),
+        headers={"Content-Type": MSGPACK, "Accept": MSGPACK},
+    )
+
+    assert response.status_code == 422
+    assert msgpack.unpackb(response.content)["detail"][0]["loc"] == [
+        "body",
+        "comment",
+    ]
+
+
+@pytest.mark.apitest
+def test_msgpack_http_errors(client: TestClient):
+    response = client.get(
+        "/timeranged/keyset", params={"cursor": "invalid"}, headers={"Accept": MSGPACK}
+    )
+
+    assert response.status_code == 400
+    assert msgpack.unpackb(response.content) == {"detail": "Invalid pagination cursor"}
+
+
+class Item(BaseModel):
+    id: int = Field(..., le=10)
+    name: str
+
+
+class ItemWithSecret(Item):
+    secret: str
+
+
+def create_trusted_app(items) -> FastAPI:
+    router = APIRouter(route_class=NegotiatedRoute)
+
+    @router.get("/", response_model=List[Item])
+    @trusted_response()
+    def get_items():
+        return items
+
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    app.include_router(router)
+
+    return app
+
+
+def test_trusted_responses_skip_validation(monkeypatch):
+    monkeypatch.setattr(get_settings(), "trusted_response_verify", False)
+    app = create_trusted_app([Item.construct(id=11, name="unchecked")])
+
+    response = TestClient(app).get("/", headers={"Accept": MSGPACK})
+
+    assert msgpack.unpackb(response.content) == [{"id": 11, "name": "unchecked"}]
+    assert "Item" in app.openapi()["components"]["schemas"]
+
+
+def test_verification_validates_trusted_responses():
+    app = create_trusted_app([Item.construct(id=11, name="invalid")])
+
+    with pytest.raises(ValidationError):
+        TestClient(app).get("/")
+
+
+def test_verification_catches_differences():
+    app = create_trusted_app([ItemWithSecret(id=1, name="leaky", secret="hunter2")])
+
+    with pytest.raises(TrustedResponseMismatch):
+        TestClient(app).get("/")
+
+
+def test_verified_trusted_responses_pass():
+    app = create_trusted_app([Item(id=1, name="fine")])
+
+    assert TestClient(app).get("/").json() == [{"id": 1, "name": "fine"}]
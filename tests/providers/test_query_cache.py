@@ -0,0 +1,84 @@
+import os
+import tempfile
+from datetime import datetime, timezone
+
+import pytest
+
+from playground.providers import query_cache
+from playground.providers.query_cache import QueryCache
+from playground.providers.shared_store import MemoryStore, SharedStore, StoreServer
+
+JANUARY = datetime(2021, 1, 1)
+FEBRUARY = datetime(2021, 2, 1)
+MARCH = datetime(2021, 3, 1)
+
+
+def test_writes_only_evict_overlapping_ranges():
+    cache = QueryCache("test", max_rows=100)
+    cache.put("january", [1], JANUARY, FEBRUARY, cache.generation)
+    cache.put("march", [2], MARCH, None, cache.generation)
+    cache.put("everything", [3], None, None, cache.generation)
+
+    assert cache.invalidate(FEBRUARY, FEBRUARY) == 2
+    assert cache.get("january") is None
+    assert cache.get("march") == [2]
+
+    # SQLite ignores timezones, so the cache does too.
+    cache.invalidate(MARCH.replace(tzinfo=timezone.utc), MARCH)
+
+    assert cache.get("march") is None
+
+
+def test_rows_are_bounded_and_least_recently_used_goes_first():
+    cache = QueryCache("test", max_rows=4)
+    cache.put("a", [1, 2], None, None, cache.generation)
+    cache.put("b", [1, 2], None, None, cache.generation)
+    cache.get("a")
+    cache.put("c", [1, 2], None, None, cache.generation)
+
+    assert cache.get("b") is None
+    assert cache.statistics().rows == 4
+
+    cache.put("too large", [1, 2, 3, 4, 5], None, None, cache.generation)
+
+    assert cache.get("too large") is None
+
+
+def test_rows_read_before_a_write_are_not_stored():
+    cache = QueryCache("test", max_rows=100)
+    generation = cache.generation
+
+    cache.invalidate(JANUARY, JANUARY)
+    cache.put("stale", [1], None, None, generation)
+
+    assert cache.get("stale") is None
+
+
+@pytest.mark.anyio
+async def test_workers_replay_each_others_writes(monkeypatch):
+    path = os.path.join(tempfile.mkdtemp(), "store.sock")
+    server = StoreServer(path, MemoryStore(1024))
+    await server.start()
+    store = SharedStore(path, timeout=1.0)
+    monkeypatch.setattr(query_cache, "get_shared_store", lambda: store)
+
+    try:
+        writer = QueryCache("test", max_rows=100)
+        reader = QueryCache("test", max_rows=100)
+
+        assert await reader.sync()
+        reader.put("january", [1], JANUARY, FEBRUARY, reader.generation)
+        reader.put("march", [2], MARCH, None, reader.generation)
+
+        await writer.publish(JANUARY, JANUARY)
+
+        assert await reader.sync()
+        assert reader.get("january") is None
+        assert reader.get("march") == [2]
+
+        await server.stop()
+
+        assert not await reader.sync()
+    finally:
+        await store.close()
+        await server.stop()
@@ -0,0 +1,205 @@
+import anyio
+import httpx
+import pytest
+
+from playground.providers.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    UpstreamResilience,
+)
+from playground.providers.settings import UpstreamSettings
+
+
+class StubUpstream:
+    """
+    A local upstream that answers with the given status codes in order, and keeps answering with the last one.
+    """
+
+    def __init__(self, *status_codes: int, delay: float = 0.0):
+        self.status_codes = list(status_codes)
+        self.delay = delay
+        self.requests = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        await anyio.sleep(self.delay)
+        status_code = self.status_codes[
+            min(len(self.requests), len(self.status_codes)) - 1
+        ]
+
+        return httpx.Response(status_code, text=str(len(self.requests)))
+
+
+def create_resilience(budget: RetryBudget = None, **kwargs) -> UpstreamResilience:
+    upstream_settings = UpstreamSettings(retry_backoff=0.0, **kwargs)
+
+    return UpstreamResilience(
+        "stub", upstream_settings, budget or RetryBudget(0.2, 10.0)
+    )
+
+
+async def send(
+    resilience: UpstreamResilience,
+    upstream: StubUpstream,
+    method: str = "GET",
+    headers: dict = None,
+) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+        request = client.build_request(
+            method, "https://upstream.test/ip", headers=headers
+        )
+
+        return await resilience.send(client, request)
+
+
+def test_breaker_opens_and_recovers_through_a_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # The reset timeout has passed, so a single probe is let through.
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+def test_retry_budget_is_limited_by_requests():
+    budget = RetryBudget(ratio=0.5, minimum_per_second=0.0)
+
+    for _ in range(4):
+        budget.deposit()
+
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+
+@pytest.mark.anyio
+async def test_retries_unavailable_upstream():
+    resilience = create_resilience(retries=2)
+    upstream = StubUpstream(503, 503, 200)
+
+    response = await send(resilience, upstream)
+
+    assert response.status_code == 200
+    assert len(upstream.requests) == 3
+    assert resilience.statistics().retries == 2
+
+
+@pytest.mark.anyio
+async def test_retries_stop_when_the_budget_is_spent():
+    resilience = create_resilience(
+        retries=2, budget=RetryBudget(ratio=0.0, minimum_per_second=0.0)
+    )
+    upstream = StubUpstream(503, 200)
+
+    response = await send(resilience, upstream)
+
+    assert response.status_code == 503
+    assert len(upstream.requests) == 1
+
+
+@pytest.mark.anyio
+async def test_post_is_not_retried():
+    resilience = create_resilience(retries=2)
+    upstream = StubUpstream(503, 200)
+
+    response = await send(resilience, upstream, "POST")
+
+    assert response.status_code == 503
+    assert len(upstream.requests) == 1
+
+
+@pytest.mark.anyio
+async def test_open_breaker_rejects_requests():
+    resilience = create_resilience(
+        retries=0, breaker_failure_threshold=2, breaker_reset_timeout=60.0
+    )
+    upstream = StubUpstream(500)
+
+    await send(resilience, upstream)
+    await send(resilience, upstream)
+
+    with pytest.raises(CircuitOpenError) as error:
+        await send(resilience, upstream)
+
+    assert len(upstream.requests) == 2
+    assert error.value.retry_after > 0
+    assert resilience.statistics().state == "open"
+    assert resilience.statistics().rejected == 1
+
+
+@pytest.mark.anyio
+async def test_concurrent_gets_are_coalesced():
+    resilience = create_resilience()
+    upstream = StubUpstream(200, delay=0.05)
+    responses = []
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+
+        async def get():
+            request = client.build_request("GET", "https://upstream.test/ip")
+            responses.append(await resilience.send(client, request))
+
+        async with anyio.create_task_group() as tasks:
+            for _ in range(5):
+                tasks.start_soon(get)
+
+    assert len(upstream.requests) == 1
+    assert {response.text for response in responses} == {"1"}
+    assert resilience.statistics().coalesced == 4
+
+
+@pytest.mark.anyio
+async def test_gets_of_different_users_are_not_shared():
+    resilience = create_resilience(cache_ttl=60.0)
+    upstream = StubUpstream(200)
+
+    first = await send(resilience, upstream, headers={"Authorization": "user 1"})
+    second = await send(resilience, upstream, headers={"Authorization": "user 2"})
+
+    assert (first.text, second.text) == ("1", "2")
+
+
+@pytest.mark.anyio
+async def test_successful_gets_are_cached():
+    resilience = create_resilience(cache_ttl=60.0)
+    upstream = StubUpstream(200)
+
+    first = await send(resilience, upstream)
+    second = await send(resilience, upstream)
+
+    assert first is second
+    assert len(upstream.requests) == 1
+    assert resilience.statistics().cache_hits == 1
+
+
+def test_sync_requests_are_retried():
+    resilience = create_resilience(retries=1)
+    status_codes = iter([504, 200])
+    transport = httpx.MockTransport(lambda request: httpx.Response(next(status_codes)))
+
+    with httpx.Client(transport=transport) as client:
+        request = client.build_request("GET", "https://upstream.test/ip")
+        response = resilience.send_sync(client, request)
+
+    assert response.status_code == 200
+    assert resilience.statistics().retries == 1
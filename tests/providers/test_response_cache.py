@@ -0,0 +1,109 @@
+import pytest
+from starlette.responses import Response
+from starlette.testclient import TestClient
+
+from playground.providers.response_cache import (
+    ResponseCache,
+    CachePolicy,
+    get_response_cache,
+)
+
+
+@pytest.mark.apitest
+def test_etag_and_not_modified(client: TestClient):
+    response = client.get("/pagination/paginated")
+    etag = response.headers["etag"]
+
+    response = client.get("/pagination/paginated", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert get_response_cache().statistics().hits == 1
+
+
+@pytest.mark.apitest
+@pytest.mark.parametrize("path", ["/pagination/unpaginated", "/openapi.json"])
+def test_compressed_immutable_responses_are_not_modified(client: TestClient, path):
+    gzip = {"Accept-Encoding": "gzip"}
+    etag = client.get(path, headers=gzip).headers["etag"]
+
+    response = client.get(path, headers={**gzip, "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+@pytest.mark.apitest
+def test_cache_hits_are_compressed(client: TestClient):
+    params = {"page_size": 500}
+    plain = client.get(
+        "/pagination/paginated", params=params, headers={"Accept-Encoding": ""}
+    )
+    response = client.get(
+        "/pagination/paginated", params=params, headers={"Accept-Encoding": "gzip"}
+    )
+
+    assert "content-encoding" not in plain.headers
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == plain.headers["etag"]
+    assert response.json() == plain.json()
+    assert get_response_cache().statistics().hits == 1
+
+
+@pytest.mark.apitest
+def test_query_params_are_normalized(client: TestClient):
+    client.get("/pagination/paginated", params=[("page", 1), ("page_size", 5)])
+    client.get("/pagination/paginated", params=[("page_size", 5), ("page", 1)])
+
+    statistics = get_response_cache().statistics()
+
+    assert statistics.entries == 1
+    assert statistics.hits == 1
+
+
+@pytest.mark.apitest
+def test_creating_comments_invalidates(client: TestClient):
+    assert len(client.get("/timeranged/").json()) == 0
+
+    client.post("/timeranged/create", json={"comment": "A new comment"})
+
+    assert len(client.get("/timeranged/").json()) == 1
+
+
+def test_evicts_least_recently_used_when_full():
+    cache = ResponseCache(max_size=10, ttl=60)
+    policy = CachePolicy()
+
+    cache.store(("a", (), ""), Response(b"12345"), policy)
+    cache.store(("b", (), ""), Response(b"12345"), policy)
+    cache.get(("a", (), ""))
+    cache.store(("c", (), ""), Response(b"12345"), policy)
+
+    assert list(cache.entries) == [("a", (), ""), ("c", (), "")]
+    assert cache.size == 10
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(max_size=100, ttl=60)
+
+    cache.store(("a", (), ""), Response(b"1"), CachePolicy(ttl=0))
+
+    assert cache.get(("a", (), "")) is None
+    assert cache.size == 0
+
+
+def test_responses_computed_before_an_invalidation_are_not_stored():
+    cache = ResponseCache(max_size=100, ttl=60)
+    policy = CachePolicy(tags=["comments"])
+    generation = cache.get_generation(policy.tags)
+
+    # A write lands while the response is computed.
+    cache.invalidate("comments")
+
+    assert cache.store(("a", (), ""), Response(b"stale"), policy, generation) is None
+    assert cache.get(("a", (), "")) is None
+
+    generation = cache.get_generation(policy.tags)
+
+    assert cache.store(("a", (), ""), Response(b"fresh"), policy, generation)
+    assert cache.get(("a", (), "")).body == b"fresh"
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import time
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI
+
+from playground.providers import response_cache
+from playground.providers.response_cache import (
+    CachedRoute,
+    cache_response,
+    get_response_cache,
+    invalidate_responses,
+)
+from playground.providers.shared_store import (
+    MemoryStore,
+    SharedStore,
+    SharedStoreError,
+    StoreServer,
+)
+
+
+@pytest.fixture
+async def store():
+    path = os.path.join(tempfile.mkdtemp(), "store.sock")
+    server = StoreServer(path, MemoryStore(1024))
+    await server.start()
+    client = SharedStore(path, timeout=1.0)
+
+    yield client
+
+    await client.close()
+    await server.stop()
+
+
+def test_values_expire_and_are_evicted():
+    store = MemoryStore(max_size=10)
+    store.set("expired", b"1", ttl=0)
+    store.set("a", b"12345")
+    store.set("b", b"12345")
+
+    assert store.get("expired") is None
+    assert store.get("a") == b"12345"
+
+    store.set("c", b"12345")
+
+    assert store.get("b") is None
+    assert store.scan("") == {"a": b"12345", "c": b"12345"}
+
+
+def test_counters_keep_the_ttl_of_their_window():
+    store = MemoryStore(max_size=1024)
+
+    assert store.incr("window", ttl=60) == 1
+    assert store.incr("window", 2) == 3
+    assert store.entries["window"][1] > time.monotonic()
+
+
+async def test_commands_over_the_socket(store: SharedStore):
+    await store.set("key", {"nested": [1, 2]})
+
+    assert await store.get("key") == {"nested": [1, 2]}
+    assert await store.get_many(["key", "missing"]) == [{"nested": [1, 2]}, None]
+    assert await store.incr("counter", 5) == 5
+    assert await store.scan("coun") == {"counter": 5}
+    assert await store.delete("key")
+
+    with pytest.raises(SharedStoreError):
+        await store.call("evict_expired")
+
+
+async def test_unreachable_store_raises():
+    store = SharedStore(os.path.join(tempfile.mkdtemp(), "missing.sock"), 0.1)
+
+    with pytest.raises(SharedStoreError):
+        await store.get("key")
+
+
+async def test_workers_share_cached_responses(store: SharedStore, monkeypatch):
+    monkeypatch.setattr(response_cache, "get_shared_store", lambda: store)
+    calls = []
+    router = APIRouter(route_class=CachedRoute)
+
+    @router.get("/")
+    @cache_response(tags=["shared"])
+    async def get_cached():
+        calls.append(None)
+        return len(calls)
+
+    app = FastAPI()
+    app.include_router(router)
+    cache = get_response_cache()
+    cache.clear()
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        assert (await client.get("/")).json() == 1
+
+        # Another worker has an empty cache of its own, but finds the response in the store.
+        cache.clear()
+        assert (await client.get("/")).json() == 1
+        assert cache.statistics().shared_hits == 1
+
+        # Invalidating bumps the generation of the tag, which every worker reads.
+        cache.clear()
+        await store.incr(response_cache.tag_key("shared"))
+        assert (await client.get("/")).json() == 2
+
+        await invalidate_responses("shared")
+        assert (await client.get("/")).json() == 3
@@ -0,0 +1,112 @@
+import time
+
+import pytest
+from jose import jwt
+
+from playground.providers.token_verifier import TokenVerificationError, TokenVerifier
+
+KEY = {
+    "kty": "oct",
+    "kid": "test",
+    "k": "cGxheWdyb3VuZC10b2tlbi12ZXJpZmllci10ZXN0LWtleQ",
+}
+JWKS = {"keys": [KEY]}
+
+
+def sign(claims: dict, key: dict = KEY, algorithm: str = "HS256") -> str:
+    return jwt.encode(claims, key, algorithm=algorithm, headers={"kid": key["kid"]})
+
+
+def test_verified_claims_are_cached_until_they_expire(monkeypatch):
+    verifier = TokenVerifier(JWKS, ["HS256"], cache_size=10)
+    token = sign({"sub": "user", "exp": int(time.time()) + 60})
+
+    assert verifier.verify(token)["sub"] == "user"
+    assert verifier.verify(token)["sub"] == "user"
+    assert verifier.statistics().hits == 1
+
+    monkeypatch.setattr(
+        time, "time", lambda: float(jwt.get_unverified_claims(token)["exp"] + 1)
+    )
+
+    # An expired entry is verified again, and that catches the expired token.
+    verifier.verify(token)
+
+    assert verifier.statistics().hits == 1
+    assert verifier.statistics().misses == 2
+
+
+def test_cache_is_bounded():
+    verifier = TokenVerifier(JWKS, ["HS256"], cache_size=2)
+    tokens = [sign({"sub": str(i), "exp": int(time.time()) + 60}) for i in range(3)]
+
+    for token in tokens:
+        verifier.verify(token)
+
+    verifier.verify(tokens[0])
+
+    assert verifier.statistics().cached == 2
+    assert verifier.statistics().hits == 0
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "not a token",
+        sign({"sub": "user"}, {**KEY, "k": "b3RoZXIta2V5"}),
+        sign({"sub": "user"}, {**KEY, "kid": "unknown"}),
+        sign({"sub": "user", "exp": int(time.time()) - 60}),
+        # A token may only use the algorithm of its key.
+        sign({"sub": "user"}, algorithm="HS512"),
+    ],
+    ids=["malformed", "bad signature", "unknown key", "expired", "other algorithm"],
+)
+def test_invalid_tokens_are_rejected(token: str):
+    verifier = TokenVerifier(JWKS, ["HS256"], cache_size=10)
+
+    with pytest.raises(TokenVerificationError):
+        verifier.verify(token)
+
+    assert verifier.statistics().rejected == 1
+    assert verifier.statistics().cached == 0
+
+
+def test_rejections_are_cached():
+    verifier = TokenVerifier(JWKS, ["HS256"], cache_size=10)
+    token = sign({"sub": "user"}, {**KEY, "k": "b3RoZXIta2V5"})
+
+    for _ in range(3):
+        with pytest.raises(TokenVerificationError):
+            verifier.verify(token)
+
+    # Only the first attempt checked the signature.
+    assert verifier.statistics().misses == 1
+    assert verifier.statistics().hits == 2
+    assert verifier.statistics().rejected == 3
+    assert verifier.statistics().cached_rejections == 1
+
+
+def test_keys_of_other_algorithms_are_ignored():
+    verifier = TokenVerifier(JWKS, ["RS256"], cache_size=10)
+
+    with pytest.raises(TokenVerificationError):
+        verifier.verify(sign({"sub": "user"}))
+
+
+@pytest.mark.anyio
+async def test_async_verification_caches_like_verify():
+    verifier = TokenVerifier(JWKS, ["HS256"], cache_size=10)
+    token = sign({"sub": "user", "exp": int(time.time()) + 60})
+    forged = sign({"sub": "user"}, {**KEY, "k": "b3RoZXIta2V5"})
+
+    assert verifier.cached(token) is None
+    assert (await verifier.averify(token))["sub"] == "user"
+    assert verifier.cached(token)["sub"] == "user"
+
+    with pytest.raises(TokenVerificationError):
+        await verifier.averify(forged)
+
+    with pytest.raises(TokenVerificationError):
+        verifier.cached(forged)
+
+    assert verifier.statistics().misses == 2
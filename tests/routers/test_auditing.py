@@ -1,6 +1,8 @@
 import pytest
 from starlette.testclient import TestClient
 
+from playground.providers.audit_sink import get_audit_sink
+
 
 @pytest.mark.apitest
 def test_auditing_manual(capfd, client: TestClient):
@@ -9,6 +11,7 @@ def test_auditing_manual(capfd, client: TestClient):
     assert response.status_code == 200
     assert data["hello"] == "world"
 
+    get_audit_sink().flush()
     stdout, stderr = capfd.readouterr()
 
     assert len(stdout.split("\n")) == 5
@@ -21,6 +24,7 @@ def test_auditing_automatic(capfd, client: TestClient):
     assert response.status_code == 200
     assert data["hello"] == "world"
 
+    get_audit_sink().flush()
     stdout, stderr = capfd.readouterr()
 
     assert len(stdout.split("\n")) == 3
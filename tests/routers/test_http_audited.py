@@ -1,6 +1,8 @@
 import pytest
 from starlette.testclient import TestClient
 
+from playground.providers.audit_sink import get_audit_sink
+
 
 @pytest.mark.apitest
 def test_http_audit_success(capfd, client: TestClient, snapshot):
@@ -8,6 +10,7 @@ def test_http_audit_success(capfd, client: TestClient, snapshot):
 
     assert response.status_code == 200
 
+    get_audit_sink().flush()
     stdout, stderr = capfd.readouterr()
 
     assert len(stdout.split("\n")) == 4
@@ -20,6 +23,7 @@ def test_http_audit_fail(capfd, client: TestClient, snapshot):
 
     assert response.status_code == 422
 
+    get_audit_sink().flush()
     stdout, stderr = capfd.readouterr()
     assert len(stdout.split("\n")) == 4
     snapshot.assert_match(stdout, "http_audit_fail")
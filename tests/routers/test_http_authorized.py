@@ -1,10 +1,17 @@
 """
 Test HTTP Auth Header Passthrough. Also include RESPX for HTTP mocking.
 """
+import json
+import time
+
 import httpx
 import pytest
+from jose import jwt
 from starlette.testclient import TestClient
 
+from playground.providers.settings import get_settings
+from playground.providers.token_verifier import get_token_verifier
+
 
 @pytest.mark.parametrize("auth_token", [None, "auth header"])
 def test_async_passthrough(auth_token, client: TestClient):
@@ -52,3 +59,61 @@ def test_respx_mock_with_failure(client: TestClient, respx_mock):
     response = client.get("/auth-passthrough/sync")
 
     assert response.status_code == 400
+
+
+@pytest.fixture
+def verified_tokens(tmp_path, monkeypatch):
+    """
+    Verify tokens against a JWKS with a single HS256 key, and yield a function that signs claims with it.
+    """
+    key = {"kty": "oct", "kid": "test", "k": "cGxheWdyb3VuZC1wYXNzdGhyb3VnaC1rZXk"}
+    jwks_path = tmp_path / "jwks.json"
+    jwks_path.write_text(json.dumps({"keys": [key]}))
+    monkeypatch.setattr(get_settings(), "auth_jwks_path", str(jwks_path))
+    monkeypatch.setattr(get_settings(), "auth_algorithms", ["HS256"])
+    get_token_verifier.cache_clear()
+
+    yield lambda claims: jwt.encode(
+        claims, key, algorithm="HS256", headers={"kid": "test"}
+    )
+
+    get_token_verifier.cache_clear()
+
+
+@pytest.mark.respx(base_url="https://ifconfig.me")
+@pytest.mark.parametrize("path", ["/auth-passthrough/sync", "/auth-passthrough/async"])
+def test_valid_tokens_are_forwarded(
+    path, client: TestClient, respx_mock, verified_tokens
+):
+    respx_mock.get("/ip").mock(return_value=httpx.Response(200, content="127.0.0.1"))
+    token = verified_tokens({"sub": "user", "exp": int(time.time()) + 60})
+
+    for _ in range(2):
+        response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200
+        assert response.json()["auth_token"] == f"Bearer {token}"
+
+    # The rate limiter and the client dependency share the cache, so only the first request verified the signature.
+    assert get_token_verifier().statistics().misses == 1
+
+
+@pytest.mark.respx(base_url="https://ifconfig.me", assert_all_called=False)
+@pytest.mark.parametrize("path", ["/auth-passthrough/sync", "/auth-passthrough/async"])
+@pytest.mark.parametrize(
+    "authorization",
+    [None, "Basic dXNlcjpwYXNz", "Bearer not-a-token"],
+    ids=["missing", "other scheme", "invalid"],
+)
+def test_invalid_tokens_are_rejected_before_the_upstream_call(
+    path, authorization, client: TestClient, respx_mock, verified_tokens
+):
+    upstream = respx_mock.get("/ip").mock(
+        return_value=httpx.Response(200, content="127.0.0.1")
+    )
+
+    response = client.get(path, headers={"Authorization": authorization})
+
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"].startswith("Bearer")
+    assert not upstream.called
@@ -1,7 +1,7 @@
 import pytest
 from starlette.testclient import TestClient
 
-from playground.routers.paginator import PAGINATED_SIZE, PaginatedResult
+from playground.routers.paginator import PAGINATED_SIZE, PaginatedResult, Paginator
 
 
 @pytest.mark.apitest
@@ -81,3 +81,71 @@ def test_paginated_with_largest_page_size(client: TestClient):
     response = client.get("/pagination/paginated", params={"page_size": 10e6})
 
     assert response.status_code == 422
+
+
+@pytest.mark.apitest
+def test_paginated_counts_the_last_partial_page(client: TestClient):
+    response = client.get("/pagination/paginated", params={"page_size": 300, "page": 3})
+
+    data = PaginatedResult.parse_obj(response.json())
+
+    assert data.total == PAGINATED_SIZE
+    assert data.page_count == 4
+    assert len(data.data) == 100
+    assert not data.has_next
+
+
+@pytest.mark.apitest
+def test_generated_has_no_total(client: TestClient):
+    response = client.get("/pagination/generated", params={"page": 1})
+
+    data = PaginatedResult.parse_obj(response.json())
+
+    assert data.total is None
+    assert data.page_count is None
+    assert data.has_next
+    assert data.data[0] == 100
+
+
+def test_paginator_consumes_generators_lazily():
+    consumed = []
+
+    def numbers():
+        for number in range(1000):
+            consumed.append(number)
+            yield number
+
+    result = Paginator(page=1, page_size=10)(numbers())
+
+    assert result.data == list(range(10, 20))
+    assert len(consumed) == 21
+
+
+def test_paginator_with_sized_iterable():
+    result = Paginator(page=0, page_size=2)({1, 2, 3})
+
+    assert result.total == 3
+    assert result.has_next
+    assert len(result.data) == 2
+
+
+@pytest.mark.apitest
+def test_dataset_page(client: TestClient):
+    response = client.get(
+        "/pagination/dataset", params={"page": 2, "page_size": 10, "sort": "value"}
+    )
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["page"] == 2
+    assert data["total"] == data["page_count"] * 10
+    assert set(data["data"]) == {"id", "value", "bucket"}
+    assert data["data"]["value"] == sorted(data["data"]["value"])
+
+
+@pytest.mark.apitest
+def test_dataset_page_with_unindexed_sort(client: TestClient):
+    response = client.get("/pagination/dataset", params={"sort": "bucket"})
+
+    assert response.status_code == 400
@@ -1,11 +1,29 @@
+import io
+import time
 from datetime import datetime
+from unittest.mock import ANY
 
+import msgpack
+import orjson
 import pytest
 from hypothesis import given, strategies as st
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette.testclient import TestClient
 
-from playground.routers.time_range import TimeRangedModel, ModelCreateSerializer
+from playground.providers.response_cache import get_response_cache
+from playground.routers.paginator import get_count_cache
+from playground.routers.time_range import (
+    TimeRangedModel,
+    ModelCreateSerializer,
+    compact_rollups,
+    encode_cursor,
+    get_comment_bus,
+    get_comment_cache,
+    get_live_comments,
+    to_match_query,
+)
+from playground.providers.settings import get_settings
 
 
 @pytest.fixture(autouse=True)
@@ -28,6 +46,24 @@ def test_get_comments_works(client: TestClient):
     assert len(data) == 1
 
 
+@pytest.mark.apitest
+def test_new_comments_only_evict_queries_that_cover_them(client: TestClient):
+    past = {"time_to": datetime(2021, 1, 1)}
+    recent = {"time_from": datetime(2021, 1, 1)}
+    cache = get_comment_cache()
+
+    assert len(client.get("/timeranged/", params=past).json()) == 1
+    assert len(client.get("/timeranged/", params=recent).json()) == 0
+    assert cache.statistics().entries == 2
+
+    client.post("/timeranged/create", json={"comment": "A new comment"})
+
+    assert cache.statistics().entries == 1
+    assert len(client.get("/timeranged/", params=past).json()) == 1
+    assert len(client.get("/timeranged/", params=recent).json()) == 1
+    assert cache.statistics().hits == 1
+
+
 @pytest.mark.apitest
 def test_comments_exclude_with_time_from(client: TestClient):
     response = client.get("/timeranged/", params={"time_from": datetime.now()})
@@ -110,3 +146,404 @@ def test_create_new_item(client: TestClient):
         assert data["comment"] == instance.comment
 
     inner()
+
+
+@pytest.mark.apitest
+async def test_keyset_walks_all_pages(client: TestClient, async_session: AsyncSession):
+    for day in range(1, 8):
+        async_session.add(
+            TimeRangedModel(
+                comment=f"Comment {day}", date_created=datetime(2021, 1, day)
+            )
+        )
+    await async_session.commit()
+
+    seen = []
+    cursor = None
+
+    while True:
+        response = client.get(
+            "/timeranged/keyset", params={"page_size": 3, "cursor": cursor}
+        )
+        assert response.status_code == 200
+
+        data = response.json()
+        seen.extend(item["date_created"] for item in data["data"])
+
+        if not (cursor := data["next_cursor"]):
+            break
+
+    assert len(seen) == 8
+    assert seen == sorted(seen)
+
+
+@pytest.mark.apitest
+async def test_keyset_prev_cursor_returns_previous_page(
+    client: TestClient, async_session: AsyncSession
+):
+    for day in range(1, 6):
+        async_session.add(
+            TimeRangedModel(
+                comment=f"Comment {day}", date_created=datetime(2021, 1, day)
+            )
+        )
+    await async_session.commit()
+
+    first = client.get("/timeranged/keyset", params={"page_size": 2}).json()
+    second = client.get(
+        "/timeranged/keyset", params={"page_size": 2, "cursor": first["next_cursor"]}
+    ).json()
+    back = client.get(
+        "/timeranged/keyset", params={"page_size": 2, "cursor": second["prev_cursor"]}
+    ).json()
+
+    assert first["prev_cursor"] is None
+    assert back["data"] == first["data"]
+
+
+@pytest.mark.apitest
+def test_keyset_rejects_tampered_cursor(client: TestClient):
+    response = client.get("/timeranged/keyset", params={"page_size": 1})
+    cursor = response.json()["next_cursor"] or "e30.AAAA"
+
+    response = client.get("/timeranged/keyset", params={"cursor": cursor[:-2] + "xx"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.apitest
+@pytest.mark.parametrize(
+    "path,values",
+    [
+        ("/timeranged/keyset", ()),
+        ("/timeranged/keyset", ("2021-01-01T00:00:00",)),
+        ("/timeranged/keyset", ("not a date", 1)),
+        ("/timeranged/keyset", (20210101, 1)),
+        ("/timeranged/keyset", ("2021-01-01T00:00:00", "1")),
+        ("/timeranged/keyset", ("2021-01-01T00:00:00", True)),
+        ("/timeranged/search", ([1], 1)),
+    ],
+)
+def test_keyset_rejects_forged_cursor(client: TestClient, path: str, values: tuple):
+    # The signing secret has a public default, so a signed cursor can still hold anything.
+    cursor = encode_cursor(values, "next")
+
+    response = client.get(path, params={"q": "comment", "cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid pagination cursor"}
+
+
+@pytest.mark.apitest
+async def test_paginated_comments_have_total(
+    client: TestClient, async_session: AsyncSession
+):
+    get_count_cache().clear()
+
+    response = client.get("/timeranged/paginated")
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["total"] == 1
+    assert data["page_count"] == 1
+
+    # The count is cached, new rows only show up in the total once it expires.
+    async_session.add(
+        TimeRangedModel(comment="Another one", date_created=datetime(2021, 1, 1))
+    )
+    await async_session.commit()
+
+    data = client.get("/timeranged/paginated").json()
+
+    assert data["total"] == 1
+    assert len(data["data"]) == 2
+
+
+@pytest.mark.apitest
+@pytest.mark.parametrize(
+    "content_type,encode",
+    [
+        ("application/json", orjson.dumps),
+        (
+            "application/x-ndjson",
+            lambda items: b"\n".join(orjson.dumps(item) for item in items),
+        ),
+        ("application/msgpack", msgpack.packb),
+    ],
+)
+def test_create_bulk(client: TestClient, content_type, encode):
+    items = [{"comment": f"Bulk comment {i}"} for i in range(25)]
+
+    response = client.post(
+        "/timeranged/bulk",
+        params={"chunk_size": 10},
+        data=encode(items),
+        headers={"Content-Type": content_type},
+    )
+
+    assert response.status_code == 200
+
+    data = response.json()
+
+    assert data["inserted"] == 25
+    assert [chunk["rows"] for chunk in data["chunks"]] == [10, 10, 5]
+    assert len(client.get("/timeranged/", params={"page_size": 100}).json()) == 26
+
+
+@pytest.mark.apitest
+def test_create_bulk_reports_invalid_rows(client: TestClient):
+    items = [{"comment": "valid"}, {"comment": "no"}]
+
+    response = client.post("/timeranged/bulk", json=items)
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 1, "comment"]
+
+
+@pytest.mark.apitest
+def test_export_ndjson(client: TestClient):
+    client.post("/timeranged/")
+
+    response = client.get("/timeranged/export", params={"fetch_size": 3})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    rows = [orjson.loads(line) for line in response.content.splitlines()]
+
+    assert len(rows) == 11
+    assert set(rows[0]) == {"id", "comment", "date_created"}
+
+
+@pytest.mark.apitest
+def test_export_csv_with_time_filter(client: TestClient):
+    client.post("/timeranged/")
+
+    response = client.get(
+        "/timeranged/export",
+        params={"format": "csv", "time_to": datetime(year=2021, month=1, day=1)},
+    )
+
+    lines = response.text.splitlines()
+
+    assert lines[0] == "id,comment,date_created"
+    assert len(lines) == 2
+
+
+@pytest.mark.apitest
+def test_export_msgpack(client: TestClient):
+    response = client.get("/timeranged/export", params={"format": "msgpack"})
+
+    rows = list(msgpack.Unpacker(io.BytesIO(response.content)))
+
+    assert len(rows) == 1
+    assert rows[0]["comment"].startswith("Hey uhh guys")
+
+
+async def add_comments(async_session: AsyncSession, *dates: datetime):
+    for date in dates:
+        async_session.add(TimeRangedModel(comment="Histogram", date_created=date))
+
+    await async_session.commit()
+
+
+@pytest.mark.apitest
+async def test_histogram_counts_per_bucket(
+    client: TestClient, async_session: AsyncSession
+):
+    await add_comments(
+        async_session,
+        datetime(2020, 3, 11, 10, 15),
+        datetime(2020, 3, 11, 10, 45),
+        datetime(2020, 3, 11, 11, 5),
+    )
+
+    hours = client.get("/timeranged/histogram", params={"bucket": "hour"}).json()
+    days = client.get("/timeranged/histogram", params={"bucket": "day"}).json()
+
+    assert hours == [
+        {"start": "2020-03-11T00:00:00", "count": 1},
+        {"start": "2020-03-11T10:00:00", "count": 2},
+        {"start": "2020-03-11T11:00:00", "count": 1},
+    ]
+    assert days == [{"start": "2020-03-11T00:00:00", "count": 4}]
+
+
+@pytest.mark.apitest
+async def test_histogram_is_the_same_after_compaction(
+    client: TestClient, async_session: AsyncSession
+):
+    await add_comments(async_session, datetime(2020, 3, 11, 10, 15, 30))
+    params = {"bucket": "minute", "time_from": str(datetime(2020, 3, 11, 10))}
+    before = client.get("/timeranged/histogram", params=params).json()
+
+    assert await compact_rollups(async_session) == 2
+    assert await compact_rollups(async_session) == 0
+
+    # Comments added straight to the database do not invalidate the response cache.
+    get_response_cache().clear()
+    await add_comments(async_session, datetime(2020, 3, 11, 10, 15, 45))
+    after = client.get("/timeranged/histogram", params=params).json()
+
+    assert before == [{"start": "2020-03-11T10:15:00", "count": 1}]
+    assert after == [{"start": "2020-03-11T10:15:00", "count": 2}]
+
+
+@pytest.mark.apitest
+def test_histogram_rejects_unknown_buckets(client: TestClient):
+    response = client.get("/timeranged/histogram", params={"bucket": "week"})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.apitest
+async def test_search_ranks_and_highlights_matches(
+    client: TestClient, async_session: AsyncSession
+):
+    async_session.add_all(
+        [
+            TimeRangedModel(
+                comment="Watch the watch", date_created=datetime(2021, 1, 1)
+            ),
+            TimeRangedModel(
+                comment="Nothing to see", date_created=datetime(2021, 1, 2)
+            ),
+        ]
+    )
+    await async_session.commit()
+
+    page = client.get("/timeranged/search", params={"q": "watch"}).json()
+
+    assert [row["comment"] for row in page["data"]] == [
+        "Watch the watch",
+        "Hey uhh guys, watch out for this Covid19 thing ok?",
+    ]
+    assert page["data"][0]["snippet"] == "<mark>Watch</mark> the <mark>watch</mark>"
+    assert page["data"][0]["rank"] < page["data"][1]["rank"]
+
+    filtered = client.get(
+        "/timeranged/search",
+        params={"q": "watch", "time_to": datetime(2020, 12, 31)},
+    ).json()
+
+    assert [row["id"] for row in filtered["data"]] == [page["data"][1]["id"]]
+
+
+@pytest.mark.apitest
+async def test_search_pages_through_results(
+    client: TestClient, async_session: AsyncSession
+):
+    async_session.add_all(
+        TimeRangedModel(comment=f"Searchable {i}", date_created=datetime(2021, 1, 1))
+        for i in range(5)
+    )
+    await async_session.commit()
+
+    params = {"q": "search*", "page_size": 2}
+    seen = []
+    cursor = None
+
+    while True:
+        page = client.get("/timeranged/search", params={**params, "cursor": cursor})
+        page = page.json()
+        seen += [row["id"] for row in page["data"]]
+        cursor = page["next_cursor"]
+
+        if cursor is None:
+            break
+
+    assert len(seen) == len(set(seen)) == 5
+
+
+@pytest.mark.apitest
+async def test_search_follows_updates_and_deletes(
+    client: TestClient, async_session: AsyncSession
+):
+    comment = (await async_session.exec(select(TimeRangedModel))).one()
+    comment.comment = "Renamed"
+    await async_session.commit()
+    get_response_cache().clear()
+
+    assert (
+        client.get("/timeranged/search", params={"q": "covid19"}).json()["data"] == []
+    )
+    assert (
+        len(client.get("/timeranged/search", params={"q": "renamed"}).json()["data"])
+        == 1
+    )
+
+    await async_session.delete(comment)
+    await async_session.commit()
+    get_response_cache().clear()
+
+    assert (
+        client.get("/timeranged/search", params={"q": "renamed"}).json()["data"] == []
+    )
+
+
+def test_search_terms_are_quoted():
+    assert to_match_query('covid OR "x  NEAR(y') == '"covid" "OR" """x" "NEAR(y"'
+    assert to_match_query("cov* *") == '"cov"*'
+
+
+def test_search_without_terms_is_rejected(client: TestClient):
+    assert client.get("/timeranged/search", params={"q": "***"}).status_code == 400
+    assert client.get("/timeranged/search", params={"q": ")("}).status_code == 200
+
+
+@pytest.mark.apitest
+def test_live_websocket_resumes_and_follows_new_comments(client: TestClient):
+    with client.websocket_connect("/timeranged/live?last_event_id=0") as websocket:
+        assert websocket.receive_json()["comment"].startswith("Hey uhh guys")
+
+        client.post("/timeranged/create", json={"comment": "A live comment"})
+
+        assert websocket.receive_json() == {
+            "id": 2,
+            "comment": "A live comment",
+            "date_created": ANY,
+        }
+
+        client.post("/timeranged/")
+
+        assert [websocket.receive_json()["id"] for _ in range(10)] == list(range(3, 13))
+
+    # The server notices the disconnect on its own event loop.
+    deadline = time.monotonic() + 5
+
+    while get_comment_bus().statistics().subscribers and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert get_comment_bus().statistics().subscribers == 0
+
+
+async def test_live_events_resume_after_the_last_event_id(
+    async_session: AsyncSession, monkeypatch
+):
+    monkeypatch.setattr(get_settings(), "timeranged_live_buffer_size", 2)
+    response = await get_live_comments(last_event_id=0, session=async_session)
+    events = response.body_iterator
+
+    assert await events.__anext__() == b"retry: 1000\n\n"
+    assert (await events.__anext__()).startswith(b"id: 1\nevent: comment\ndata: {")
+
+    bus = get_comment_bus()
+    bus.publish([{"id": 1, "comment": "Resumed already", "date_created": ""}])
+    bus.publish([{"id": 2, "comment": "New", "date_created": ""}])
+
+    assert await events.__anext__() == (
+        b'id: 2\nevent: comment\ndata: {"id":2,"comment":"New","date_created":""}\n\n'
+    )
+
+    # The buffer holds two batches, so the third one disconnects the subscriber.
+    for i in range(3, 6):
+        bus.publish([{"id": i, "comment": "Too fast", "date_created": ""}])
+
+    assert await events.__anext__() == (
+        b'id: 3\nevent: comment\ndata: {"id":3,"comment":"Too fast","date_created":""}\n\n'
+    )
+    assert (await events.__anext__()).startswith(b"id: 4\n")
+    assert await events.__anext__() == (
+        b'event: error\ndata: {"detail":"Too slow to keep up"}\n\n'
+    )
+    assert bus.statistics().subscribers == 0
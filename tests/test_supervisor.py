@@ -0,0 +1,83 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from playground.providers.shared_store import get_shared_store
+
+# The app the workers of the test serve. Spawned workers import it from this module.
+app = FastAPI()
+
+
+@app.get("/worker")
+def get_worker():
+    return os.getpid()
+
+
+@app.get("/count")
+async def count():
+    return await get_shared_store().incr("count")
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_workers_restart_without_dropping_requests():
+    port = get_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    supervisor = subprocess.Popen(
+        [sys.executable, "-m", "playground", "--app", "tests.test_supervisor:app"]
+        + ["--workers", "2", "--port", str(port), "--graceful-timeout", "5"],
+        env={**os.environ, "SHARED_STORE_PATH": ""},
+        cwd=os.path.dirname(os.path.dirname(__file__)),
+    )
+
+    def get(path: str) -> httpx.Response:
+        # A new connection every time, so requests spread over the workers.
+        return httpx.get(base_url + path)
+
+    def is_up() -> bool:
+        try:
+            return get("/worker").status_code == 200
+        except httpx.TransportError:
+            return False
+
+    try:
+        wait_until(is_up)
+        old_workers = {get("/worker").json() for _ in range(20)}
+
+        # Counters are shared by all workers.
+        assert [get("/count").json() for _ in range(10)] == list(range(1, 11))
+
+        supervisor.send_signal(signal.SIGHUP)
+        seen = set()
+
+        def restarted() -> bool:
+            response = get("/worker")
+            assert response.status_code == 200
+            seen.add(response.json())
+            return len(seen - old_workers) >= 2
+
+        wait_until(restarted)
+
+        # The store outlives the workers.
+        assert get("/count").json() == 11
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        assert supervisor.wait(30) == 0